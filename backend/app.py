@@ -1,17 +1,28 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 import logging
-from langchain_community.agent_toolkits.sql.base import create_sql_agent
-from langchain_community.utilities import SQLDatabase
-from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
-from langchain.agents.agent_types import AgentType
-from langchain_groq import ChatGroq
-from sqlalchemy import create_engine, inspect, text
+import threading
+import time
+import queue
+import contextvars
+import importlib.util
 import json
-from semantic_search import SchemaSemanticSearch, get_schema_embeddings
-import numpy as np
+from embeddings import get_embedder
+from database import iter_query_chunks
+from datasources import DatasourceRegistry, UnknownDatasourceError, load_datasource_configs
+from value_index import format_values
+from index_advisor import get_workload_store
+from guardrails import QueryGuard, QueryGuardError, QueryRejectedError, check_read_only, guarded, is_read_only
+from results import (EXPORT_FORMATS, EXPORT_TIMEOUT, RESULT_PAGE_SIZE, InvalidCursorError, column_types, encode_value,
+                     fetch_page, iter_arrow, iter_csv)
+from query_cache import QueryCache, SemanticQueryCache
+from sql_generation import (LLMCallCounter, AgentStepStreamer, SQLGenerationError, answer_single_shot,
+                            callback_handler, generate_single_shot_sql)
+from metrics import (ANSWERS, REQUEST_SECONDS, REQUESTS, STARTUP, process_memory, render_metrics, sampled, stage,
+                     tracing)
+from batch import BATCH_MAX_QUESTIONS, LLMLimiter, is_rate_limit_error, parse_max_workers, run_batch
 import re
 
 # Configure logging
@@ -22,7 +33,21 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=['ETag'])
+
+@app.before_request
+def start_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    # For streamed responses this is the time to the first byte
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint, method=request.method)
+        REQUESTS.inc(endpoint=endpoint, method=request.method, status=str(response.status_code))
+    return response
 
 # Configuration
 GROQ_API_KEY = os.getenv('GROQ_API_KEY')
@@ -32,55 +57,137 @@ if not GROQ_API_KEY:
 
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///student.db')
 SCHEMA_INDEX_PATH = os.getenv('SCHEMA_INDEX_PATH', 'schema_index')
+# 'single_shot' asks for SQL in one LLM call and falls back to the agent; 'agent' always uses the agent
+QUERY_MODE = os.getenv('QUERY_MODE', 'single_shot')
+QUERY_MAX_ROWS = int(os.getenv('QUERY_MAX_ROWS', 1000))
+STREAM_CHUNK_SIZE = int(os.getenv('STREAM_CHUNK_SIZE', 500))
+TRACE_RESPONSES = os.getenv('TRACE_RESPONSES', 'false').lower() == 'true'
+SCHEMA_INDEX_OPTIONS = {
+    'index_type': os.getenv('SCHEMA_INDEX_TYPE', 'flat'),
+    'nlist': int(os.getenv('SCHEMA_INDEX_NLIST', 100)),
+    'nprobe': int(os.getenv('SCHEMA_INDEX_NPROBE', 8)),
+    'hnsw_m': int(os.getenv('SCHEMA_INDEX_HNSW_M', 32)),
+    'ef_search': int(os.getenv('SCHEMA_INDEX_EF_SEARCH', 64)),
+    'two_stage': os.getenv('SCHEMA_INDEX_TWO_STAGE', 'false').lower() == 'true',
+    'table_candidates': int(os.getenv('SCHEMA_INDEX_TABLE_CANDIDATES', 5)),
+}
 
-# Initialize database connection
-def get_db():
+# Per-database pooled engines, schema catalogs and indexes; DATABASE_URL and SCHEMA_INDEX_PATH back the
+# default datasource, others come from DATASOURCES or DATASOURCES_FILE (DATASOURCE_MAX_ACTIVE resident at once)
+datasources = DatasourceRegistry(load_datasource_configs(DATABASE_URL, SCHEMA_INDEX_PATH),
+                                 index_options=SCHEMA_INDEX_OPTIONS)
+
+# NL->SQL response cache (QUERY_CACHE_SIZE, QUERY_CACHE_TTL, optional QUERY_CACHE_PATH)
+query_cache = QueryCache() if os.getenv('QUERY_CACHE_ENABLED', 'true').lower() == 'true' else None
+
+# Caps concurrent LLM work across all requests (LLM_MAX_CONCURRENCY) and backs off on rate limits
+llm_limiter = LLMLimiter()
+
+# Exports may run much longer than interactive queries
+export_guard = QueryGuard(timeout=EXPORT_TIMEOUT)
+
+# Near-duplicate question cache whose SQL is re-run live (SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_MAX_ROWS = int(os.getenv('SEMANTIC_CACHE_MAX_ROWS', 1000))
+_semantic_query_cache = None
+
+def get_semantic_query_cache():
+    global _semantic_query_cache
+    if SEMANTIC_CACHE_ENABLED and _semantic_query_cache is None:
+        _semantic_query_cache = SemanticQueryCache(get_embedder())
+    return _semantic_query_cache
+
+def find_relevant_values(datasource, question, schema_info):
+    """Stored column values the question mentions, spelled as in the database."""
+    value_index = datasource.get_value_index()
+    if value_index is None:
+        return []
     try:
-        engine = create_engine(DATABASE_URL)
-        # Test the connection
-        with engine.connect() as conn:
-            conn.execute(text("SELECT 1"))
-        logger.info("Database connection successful")
-        db = SQLDatabase(engine)
-        return db, engine
+        value_index.maybe_refresh(schema_info)
+        return value_index.lookup(question)
     except Exception as e:
-        logger.error(f"Database connection error: {e}")
-        return None, None
+        logger.warning(f"Value lookup failed: {e}")
+        return []
 
-# Initialize LLM
-def get_llm():
+
+def request_datasource():
+    """
+    The datasource a request names with ?datasource=, an X-Datasource header
+    or a JSON "datasource" field, held until the request (or its stream) ends.
+    """
+    held = g.setdefault('datasources', {})
+    data = request.get_json(silent=True) if request.is_json else None
+    name = (request.args.get('datasource') or request.headers.get('X-Datasource')
+            or (data.get('datasource') if isinstance(data, dict) else None))
+    if name not in held:
+        held[name] = datasources.get(name, acquire=True)
+    return held[name]
+
+def _release(held):
+    for datasource in held.values():
+        datasource.release()
+
+@app.after_request
+def hold_datasources_while_streaming(response):
+    # Teardown can run before a streamed body is iterated, so a stream releases its datasources when it is closed
+    if response.is_streamed and g.get('datasources'):
+        held = g.pop('datasources')
+        response.call_on_close(lambda: _release(held))
+    return response
+
+@app.teardown_request
+def release_datasources(error=None):
+    _release(g.pop('datasources', {}))
+
+# Initialize database connection
+def get_engine(datasource=None):
+    """The datasource's guarded engine; all that single-shot answers and result paging need."""
+    datasource = datasource or datasources.get()
     try:
-        llm = ChatGroq(
-            groq_api_key=GROQ_API_KEY,
-            model_name="Llama3-8b-8192",
-            temperature=0.2
-        )
-        logger.info("LLM initialization successful")
-        return llm
+        with stage('db_connect'):
+            datasource.get_materialized_views()
+            return datasource.pool_manager.guarded_engine
     except Exception as e:
-        logger.error(f"LLM initialization error: {e}")
+        logger.error(f"Database connection error: {e}")
         return None
 
-# Initialize semantic search
-def get_semantic_search(schema_info):
+def get_db(datasource=None):
+    """The SQLDatabase wrapper the agent works on, and the guarded engine."""
+    datasource = datasource or datasources.get()
+    engine = get_engine(datasource)
+    if engine is None:
+        return None, None
     try:
-        # Try to load existing index
-        if os.path.exists(SCHEMA_INDEX_PATH):
-            return SchemaSemanticSearch.load(SCHEMA_INDEX_PATH)
-        
-        # Create new index
-        semantic_search = SchemaSemanticSearch()
-        embeddings = get_schema_embeddings(schema_info)
-        
-        for table_name, column_name, data_type, vector in embeddings:
-            semantic_search.add_schema_item(table_name, column_name, data_type, vector)
-        
-        # Save the index
-        semantic_search.save(SCHEMA_INDEX_PATH)
-        return semantic_search
+        with stage('db_connect'):
+            db = datasource.pool_manager.get_sql_database()
+        return db, engine
     except Exception as e:
-        logger.error(f"Semantic search initialization error: {e}")
-        return None
+        logger.error(f"Database connection error: {e}")
+        return None, None
+
+# Initialize LLM
+_llm = None
+_llm_lock = threading.Lock()
+
+def get_llm():
+    """One shared ChatGroq client per process; langchain_groq is imported on first use."""
+    global _llm
+    if _llm is not None:
+        return _llm
+    with _llm_lock:
+        if _llm is None:
+            try:
+                from langchain_groq import ChatGroq
+                _llm = ChatGroq(
+                    groq_api_key=GROQ_API_KEY,
+                    model_name="Llama3-8b-8192",
+                    temperature=0.2
+                )
+                logger.info("LLM initialization successful")
+            except Exception as e:
+                logger.error(f"LLM initialization error: {e}")
+                return None
+    return _llm
 
 @app.route('/', methods=['GET'])
 def root():
@@ -90,13 +197,25 @@ def root():
             "/api/health": "Health check endpoint",
             "/api/schema": "Get database schema",
             "/api/query": "Process natural language queries",
-            "/api/semantic-search": "Search schema semantically"
+            "/api/query/batch": "Process a list of queries concurrently (streams NDJSON)",
+            "/api/query/stream": "Process a query, streaming progress and rows as Server-Sent Events",
+            "/api/results": "Execute SQL and return a page of typed rows with a next-page cursor",
+            "/api/results/export": "Stream a query result as CSV or Arrow IPC",
+            "/api/metrics": "Prometheus metrics: stage latencies, LLM usage, cache hit rates",
+            "/api/semantic-search": "Search schema semantically",
+            "/api/value-search": "Find stored column values mentioned in a question",
+            "/api/datasources": "List configured datasources, or evict one from memory",
+            "/api/pool-stats": "Database connection pool statistics",
+            "/api/materialized": "Materialized view staleness (POST to refresh)",
+            "/api/index-advisor": "Index recommendations from the executed SQL workload (POST to create them)",
+            "/api/cache": "Query cache statistics (DELETE to clear)"
         }
     })
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
-    db_status = "healthy" if get_db()[0] else "unhealthy"
+    datasource = request_datasource()
+    db_status = "healthy" if get_engine(datasource) and datasource.pool_manager.ping() else "unhealthy"
     llm_status = "healthy" if get_llm() else "unhealthy"
     
     return jsonify({
@@ -104,36 +223,40 @@ def health_check():
         "components": {
             "database": db_status,
             "llm": llm_status
-        }
+        },
+        "datasource": datasource.name,
+        "pool": datasource.pool_manager.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "query_guard": datasource.pool_manager.query_guard.stats(),
+        "process": {"pid": os.getpid(), "startup_seconds": STARTUP, "memory": process_memory()}
     })
 
+@app.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    return jsonify(request_datasource().pool_manager.stats())
+
+@app.route('/api/datasources', methods=['GET', 'DELETE'])
+def list_datasources():
+    """Configured datasources and which are resident; DELETE ?datasource=name evicts one from memory."""
+    if request.method == 'DELETE':
+        name = request.args.get('datasource')
+        if not name:
+            return jsonify({"error": "No datasource provided"}), 400
+        return jsonify({"evicted": datasources.evict(name), **datasources.stats()})
+    return jsonify(datasources.stats())
+
 @app.route('/api/schema', methods=['GET'])
 def get_schema():
-    db, engine = get_db()
-    if not db or not engine:
+    datasource = request_datasource()
+    if not get_engine(datasource):
         return jsonify({"error": "Database connection failed"}), 500
     try:
-        schema_info = {}
-        inspector = inspect(engine)
-        # Get all tables and views
-        tables = inspector.get_table_names()
-        views = inspector.get_view_names()
-        for name in tables + views:
-            is_view = name in views
-            columns = inspector.get_columns(name)
-            schema_info[name] = {
-                "columns": [col["name"] for col in columns],
-                "types": {col["name"]: str(col["type"]) for col in columns},
-                "is_view": is_view
-            }
-            if not is_view:
-                try:
-                    foreign_keys = inspector.get_foreign_keys(name)
-                    if foreign_keys:
-                        schema_info[name]["foreign_keys"] = foreign_keys
-                except Exception as e:
-                    logger.warning(f"Could not get foreign keys for {name}: {e}")
-        return jsonify(schema_info)
+        catalog = datasource.get_schema_catalog()
+        schema_info = catalog.get()
+        response = jsonify(schema_info)
+        response.set_etag(catalog.fingerprint)
+        response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
     except Exception as e:
         logger.error(f"Schema retrieval error: {e}")
         return jsonify({"error": str(e)}), 500
@@ -143,20 +266,17 @@ def semantic_search():
     data = request.json
     if not data or 'query' not in data:
         return jsonify({"error": "No query provided"}), 400
-    
+    datasource = request_datasource()
+
     try:
-        # Get schema info
-        schema_info = get_schema().get_json()
-        
         # Initialize semantic search
-        semantic_search = get_semantic_search(schema_info)
+        semantic_search = datasource.get_semantic_search()
         if not semantic_search:
             return jsonify({"error": "Failed to initialize semantic search"}), 500
         
-        # Generate query vector (placeholder - replace with actual embedding)
-        query_vector = np.random.randn(768).astype(np.float32)
-        query_vector = query_vector / np.linalg.norm(query_vector)
-        
+        # Embed the query with the same embedder as the schema index
+        query_vector = get_embedder().embed([data['query']])[0]
+
         # Search
         results = semantic_search.search(query_vector)
         return jsonify({"results": results})
@@ -164,6 +284,242 @@ def semantic_search():
         logger.error(f"Semantic search error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/value-search', methods=['POST'])
+def value_search():
+    data = request.json
+    if not data or 'query' not in data:
+        return jsonify({"error": "No query provided"}), 400
+    datasource = request_datasource()
+    value_index = datasource.get_value_index()
+    if value_index is None:
+        return jsonify({"enabled": False, "results": []})
+    try:
+        results = find_relevant_values(datasource, data['query'], datasource.get_schema_catalog().get())
+        return jsonify({"enabled": True, "results": results, "stats": value_index.stats()})
+    except Exception as e:
+        logger.error(f"Value search error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def run_agent(llm, db, question, relevant_items, callbacks=None, relevant_values=None):
+    """Answer a question with the SQL ReAct agent and scrape the SQL and answer from its output."""
+    # Imported on first use: the agent toolkit pulls in most of langchain, which single-shot answers never need
+    from langchain_community.agent_toolkits.sql.base import create_sql_agent
+    from langchain_community.agent_toolkits.sql.toolkit import SQLDatabaseToolkit
+    from langchain.agents.agent_types import AgentType
+    relevant_values = relevant_values or []
+    context = "\n".join([
+        f"Table: {item['table_name']}, Column: {item['column_name']}, Type: {item['data_type']}"
+        for item in relevant_items
+    ])
+    enhanced_query = f"{question}\n\nRelevant schema information:\n{context}"
+    if relevant_values:
+        # Saves the agent exploratory SELECT DISTINCT turns to find how these values are spelled
+        enhanced_query += ("\n\nValues mentioned in the question, spelled exactly as stored "
+                           f"(no need to query for them):\n{format_values(relevant_values)}")
+    toolkit = SQLDatabaseToolkit(db=db, llm=llm)
+    agent = create_sql_agent(
+        llm=llm,
+        toolkit=toolkit,
+        verbose=True,
+        agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
+    )
+    counter = callback_handler(LLMCallCounter)
+    try:
+        with stage('agent'):
+            response = agent.invoke({"input": enhanced_query}, config={"callbacks": [counter] + list(callbacks or [])})
+        output = response.get("output", "") or response.get("final_answer", "")
+        sql = ""
+        result = ""
+
+        # Try to extract SQL using regex (looks for lines starting with SELECT/UPDATE/INSERT/DELETE)
+        sql_match = re.search(r"(SELECT|UPDATE|INSERT|DELETE)[^;\n]*", output, re.IGNORECASE)
+        if sql_match:
+            sql = sql_match.group(0).strip()
+
+        # Try to extract result (if present)
+        if "Final Answer:" in output:
+            result = output.split("Final Answer:")[-1].strip()
+        elif "Answer:" in output:
+            result = output.split("Answer:")[-1].strip()
+        else:
+            result = output.strip()
+
+        return {
+            "sql": sql,
+            "result": result,
+            "raw_output": output,
+            "error": response.get("error", None),
+            "relevant_schema": relevant_items,
+            "relevant_values": relevant_values,
+            "llm_calls": counter.calls
+        }
+    except Exception as e:
+        # Let rate limits reach the limiter's backoff instead of being scraped as an answer
+        if is_rate_limit_error(e):
+            raise
+        # Handle output parsing error and extract final answer from the error message
+        error_msg = str(e)
+        logger.warning(f"Agent exception: {error_msg}")
+        sql = ""
+        result = ""
+        sql_match = re.search(r"(SELECT|UPDATE|INSERT|DELETE)[^;\n]*", error_msg, re.IGNORECASE)
+        if sql_match:
+            sql = sql_match.group(0).strip()
+        if "Final Answer:" in error_msg:
+            result = error_msg.split("Final Answer:")[-1].strip().split("\n")[0]
+        elif "Answer:" in error_msg:
+            result = error_msg.split("Answer:")[-1].strip().split("\n")[0]
+        else:
+            result = error_msg
+        return {
+            "sql": sql,
+            "result": result,
+            "raw_output": error_msg,
+            "error": "Output parsing error (handled)",
+            "relevant_schema": relevant_items,
+            "relevant_values": relevant_values,
+            "llm_calls": counter.calls
+        }
+
+def with_agent_rows(engine, response):
+    """Run the agent's final SQL ourselves so the response carries rows, keeping its prose as 'answer'."""
+    if not response["sql"] or not is_read_only(response["sql"]):
+        return response
+    try:
+        rows = fetch_page(engine, response["sql"], QUERY_MAX_ROWS)
+    except Exception as e:
+        logger.warning(f"Could not execute the agent's SQL: {e}")
+        return response
+    return {
+        **response,
+        "answer": response["result"],
+        "result": rows["rows"],
+        "columns": rows["columns"],
+        "column_types": rows["column_types"],
+        "truncated": rows["truncated"],
+        "next_cursor": rows["next_cursor"]
+    }
+
+def answer_question(llm, datasource, engine, question, relevant_items, schema_info, mode=QUERY_MODE,
+                    relevant_values=None):
+    """Single-shot generation first (unless mode is 'agent'), falling back to the ReAct agent."""
+    if mode != 'agent':
+        try:
+            response = answer_single_shot(llm, engine, question, relevant_items, schema_info, QUERY_MAX_ROWS,
+                                          relevant_values)
+            return {**response, "mode": "single_shot"}
+        except SQLGenerationError as e:
+            logger.info(f"Single-shot generation failed, retrying with the agent: {e}")
+            db, _ = get_db(datasource)
+            response = with_agent_rows(engine, run_agent(llm, db, question, relevant_items,
+                                                         relevant_values=relevant_values))
+            return {**response, "mode": "agent_fallback", "llm_calls": response["llm_calls"] + 1}
+    db, _ = get_db(datasource)
+    response = run_agent(llm, db, question, relevant_items, relevant_values=relevant_values)
+    return {**with_agent_rows(engine, response), "mode": "agent"}
+
+def take_snapshot(datasource=None):
+    """Datasource, schema and vector index to share across one request or a whole batch."""
+    datasource = datasource or datasources.get()
+    catalog = datasource.get_schema_catalog()
+    datasource.get_materialized_views().maybe_refresh()
+    index_advisor = datasource.get_index_advisor()
+    if index_advisor is not None:
+        index_advisor.maybe_run()
+    with stage('schema_introspection'):
+        schema_info = catalog.get()
+    with stage('index_load'):
+        semantic_search = datasource.get_semantic_search()
+    return {
+        "datasource": datasource,
+        "schema_info": schema_info,
+        "fingerprint": catalog.fingerprint,
+        "semantic_search": semantic_search
+    }
+
+def answer_source(payload):
+    return payload.get("cache_tier") or payload.get("mode") or ("error" if payload.get("error") else "unknown")
+
+def handle_question(question, use_cache=True, mode=QUERY_MODE, snapshot=None, trace=TRACE_RESPONSES,
+                    datasource=None):
+    """Answer one question, timing each stage; with trace=True the breakdown is attached to the payload."""
+    with tracing() as request_trace:
+        payload, status = answer_with_caches(question, use_cache, mode, snapshot or take_snapshot(datasource))
+    ANSWERS.inc(source=answer_source(payload))
+    if trace:
+        payload = {**payload, "trace": request_trace.to_dict()}
+    return payload, status
+
+def answer_with_caches(question, use_cache=True, mode=QUERY_MODE, snapshot=None):
+    """Answer one question via the exact cache, the semantic cache, then the LLM; returns (payload, status)."""
+    snapshot = snapshot or take_snapshot()
+    datasource = snapshot["datasource"]
+    fingerprint = snapshot["fingerprint"]
+
+    # Identical question against an unchanged schema: replay the stored answer
+    use_cache = query_cache is not None and use_cache
+    if use_cache:
+        try:
+            with stage('cache_lookup'):
+                cached = query_cache.get(question, datasource.url, fingerprint)
+            if cached is not None:
+                return {**cached, "cached": True, "cache_tier": "exact", "llm_calls": 0}, 200
+        except Exception as e:
+            logger.warning(f"Query cache lookup failed: {e}")
+            use_cache = False
+
+    engine = get_engine(datasource)
+    if not engine:
+        return {"error": "Failed to initialize database or LLM"}, 500
+    semantic_search = snapshot["semantic_search"]
+    with stage('embedding'):
+        query_vector = get_embedder().embed([question])[0]
+    with stage('vector_search'):
+        relevant_items = semantic_search.search(query_vector) if semantic_search else []
+    with stage('value_lookup'):
+        relevant_values = find_relevant_values(datasource, question, snapshot["schema_info"])
+
+    # A paraphrase of an answered question: re-run its SQL so the rows are fresh
+    semantic_cache = get_semantic_query_cache() if use_cache else None
+    if semantic_cache is not None:
+        with stage('semantic_cache_lookup'):
+            match = semantic_cache.lookup(question, datasource.url, fingerprint)
+        if match is not None:
+            try:
+                rows = fetch_page(engine, match['sql'], SEMANTIC_CACHE_MAX_ROWS)
+                return {
+                    "sql": match['sql'],
+                    "result": rows["rows"],
+                    "columns": rows["columns"],
+                    "column_types": rows["column_types"],
+                    "truncated": rows["truncated"],
+                    "next_cursor": rows["next_cursor"],
+                    "raw_output": "",
+                    "error": None,
+                    "relevant_schema": relevant_items,
+                    "relevant_values": relevant_values,
+                    "cached": True,
+                    "cache_tier": "semantic",
+                    "llm_calls": 0,
+                    "matched_question": match['question'],
+                    "similarity": match['similarity']
+                }, 200
+            except Exception as e:
+                logger.warning(f"Re-running cached SQL failed, falling back to the agent: {e}")
+
+    llm = get_llm()
+    if not llm:
+        return {"error": "Failed to initialize database or LLM"}, 500
+    with stage('generation'):
+        response = llm_limiter.call(answer_question, llm, datasource, engine, question, relevant_items,
+                                    snapshot["schema_info"], mode, relevant_values)
+    # Only answers that produced SQL are worth replaying; an error (e.g. a parse failure) may not recur
+    if use_cache and response["sql"] and not response.get("error"):
+        query_cache.put(question, datasource.url, fingerprint, response)
+        if semantic_cache is not None and is_read_only(response["sql"]):
+            semantic_cache.add(question, response["sql"], datasource.url, fingerprint)
+    return {**response, "cached": False}, 200
+
 @app.route('/api/query', methods=['POST'])
 def process_query():
     if not request.is_json:
@@ -171,99 +527,428 @@ def process_query():
     data = request.json
     if not data or 'query' not in data:
         return jsonify({"error": "No query provided"}), 400
-    db, engine = get_db()
-    llm = get_llm()
-    if not db or not llm:
-        return jsonify({"error": "Failed to initialize database or LLM"}), 500
+    datasource = request_datasource()
     try:
-        # Get schema info for semantic search
-        inspector = inspect(engine)
-        schema_info = {}
-        tables = inspector.get_table_names()
-        views = inspector.get_view_names()
-        for name in tables + views:
-            is_view = name in views
-            columns = inspector.get_columns(name)
-            schema_info[name] = {
-                "columns": [col["name"] for col in columns],
-                "types": {col["name"]: str(col["type"]) for col in columns},
-                "is_view": is_view
-            }
-            if not is_view:
+        trace = data.get('trace', request.args.get('trace') == '1' or TRACE_RESPONSES)
+        payload, status = handle_question(data['query'], data.get('use_cache', True), data.get('mode', QUERY_MODE),
+                                          trace=trace, datasource=datasource)
+        return jsonify(payload), status
+    except Exception as e:
+        logger.error(f"Query processing error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/query/batch', methods=['POST'])
+def process_query_batch():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.json
+    questions = data.get('queries') if data else None
+    if not isinstance(questions, list) or not questions:
+        return jsonify({"error": "No queries provided"}), 400
+    if len(questions) > BATCH_MAX_QUESTIONS:
+        return jsonify({"error": f"At most {BATCH_MAX_QUESTIONS} queries per batch"}), 400
+    if not all(isinstance(question, str) and question.strip() for question in questions):
+        return jsonify({"error": "Every query must be a non-empty string"}), 400
+    try:
+        max_workers = parse_max_workers(data.get('max_workers'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    use_cache = data.get('use_cache', True)
+    mode = data.get('mode', QUERY_MODE)
+    trace = data.get('trace', TRACE_RESPONSES)
+    datasource = request_datasource()
+    try:
+        snapshot = take_snapshot(datasource)
+    except Exception as e:
+        logger.error(f"Batch setup error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+    def answer(question):
+        payload, status = handle_question(question, use_cache, mode, snapshot, trace)
+        return {**payload, "status": status}
+
+    def generate():
+        # One JSON object per line, in completion order, then a summary line
+        started = time.perf_counter()
+        completed = 0
+        for result in run_batch(questions, answer, max_workers):
+            completed += 1
+            yield json.dumps(result, default=str) + "\n"
+        yield json.dumps({
+            "done": True,
+            "total": len(questions),
+            "unique": completed,
+            "elapsed_ms": round(1000 * (time.perf_counter() - started), 1)
+        }) + "\n"
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def sse(event, data):
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def stream_rows(engine, sql, keep=0):
+    """
+    Emit a query's columns and then its rows in chunks straight from a
+    server-side cursor. Returns the first keep rows as a result page, so
+    the streamed answer can be cached without running the query again.
+    """
+    chunks = iter_query_chunks(engine, sql, STREAM_CHUNK_SIZE)
+    with stage('sql_execution'):
+        columns = next(chunks)
+    yield sse('columns', {"columns": columns})
+    row_count = 0
+    kept = []
+    for rows in chunks:
+        row_count += len(rows)
+        if len(kept) < keep:
+            kept.extend(rows[:keep - len(kept)])
+        yield sse('rows', {"rows": rows})
+    yield sse('rows_done', {"row_count": row_count})
+    return {
+        "columns": columns,
+        "column_types": column_types(kept, len(columns)),
+        "result": [[encode_value(value) for value in row] for row in kept],
+        "truncated": row_count > len(kept),
+        "next_cursor": None
+    }
+
+def stream_agent(llm, db, question, relevant_items, relevant_values=None):
+    """Run the agent on a worker thread and relay its steps; the final response is sent as ('response', ...)."""
+    events = queue.Queue()
+    streamer = callback_handler(AgentStepStreamer, lambda name, payload: events.put((name, payload)))
+
+    def work():
+        try:
+            events.put(('response', llm_limiter.call(run_agent, llm, db, question, relevant_items, [streamer],
+                                                      relevant_values)))
+        except Exception as e:
+            events.put(('failed', e))
+
+    # Run in a copy of this context so the agent's stages land in the caller's trace
+    threading.Thread(target=contextvars.copy_context().run, args=(work,), daemon=True).start()
+    while True:
+        name, payload = events.get()
+        if name == 'failed':
+            raise payload
+        yield name, payload
+        if name == 'response':
+            return
+
+@app.route('/api/query/stream', methods=['POST'])
+def process_query_stream():
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.json
+    if not data or 'query' not in data:
+        return jsonify({"error": "No query provided"}), 400
+    question = data['query']
+    use_cache = query_cache is not None and data.get('use_cache', True)
+    mode = data.get('mode', QUERY_MODE)
+    datasource = request_datasource()
+
+    def generate():
+        try:
+            snapshot = take_snapshot(datasource)
+            fingerprint = snapshot["fingerprint"]
+            if use_cache:
+                cached = query_cache.get(question, datasource.url, fingerprint)
+                if cached is not None:
+                    yield sse('cached', {**cached, "cached": True, "cache_tier": "exact", "llm_calls": 0})
+                    yield sse('done', {"cached": True})
+                    return
+
+            engine = get_engine(datasource)
+            if not engine:
+                yield sse('error', {"error": "Failed to initialize database or LLM"})
+                return
+            semantic_search = snapshot["semantic_search"]
+            with stage('embedding'):
+                query_vector = get_embedder().embed([question])[0]
+            with stage('vector_search'):
+                relevant_items = semantic_search.search(query_vector) if semantic_search else []
+            with stage('value_lookup'):
+                relevant_values = find_relevant_values(datasource, question, snapshot["schema_info"])
+            yield sse('schema', {"relevant_schema": relevant_items, "relevant_values": relevant_values})
+
+            semantic_cache = get_semantic_query_cache() if use_cache else None
+            if semantic_cache is not None:
+                match = semantic_cache.lookup(question, datasource.url, fingerprint)
+                if match is not None:
+                    yield sse('sql', {"sql": match['sql'], "cached": True, "cache_tier": "semantic",
+                                      "matched_question": match['question'], "llm_calls": 0})
+                    yield from stream_rows(engine, match['sql'])
+                    yield sse('done', {"cached": True, "llm_calls": 0})
+                    return
+
+            llm = get_llm()
+            if not llm:
+                yield sse('error', {"error": "Failed to initialize database or LLM"})
+                return
+
+            llm_calls = 0
+            if mode != 'agent':
+                try:
+                    sql, output = llm_limiter.call(generate_single_shot_sql, llm, engine, question, relevant_items,
+                                                   snapshot["schema_info"], relevant_values)
+                    yield sse('sql', {"sql": sql, "mode": "single_shot", "llm_calls": 1})
+                    try:
+                        page = yield from stream_rows(engine, sql, keep=QUERY_MAX_ROWS if use_cache else 0)
+                    except Exception as e:
+                        # As in answer_single_shot: SQL that plans but fails to run goes to the agent
+                        raise SQLGenerationError(f"Generated SQL failed to execute: {e}") from e
+                    # Only SQL whose rows streamed in full is worth replaying
+                    if use_cache:
+                        query_cache.put(question, datasource.url, fingerprint, {
+                            "sql": sql, **page, "raw_output": output, "error": None,
+                            "relevant_schema": relevant_items, "relevant_values": relevant_values,
+                            "mode": "single_shot"
+                        })
+                    if semantic_cache is not None:
+                        semantic_cache.add(question, sql, datasource.url, fingerprint)
+                    yield sse('done', {"mode": "single_shot", "llm_calls": 1})
+                    return
+                except SQLGenerationError as e:
+                    llm_calls = 1
+                    yield sse('fallback', {"reason": str(e)})
+
+            response = None
+            db, _ = get_db(datasource)
+            for name, payload in stream_agent(llm, db, question, relevant_items, relevant_values):
+                if name == 'response':
+                    response = payload
+                else:
+                    yield sse(name, payload)
+            llm_calls += response["llm_calls"]
+            response = {**response, "llm_calls": llm_calls, "mode": "agent_fallback" if llm_calls > response["llm_calls"] else "agent"}
+            yield sse('sql', {"sql": response["sql"], "mode": response["mode"], "llm_calls": llm_calls})
+            yield sse('answer', {key: response[key] for key in ("result", "raw_output", "error")})
+            rows_failed = False
+            if is_read_only(response["sql"]):
                 try:
-                    foreign_keys = inspector.get_foreign_keys(name)
-                    if foreign_keys:
-                        schema_info[name]["foreign_keys"] = foreign_keys
+                    yield from stream_rows(engine, response["sql"])
                 except Exception as e:
-                    logger.warning(f"Could not get foreign keys for {name}: {e}")
-        semantic_search = get_semantic_search(schema_info)
-        query_vector = np.random.randn(768).astype(np.float32)
-        query_vector = query_vector / np.linalg.norm(query_vector)
-        relevant_items = semantic_search.search(query_vector) if semantic_search else []
-        context = "\n".join([
-            f"Table: {item['table_name']}, Column: {item['column_name']}, Type: {item['data_type']}"
-            for item in relevant_items
-        ])
-        enhanced_query = f"{data['query']}\n\nRelevant schema information:\n{context}"
-        toolkit = SQLDatabaseToolkit(db=db, llm=llm)
-        agent = create_sql_agent(
-            llm=llm,
-            toolkit=toolkit,
-            verbose=True,
-            agent_type=AgentType.ZERO_SHOT_REACT_DESCRIPTION,
-        )
+                    rows_failed = True
+                    yield sse('rows_error', {"error": str(e)})
+            if use_cache and response["sql"] and not response.get("error") and not rows_failed:
+                query_cache.put(question, datasource.url, fingerprint, response)
+                if semantic_cache is not None and is_read_only(response["sql"]):
+                    semantic_cache.add(question, response["sql"], datasource.url, fingerprint)
+            yield sse('done', {"mode": response["mode"], "llm_calls": llm_calls})
+        except Exception as e:
+            logger.error(f"Streaming query error: {e}")
+            yield sse('error', {"error": str(e)})
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def read_only_sql_param(data):
+    sql = (data.get('sql') or '').strip().rstrip(';').strip()
+    if not sql:
+        return None, "No SQL provided"
+    try:
+        check_read_only(sql)
+    except QueryRejectedError as e:
+        return None, str(e)
+    return sql, None
+
+@app.route('/api/results', methods=['POST'])
+def query_results():
+    """Execute SQL and return one page of typed rows with a token for the next page."""
+    if not request.is_json:
+        return jsonify({"error": "Request must be JSON"}), 400
+    data = request.json or {}
+    sql, error = read_only_sql_param(data)
+    if error:
+        return jsonify({"error": error}), 400
+    datasource = request_datasource()
+    try:
+        page_size = int(data.get('page_size', RESULT_PAGE_SIZE))
+        engine = get_engine(datasource)
+        return jsonify({"sql": sql, **fetch_page(engine, sql, page_size, data.get('cursor'))})
+    except (InvalidCursorError, QueryGuardError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Result query error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/results/export', methods=['GET', 'POST'])
+def export_results():
+    """Stream a query's full result as CSV or Arrow IPC without buffering it."""
+    data = request.get_json(silent=True) or request.values
+    sql, error = read_only_sql_param(data)
+    if error:
+        return jsonify({"error": error}), 400
+    export_format = data.get('format', 'csv')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    engine = guarded(request_datasource().pool_manager.engine, export_guard)
+    if export_format == 'arrow':
+        if importlib.util.find_spec('pyarrow') is None:
+            return jsonify({"error": "Arrow export requires pyarrow"}), 400
+        return Response(stream_with_context(iter_arrow(engine, sql)),
+                        mimetype='application/vnd.apache.arrow.stream',
+                        headers={'Content-Disposition': 'attachment; filename="result.arrows"'})
+    return Response(stream_with_context(iter_csv(engine, sql)), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename="result.csv"'})
+
+@app.route('/api/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Latency histograms, LLM usage and cache, pool and guard statistics in the Prometheus text format."""
+    extra = []
+    caches = []
+    if query_cache is not None:
+        caches.append(("exact", query_cache.stats()))
+    if _semantic_query_cache is not None:
+        caches.append(("semantic", _semantic_query_cache.stats()))
+    if caches:
+        extra.append(sampled('smartsql_cache_hits_total', 'Query cache hits by tier.',
+                             [({"tier": tier}, stats["hits"]) for tier, stats in caches], 'counter'))
+        extra.append(sampled('smartsql_cache_misses_total', 'Query cache misses by tier.',
+                             [({"tier": tier}, stats["misses"]) for tier, stats in caches], 'counter'))
+        extra.append(sampled('smartsql_cache_hit_ratio', 'Query cache hit ratio by tier.',
+                             [({"tier": tier}, stats["hit_rate"]) for tier, stats in caches]))
+        extra.append(sampled('smartsql_cache_entries', 'Query cache entries by tier.',
+                             [({"tier": tier}, stats["entries"]) for tier, stats in caches]))
+    active = datasources.active()
+    pools = [(datasource.name, datasource.pool_manager.stats()) for datasource in active]
+    extra.append(sampled('smartsql_db_pool_connections', 'Database pool connections by datasource and state.',
+                         [({"datasource": name, "state": state}, max(0, pool[key]))
+                          for name, pool in pools if "checkedout" in pool
+                          for state, key in (("checked_out", "checkedout"), ("checked_in", "checkedin"),
+                                             ("overflow", "overflow"))]))
+    extra.append(sampled('smartsql_datasources_active', 'Datasources holding an engine and indexes in memory.',
+                         [({}, len(active))]))
+    extra.append(sampled('smartsql_datasource_evictions_total', 'Datasources evicted from memory.',
+                         [({}, datasources.evictions)], 'counter'))
+    limiter = llm_limiter.stats()
+    extra.append(sampled('smartsql_llm_in_flight', 'LLM requests currently holding a concurrency slot.',
+                         [({}, limiter["in_flight"])]))
+    extra.append(sampled('smartsql_llm_retries_total', 'Rate-limited LLM calls that were retried.',
+                         [({}, limiter["retries"])], 'counter'))
+    guards = [({"guard": "query", "datasource": datasource.name}, datasource.pool_manager.query_guard.stats())
+              for datasource in active]
+    guards.append(({"guard": "export"}, export_guard.stats()))
+    extra.append(sampled('smartsql_queries_rejected_total', 'Queries refused by the plan-cost guard.',
+                         [(labels, stats["rejected"]) for labels, stats in guards], 'counter'))
+    extra.append(sampled('smartsql_query_timeouts_total', 'Queries aborted at their deadline.',
+                         [(labels, stats["timeouts"]) for labels, stats in guards], 'counter'))
+    views = []
+    for datasource in active:
+        materialized_views = datasource.materialized_views
+        if materialized_views is None or not materialized_views.active:
+            continue
         try:
-            response = agent.invoke({"input": enhanced_query})
-            output = response.get("output", "") or response.get("final_answer", "")
-            sql = ""
-            result = ""
-
-            # Try to extract SQL using regex (looks for lines starting with SELECT/UPDATE/INSERT/DELETE)
-            sql_match = re.search(r"(SELECT|UPDATE|INSERT|DELETE)[^;\\n]*", output, re.IGNORECASE)
-            if sql_match:
-                sql = sql_match.group(0).strip()
-
-            # Try to extract result (if present)
-            if "Final Answer:" in output:
-                result = output.split("Final Answer:")[-1].strip()
-            elif "Answer:" in output:
-                result = output.split("Answer:")[-1].strip()
-            else:
-                result = output.strip()
-
-            return jsonify({
-                "sql": sql,
-                "result": result,
-                "raw_output": output,
-                "error": response.get("error", None),
-                "relevant_schema": relevant_items
-            })
+            views.extend(({"datasource": datasource.name, "view": view["view"]}, view)
+                         for view in materialized_views.status_all())
         except Exception as e:
-            # Handle output parsing error and extract final answer from the error message
-            error_msg = str(e)
-            print("Agent Exception:", error_msg)
-            sql = ""
-            result = ""
-            sql_match = re.search(r"(SELECT|UPDATE|INSERT|DELETE)[^;\\n]*", error_msg, re.IGNORECASE)
-            if sql_match:
-                sql = sql_match.group(0).strip()
-            if "Final Answer:" in error_msg:
-                result = error_msg.split("Final Answer:")[-1].strip().split("\n")[0]
-            elif "Answer:" in error_msg:
-                result = error_msg.split("Answer:")[-1].strip().split("\n")[0]
+            logger.warning(f"Materialized view status failed for {datasource.name}: {e}")
+    if views:
+        extra.append(sampled('smartsql_materialized_pending_rows',
+                             'Source rows not yet in a materialized table.',
+                             [(labels, view["pending_rows"]) for labels, view in views]))
+        extra.append(sampled('smartsql_materialized_stale', '1 if a materialized table needs a refresh.',
+                             [(labels, int(view["stale"])) for labels, view in views]))
+        extra.append(sampled('smartsql_materialized_age_seconds', 'Seconds since a materialized table was refreshed.',
+                             [(labels, view["age_seconds"] or 0) for labels, view in views]))
+    workload = get_workload_store()
+    if workload is not None:
+        stats = workload.stats()
+        extra.append(sampled('smartsql_workload_statements_recorded_total',
+                             'Executed SQL statements recorded for the index advisor.', [({}, stats["recorded"])],
+                             'counter'))
+        extra.append(sampled('smartsql_workload_statements', 'Distinct normalized statements in the workload store.',
+                             [({}, stats["statements"])]))
+    memory = process_memory()
+    extra.append(sampled('smartsql_process_memory_bytes',
+                         'Memory of the worker serving this scrape: rss, and on Linux pss and private pages.',
+                         [({"kind": kind[:-3]}, mb * 2 ** 20) for kind, mb in memory.items()]))
+    if STARTUP:
+        extra.append(sampled('smartsql_startup_seconds', 'Seconds spent in each phase of preloading the app.',
+                             [({"phase": phase}, seconds) for phase, seconds in STARTUP.items()]))
+    return Response(render_metrics(extra), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/materialized', methods=['GET', 'POST'])
+def materialized_views_status():
+    materialized_views = request_datasource().get_materialized_views()
+    if not materialized_views.active:
+        return jsonify({"enabled": False, "views": []})
+    refreshed = None
+    try:
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            full = bool(data.get('full', False))
+            view = data.get('view')
+            if view is not None:
+                refreshed = [materialized_views.refresh(view, full)]
             else:
-                result = error_msg
-            return jsonify({
-                "sql": sql,
-                "result": result,
-                "raw_output": error_msg,
-                "error": "Output parsing error (handled)",
-                "relevant_schema": relevant_items
-            })
+                refreshed = materialized_views.refresh_all(full)
+        return jsonify({"enabled": True, "refreshed": refreshed, "views": materialized_views.status_all()})
+    except KeyError as e:
+        return jsonify({"error": e.args[0]}), 404
     except Exception as e:
-        logger.error(f"Query processing error: {e}")
+        logger.error(f"Materialized view refresh error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/index-advisor', methods=['GET', 'POST', 'DELETE'])
+def index_advisor_recommendations():
+    """Recommended indexes for the datasource's recorded SQL; POST {"apply": [names] | "all"} creates them."""
+    datasource = request_datasource()
+    index_advisor = datasource.get_index_advisor()
+    if index_advisor is None:
+        return jsonify({"enabled": False, "recommendations": []})
+    names = None
+    if request.method == 'POST':
+        # Creating indexes is never a default: the caller names them or asks for all
+        names = (request.get_json(silent=True) or {}).get('apply')
+        if names != 'all' and not (isinstance(names, list) and all(isinstance(name, str) for name in names)):
+            return jsonify({"error": 'Provide "apply" as a list of recommendation names or "all"'}), 400
+    try:
+        limit = int(request.args.get('limit', 20))
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+    try:
+        store = index_advisor.store
+        if request.method == 'DELETE':
+            store.clear(index_advisor.database_url)
+        recommendations = index_advisor.recommend()
+        applied = None
+        if names is not None:
+            chosen = [item for item in recommendations if names == 'all' or item["name"] in names]
+            applied = index_advisor.apply(chosen)
+            recommendations = index_advisor.recommend()
+        return jsonify({
+            "enabled": True,
+            "recommendations": recommendations,
+            "applied": applied,
+            "workload": store.top(index_advisor.database_url, limit),
+            **index_advisor.status()
+        })
+    except Exception as e:
+        logger.error(f"Index advisor error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/cache', methods=['GET', 'DELETE'])
+def query_cache_stats():
+    if query_cache is None:
+        return jsonify({"enabled": False})
+    semantic_cache = get_semantic_query_cache()
+    if request.method == 'DELETE':
+        query_cache.clear()
+        if semantic_cache is not None:
+            semantic_cache.clear()
+    return jsonify({
+        "enabled": True,
+        **query_cache.stats(),
+        "semantic": semantic_cache.stats() if semantic_cache is not None else None
+    })
+
+@app.errorhandler(UnknownDatasourceError)
+def unknown_datasource(error):
+    return jsonify({"error": error.args[0], "datasources": datasources.names()}), 404
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({"error": "Resource not found"}), 404
@@ -279,7 +964,7 @@ if __name__ == '__main__':
         raise ValueError("GROQ_API_KEY environment variable is required")
     
     # Test database connection
-    if not get_db()[0]:
+    if not get_engine() or not datasources.get().pool_manager.ping():
         logger.error("Failed to connect to database")
         raise ConnectionError("Database connection failed")
     
@@ -0,0 +1,105 @@
+import os
+import time
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterator, List
+from query_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', 4))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', 5))
+LLM_BACKOFF_BASE = float(os.getenv('LLM_BACKOFF_BASE', 1.0))
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', 16))
+BATCH_MAX_QUESTIONS = int(os.getenv('BATCH_MAX_QUESTIONS', 500))
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True for HTTP 429 / rate-limit errors from the LLM provider."""
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    message = str(error).lower()
+    return status == 429 or 'rate limit' in message or 'rate_limit' in message or 'too many requests' in message
+
+
+class LLMLimiter:
+    """Caps in-flight LLM work and retries rate-limited calls with exponential backoff and jitter."""
+
+    def __init__(self, max_concurrency: int = LLM_MAX_CONCURRENCY, max_retries: int = LLM_MAX_RETRIES,
+                 backoff_base: float = LLM_BACKOFF_BASE):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.retries = 0
+
+    def call(self, fn: Callable, *args, **kwargs):
+        """Run fn while holding a concurrency slot, backing off outside the slot on rate limits."""
+        for attempt in range(self.max_retries + 1):
+            with self._semaphore:
+                with self._lock:
+                    self.in_flight += 1
+                try:
+                    return fn(*args, **kwargs)
+                except Exception as e:
+                    if not is_rate_limit_error(e) or attempt == self.max_retries:
+                        raise
+                finally:
+                    with self._lock:
+                        self.in_flight -= 1
+            delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+            with self._lock:
+                self.retries += 1
+            logger.warning(f"LLM rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+            time.sleep(delay)
+
+    def stats(self) -> Dict:
+        return {"max_concurrency": self.max_concurrency, "in_flight": self.in_flight, "retries": self.retries}
+
+
+def dedupe_questions(questions: List[str]) -> Dict[str, List[int]]:
+    """Map each distinct normalized question to the positions it appears at, keeping first-seen order."""
+    positions: Dict[str, List[int]] = {}
+    for i, question in enumerate(questions):
+        positions.setdefault(normalize_question(question), []).append(i)
+    return positions
+
+
+def parse_max_workers(value, limit: int = BATCH_MAX_WORKERS) -> int:
+    """A request's max_workers as a positive integer capped at limit; limit when absent, ValueError when invalid."""
+    if value is None:
+        return limit
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError("max_workers must be a positive integer")
+    try:
+        workers = int(value)
+    except (TypeError, ValueError):
+        raise ValueError("max_workers must be a positive integer")
+    if workers < 1:
+        raise ValueError("max_workers must be a positive integer")
+    return min(workers, limit)
+
+
+def run_batch(questions: List[str], answer: Callable[[str], Dict],
+              max_workers: int = BATCH_MAX_WORKERS) -> Iterator[Dict]:
+    """Answer distinct questions on a thread pool and yield each result as soon as it completes."""
+    positions = dedupe_questions(questions)
+    if not positions:
+        return
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_workers, BATCH_MAX_WORKERS, len(positions))))
+    futures = {pool.submit(answer, questions[indices[0]]): indices for indices in positions.values()}
+    try:
+        for future in as_completed(futures):
+            indices = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                logger.error(f"Batch question failed: {e}")
+                result = {"error": str(e), "status": 500}
+            yield {"index": indices[0], "indices": indices, "query": questions[indices[0]], **result}
+    finally:
+        # On a client disconnect (GeneratorExit) drop the questions not yet started instead of answering them all
+        pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,276 @@
+"""
+Offline benchmark for the SmartSQL API. Runs a question corpus through
+/api/query, /api/semantic-search and /api/schema in-process, with a
+scripted stand-in for ChatGroq, and reports latency percentiles,
+throughput and memory. No API key or network access is needed.
+
+    python benchmark.py --requests 200 --concurrency 8 --llm-latency 0.3
+    python benchmark.py --database-url sqlite:///bench.db --no-cache --json report.json
+"""
+import os
+import re
+import sys
+import json
+import time
+import zlib
+import random
+import logging
+import argparse
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from query_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+ENDPOINTS = ('query', 'semantic-search', 'schema')
+
+# Questions about the student database with the SQL the stand-in LLM answers them with
+DEFAULT_CORPUS = [
+    ("How many students are there?", "SELECT COUNT(*) FROM STUDENT"),
+    ("How many students are in each class?", "SELECT CLASS, COUNT(*) FROM STUDENT GROUP BY CLASS"),
+    ("List the students in section A", "SELECT NAME FROM STUDENT WHERE SECTION = 'A'"),
+    ("What is the average mark per course?",
+     "SELECT c.NAME, AVG(g.MARKS) FROM STUDENT_GRADES g JOIN COURSE c ON c.COURSE_ID = g.COURSE_ID GROUP BY c.NAME"),
+    ("Who are the top 10 students by average marks?",
+     "SELECT s.NAME, AVG(g.MARKS) AS avg_marks FROM STUDENT s JOIN STUDENT_GRADES g ON g.STUDENT_ID = s.STUDENT_ID "
+     "GROUP BY s.STUDENT_ID ORDER BY avg_marks DESC LIMIT 10"),
+    ("Which courses does each teacher teach?",
+     "SELECT t.NAME, c.NAME FROM TEACHER t JOIN COURSE c ON c.TEACHER_ID = t.TEACHER_ID"),
+    ("How many students failed a course?", "SELECT COUNT(DISTINCT STUDENT_ID) FROM STUDENT_GRADES WHERE GRADE = 'F'"),
+    ("What is the grade distribution?", "SELECT GRADE, COUNT(*) FROM STUDENT_GRADES GROUP BY GRADE"),
+    ("Which department has the most courses?",
+     "SELECT DEPARTMENT, COUNT(*) AS n FROM COURSE GROUP BY DEPARTMENT ORDER BY n DESC LIMIT 1"),
+    ("List students graduating in 2025", "SELECT NAME FROM STUDENT WHERE GRADUATION_YEAR = 2025"),
+    ("What is the average experience of teachers per department?",
+     "SELECT DEPARTMENT, AVG(YEARS_EXPERIENCE) FROM TEACHER GROUP BY DEPARTMENT"),
+    ("How many grades were recorded in each semester?",
+     "SELECT SEMESTER, COUNT(*) FROM STUDENT_GRADES GROUP BY SEMESTER"),
+    ("Show the marks of every student in Machine Learning",
+     "SELECT s.NAME, g.MARKS FROM STUDENT s JOIN STUDENT_GRADES g ON g.STUDENT_ID = s.STUDENT_ID "
+     "JOIN COURSE c ON c.COURSE_ID = g.COURSE_ID WHERE c.NAME = 'Machine Learning'"),
+    ("Which students scored above 90 in any course?",
+     "SELECT DISTINCT s.NAME FROM STUDENT s JOIN STUDENT_GRADES g ON g.STUDENT_ID = s.STUDENT_ID WHERE g.MARKS > 90"),
+    ("What is the highest mark in Database Systems?",
+     "SELECT MAX(g.MARKS) FROM STUDENT_GRADES g JOIN COURSE c ON c.COURSE_ID = g.COURSE_ID "
+     "WHERE c.NAME = 'Database Systems'"),
+    ("How many credit hours does each department offer?",
+     "SELECT DEPARTMENT, SUM(CREDIT_HOURS) FROM COURSE GROUP BY DEPARTMENT"),
+]
+
+_QUESTION = re.compile(r'Question:\s*(.*)')
+
+
+class MockLLM(BaseChatModel):
+    """
+    Deterministic stand-in for ChatGroq. Answers the single-shot prompt with
+    the scripted SQL for its question and plays a two-step ReAct agent
+    (query, then final answer), sleeping a configurable latency per call.
+    """
+
+    script: Dict[str, str] = {}
+    default_sql: str = "SELECT COUNT(*) FROM STUDENT"
+    latency: float = 0.0
+    jitter: float = 0.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "mock"
+
+    def sql_for(self, prompt: str) -> str:
+        questions = _QUESTION.findall(prompt)
+        question = questions[-1] if questions else ''
+        return self.script.get(normalize_question(question), self.default_sql)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if self.latency or self.jitter:
+            # Jitter is seeded by the prompt so reruns sleep the same amounts
+            rng = random.Random(zlib.crc32(prompt.encode('utf-8')))
+            time.sleep(max(0.0, self.latency + rng.uniform(-self.jitter, self.jitter)))
+        sql = self.sql_for(prompt)
+        scratchpad = prompt.rsplit('Question:', 1)[-1]
+        if 'Respond with JSON only' in prompt:
+            text = json.dumps({"sql": sql})
+        elif 'Observation:' in scratchpad:
+            text = f"Thought: I now know the final answer\nFinal Answer: The result of {sql}"
+        else:
+            text = f"Thought: I should query the database.\nAction: sql_db_query\nAction Input: {sql}"
+        usage = {"prompt_tokens": len(prompt.split()), "completion_tokens": len(text.split())}
+        message = AIMessage(content=text, response_metadata={"token_usage": usage})
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output={"token_usage": usage})
+
+
+def current_rss_mb() -> float:
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def summarize(name: str, latencies: List[float], errors: int, elapsed: float, extra: Optional[Dict] = None) -> Dict:
+    values = np.array(latencies) * 1000 if latencies else np.zeros(1)
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "max_ms": float(values.max()),
+        "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+        "rss_mb": current_rss_mb(),
+        **(extra or {}),
+    }
+
+
+def run_load(send: Callable[[int], Tuple[int, Dict]], requests: int, concurrency: int) -> Tuple[List[float], int, float, List[Dict]]:
+    """Call send(i) for i in range(requests) on a thread pool; returns latencies, errors, wall time, payloads."""
+    latencies: List[float] = []
+    payloads: List[Dict] = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(i: int):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            status, payload = send(i)
+            failed = status >= 400 or (isinstance(payload, dict) and bool(payload.get('error')))
+        except Exception as e:
+            logger.warning(f"Request {i} failed: {e}")
+            status, payload, failed = 0, {}, True
+        with lock:
+            latencies.append(time.perf_counter() - started)
+            payloads.append(payload if isinstance(payload, dict) else {})
+            errors += int(failed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(one, range(requests)))
+    return latencies, errors, time.perf_counter() - started, payloads
+
+
+def benchmark(app_module, corpus: List[Tuple[str, str]], endpoints=ENDPOINTS, requests: int = 100,
+              concurrency: int = 4, warmup: int = 5, use_cache: bool = True, mode: Optional[str] = None) -> List[Dict]:
+    """Run each endpoint's workload against the Flask app and return one summary per endpoint."""
+    local = threading.local()
+
+    def client():
+        # Flask test clients are not thread-safe; give each worker its own
+        if not hasattr(local, 'client'):
+            local.client = app_module.app.test_client()
+        return local.client
+
+    def post(path: str, body: Dict) -> Tuple[int, Dict]:
+        response = client().post(path, json=body)
+        return response.status_code, response.get_json(silent=True) or {}
+
+    def send_query(i: int):
+        body = {"query": corpus[i % len(corpus)][0], "use_cache": use_cache}
+        if mode:
+            body["mode"] = mode
+        return post('/api/query', body)
+
+    def send_search(i: int):
+        return post('/api/semantic-search', {"query": corpus[i % len(corpus)][0]})
+
+    def send_schema(i: int):
+        response = client().get('/api/schema')
+        return response.status_code, {}
+
+    senders = {'query': send_query, 'semantic-search': send_search, 'schema': send_schema}
+    report = []
+    for name in endpoints:
+        send = senders[name]
+        if warmup:
+            run_load(send, warmup, 1)
+        latencies, errors, elapsed, payloads = run_load(send, requests, concurrency)
+        extra = {}
+        if name == 'query':
+            sources: Dict[str, int] = {}
+            for payload in payloads:
+                source = payload.get('cache_tier') or payload.get('mode') or 'error'
+                sources[source] = sources.get(source, 0) + 1
+            extra = {"sources": sources, "llm_calls": sum(payload.get('llm_calls') or 0 for payload in payloads)}
+        report.append(summarize(name, latencies, errors, elapsed, extra))
+    return report
+
+
+def load_corpus(path: Optional[str]) -> List[Tuple[str, str]]:
+    """A JSON list of {"question", "sql"} objects, or the built-in student corpus."""
+    if not path:
+        return list(DEFAULT_CORPUS)
+    with open(path) as f:
+        return [(item['question'], item['sql']) for item in json.load(f)]
+
+
+def print_report(report: List[Dict], startup: Dict):
+    print(f"startup: import {startup['import_s']:.2f}s, first schema {startup['warm_s']:.2f}s, "
+          f"RSS {startup['rss_mb']:.0f} MB")
+    print(f"{'endpoint':<16}{'requests':>9}{'errors':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'req/s':>10}{'RSS MB':>9}")
+    for row in report:
+        print(f"{row['endpoint']:<16}{row['requests']:>9}{row['errors']:>7}{row['p50_ms']:>10.1f}"
+              f"{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}{row['throughput_rps']:>10.1f}{row['rss_mb']:>9.0f}")
+        if row.get('sources'):
+            print(f"{'':<16}answered by {row['sources']}, {row['llm_calls']} LLM calls")
+    print(f"peak RSS {peak_rss_mb():.0f} MB")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline latency/throughput benchmark with a stand-in LLM")
+    parser.add_argument('--database-url', help="Database to benchmark (defaults to DATABASE_URL or student.db)")
+    parser.add_argument('--corpus', help="JSON file of {\"question\", \"sql\"} objects")
+    parser.add_argument('--endpoints', default=",".join(ENDPOINTS), help="Comma-separated subset of " + ", ".join(ENDPOINTS))
+    parser.add_argument('--requests', type=int, default=100, help="Requests per endpoint")
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--warmup', type=int, default=5, help="Unmeasured requests per endpoint")
+    parser.add_argument('--llm-latency', type=float, default=0.0, help="Seconds per stand-in LLM call")
+    parser.add_argument('--llm-jitter', type=float, default=0.0, help="Uniform +/- seconds added to each call")
+    parser.add_argument('--mode', choices=['single_shot', 'agent'], help="Query mode (defaults to QUERY_MODE)")
+    parser.add_argument('--no-cache', action='store_true', help="Bypass the query caches")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = set(endpoints) - set(ENDPOINTS)
+    if unknown:
+        parser.error(f"unknown endpoints: {', '.join(sorted(unknown))}")
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    os.environ.setdefault('GROQ_API_KEY', 'benchmark')
+    logging.basicConfig(level=logging.WARNING)
+
+    started = time.perf_counter()
+    import app as app_module
+    logging.getLogger().setLevel(logging.WARNING)
+    import_seconds = time.perf_counter() - started
+
+    corpus = load_corpus(args.corpus)
+    llm = MockLLM(script={normalize_question(question): sql for question, sql in corpus},
+                  latency=args.llm_latency, jitter=args.llm_jitter)
+    app_module.get_llm = lambda: llm
+
+    started = time.perf_counter()
+    app_module.app.test_client().get('/api/schema')
+    startup = {"import_s": import_seconds, "warm_s": time.perf_counter() - started, "rss_mb": current_rss_mb()}
+
+    report = benchmark(app_module, corpus, endpoints, args.requests, args.concurrency, args.warmup,
+                       use_cache=not args.no_cache, mode=args.mode)
+    print_report(report, startup)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({"startup": startup, "peak_rss_mb": peak_rss_mb(), "endpoints": report}, f, indent=2)
@@ -0,0 +1,149 @@
+import os
+import logging
+import threading
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine, make_url
+from guardrails import QueryGuard, guarded, install_guard
+from index_advisor import WorkloadStore, install_workload_recorder
+
+if TYPE_CHECKING:
+    from langchain_community.utilities import SQLDatabase
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        logger.warning(f"Invalid value for {name}, using default {default}")
+        return default
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+class ConnectionPoolManager:
+    """One pooled engine and one shared SQLDatabase wrapper per process."""
+
+    def __init__(self, database_url: str, pool_size: Optional[int] = None,
+                 max_overflow: Optional[int] = None, pool_timeout: Optional[int] = None,
+                 pool_recycle: Optional[int] = None, pool_pre_ping: Optional[bool] = None,
+                 workload: Optional[WorkloadStore] = None):
+        self.database_url = database_url
+        self.pool_size = pool_size if pool_size is not None else _env_int('DB_POOL_SIZE', 5)
+        self.max_overflow = max_overflow if max_overflow is not None else _env_int('DB_MAX_OVERFLOW', 10)
+        self.pool_timeout = pool_timeout if pool_timeout is not None else _env_int('DB_POOL_TIMEOUT', 30)
+        self.pool_recycle = pool_recycle if pool_recycle is not None else _env_int('DB_POOL_RECYCLE', 1800)
+        self.pool_pre_ping = pool_pre_ping if pool_pre_ping is not None else _env_bool('DB_POOL_PRE_PING', True)
+        self.query_guard = QueryGuard()
+        # Where guarded statements are recorded with their timings, for the index advisor
+        self.workload = workload
+        # Tables left out of the SQL agent's view of the database
+        self.ignore_tables: List[str] = []
+        self._engine: Optional[Engine] = None
+        self._sql_database: Optional['SQLDatabase'] = None
+        self._lock = threading.Lock()
+
+    def _engine_options(self) -> Dict:
+        """Pool settings for create_engine; in-memory SQLite keeps its default singleton pool."""
+        url = make_url(self.database_url)
+        options = {'pool_pre_ping': self.pool_pre_ping}
+        if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+            return options
+        options.update({
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.pool_timeout,
+            'pool_recycle': self.pool_recycle,
+        })
+        return options
+
+    @property
+    def engine(self) -> Engine:
+        """Create the pooled engine on first use and reuse it afterwards."""
+        if self._engine is None:
+            with self._lock:
+                if self._engine is None:
+                    engine = create_engine(self.database_url, **self._engine_options())
+                    install_guard(engine)
+                    if self.workload is not None:
+                        install_workload_recorder(engine, self.workload)
+                    self._engine = engine
+                    logger.info(f"Created pooled engine for {self._engine.url.render_as_string(hide_password=True)}")
+        return self._engine
+
+    @property
+    def guarded_engine(self) -> Engine:
+        """The pooled engine with read-only, plan-cost and timeout limits on free-form SQL."""
+        return guarded(self.engine, self.query_guard)
+
+    def get_sql_database(self) -> 'SQLDatabase':
+        """Return the shared SQLDatabase wrapper, reflecting the schema only once."""
+        if self._sql_database is None:
+            # Only the SQL agent needs it, and langchain_community is slow to import
+            from langchain_community.utilities import SQLDatabase
+            engine = self.guarded_engine
+            with self._lock:
+                if self._sql_database is None:
+                    self._sql_database = SQLDatabase(engine, ignore_tables=self.ignore_tables or None)
+        return self._sql_database
+
+    def ping(self) -> bool:
+        """Check out a pooled connection and run a trivial query."""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            return True
+        except Exception as e:
+            logger.error(f"Database ping failed: {e}")
+            return False
+
+    def stats(self) -> Dict:
+        """Current pool usage, for spotting saturation under load."""
+        if self._engine is None:
+            return {"initialized": False}
+        pool = self._engine.pool
+        stats = {
+            "initialized": True,
+            "pool_class": type(pool).__name__,
+            "status": pool.status(),
+        }
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[name] = method()
+        if "size" in stats:
+            stats["max_overflow"] = self.max_overflow
+            stats["capacity"] = stats["size"] + self.max_overflow
+        return stats
+
+    def after_fork(self):
+        """Drop pooled connections inherited from the parent process without closing them under it."""
+        if self._engine is not None:
+            self._engine.dispose(close=False)
+
+    def dispose(self):
+        """Close all pooled connections and forget the engine."""
+        with self._lock:
+            if self._engine is not None:
+                self._engine.dispose()
+            self._engine = None
+            self._sql_database = None
+
+
+def iter_query_chunks(engine: Engine, sql: str, chunk_size: int = 500) -> Iterator[List]:
+    """
+    Stream a query through a server-side cursor. Yields the column names
+    first, then lists of at most chunk_size rows, so memory stays bounded.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(text(sql))
+        yield list(result.keys())
+        for partition in result.partitions(chunk_size):
+            yield [list(row) for row in partition]
@@ -0,0 +1,314 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from semantic_search import SchemaSemanticSearch
+from embeddings import get_embedder
+from database import ConnectionPoolManager
+from schema_cache import SchemaCatalog
+from materialized import MaterializedViews
+from value_index import VALUE_INDEX_ENABLED, ValueIndex
+from index_advisor import IndexAdvisor, get_workload_store
+
+logger = logging.getLogger(__name__)
+
+# At most this many datasources keep an engine and indexes in memory; the least recently used are evicted
+DATASOURCE_MAX_ACTIVE = int(os.getenv('DATASOURCE_MAX_ACTIVE', 8))
+# Datasources idle for longer than this many seconds are evicted too (0 disables)
+DATASOURCE_IDLE_TTL = float(os.getenv('DATASOURCE_IDLE_TTL', 0))
+DATASOURCE_INDEX_DIR = os.getenv('DATASOURCE_INDEX_DIR', 'schema_indexes')
+DEFAULT_DATASOURCE = os.getenv('DEFAULT_DATASOURCE', 'default')
+
+
+class UnknownDatasourceError(KeyError):
+    """Raised when a request names a datasource that is not configured."""
+
+
+def load_datasource_configs(default_url: str, default_index_path: str) -> Dict[str, Dict]:
+    """
+    Datasources from DATASOURCES (inline JSON) or DATASOURCES_FILE (a JSON
+    file), as {"name": "url"} or {"name": {"url": ..., "index_path": ...}},
+    plus DEFAULT_DATASOURCE backed by DATABASE_URL unless listed there.
+    """
+    raw = os.getenv('DATASOURCES', '')
+    path = os.getenv('DATASOURCES_FILE', '')
+    configured = {}
+    if raw:
+        configured = json.loads(raw)
+    elif path:
+        with open(path) as f:
+            configured = json.load(f)
+    configs = {DEFAULT_DATASOURCE: {"url": default_url, "index_path": default_index_path}}
+    for name, config in configured.items():
+        if isinstance(config, str):
+            config = {"url": config}
+        configs[name] = {
+            "url": config["url"],
+            "index_path": config.get("index_path") or os.path.join(DATASOURCE_INDEX_DIR, name),
+        }
+    return configs
+
+
+class Datasource:
+    """
+    One database's pooled engine, schema catalog, schema index, value index,
+    materialized views and index advisor.
+    """
+
+    def __init__(self, name: str, url: str, index_path: str, index_options: Optional[Dict] = None):
+        self.name = name
+        self.url = url
+        self.index_path = index_path
+        self.index_options = index_options or {}
+        self.pool_manager = ConnectionPoolManager(url, workload=get_workload_store())
+        self.last_used = time.monotonic()
+        self._schema_catalog: Optional[SchemaCatalog] = None
+        self._semantic_search: Optional[SchemaSemanticSearch] = None
+        self._materialized_views: Optional[MaterializedViews] = None
+        self._value_index: Optional[ValueIndex] = None
+        self._index_advisor: Optional[IndexAdvisor] = None
+        self._lock = threading.Lock()
+        self._semantic_search_lock = threading.Lock()
+        # Requests using this datasource; an evicted one is closed when the last of them releases it
+        self._users = 0
+        self._retired = False
+        self._users_lock = threading.Lock()
+
+    @property
+    def materialized_views(self) -> Optional[MaterializedViews]:
+        """The materialized views if they were already set up, without touching the database."""
+        return self._materialized_views
+
+    def get_materialized_views(self) -> MaterializedViews:
+        if self._materialized_views is None:
+            with self._lock:
+                if self._materialized_views is None:
+                    views = MaterializedViews(self.pool_manager.engine)
+                    views.setup()
+                    self.pool_manager.ignore_tables = views.hidden_tables()
+                    self._materialized_views = views
+        return self._materialized_views
+
+    def get_schema_catalog(self) -> SchemaCatalog:
+        """Shared schema catalog, rebuilt only when the schema changes."""
+        if self._schema_catalog is None:
+            overlay = self.get_materialized_views().overlay
+            with self._lock:
+                if self._schema_catalog is None:
+                    self._schema_catalog = SchemaCatalog(self.pool_manager.engine, overlay=overlay)
+        return self._schema_catalog
+
+    def get_value_index(self) -> Optional[ValueIndex]:
+        if VALUE_INDEX_ENABLED and self._value_index is None:
+            with self._lock:
+                if self._value_index is None:
+                    self._value_index = ValueIndex(self.pool_manager.engine)
+        return self._value_index
+
+    def get_index_advisor(self) -> Optional[IndexAdvisor]:
+        """The advisor over this database's recorded workload, or None when recording is off."""
+        store = self.pool_manager.workload
+        if store is not None and self._index_advisor is None:
+            with self._lock:
+                if self._index_advisor is None:
+                    self._index_advisor = IndexAdvisor(self.pool_manager.engine, store)
+        return self._index_advisor
+
+    def _index_is_current(self, index: SchemaSemanticSearch, fingerprint: str) -> bool:
+        embedder = get_embedder()
+        return (index.schema_fingerprint == fingerprint and index.embedder_name == embedder.name
+                and index.dimension == embedder.dimension)
+
+    def get_semantic_search(self) -> Optional[SchemaSemanticSearch]:
+        """Return the resident index, incrementally re-synced when the schema fingerprint changes."""
+        catalog = self.get_schema_catalog()
+        schema_info = catalog.get()
+        fingerprint = catalog.fingerprint
+        current = self._semantic_search
+        if current is not None and self._index_is_current(current, fingerprint):
+            return current
+        with self._semantic_search_lock:
+            current = self._semantic_search
+            if current is not None and self._index_is_current(current, fingerprint):
+                return current
+            try:
+                embedder = get_embedder()
+                if current is None and os.path.exists(self.index_path):
+                    current = SchemaSemanticSearch.load(self.index_path)
+                    if current.dimension != embedder.dimension:
+                        current = None
+                    elif current.configure(**self.index_options):
+                        current.save(self.index_path)
+                    if current is not None and self._index_is_current(current, fingerprint):
+                        self._semantic_search = current
+                        return current
+
+                # Update a private copy and swap it in, so concurrent searches never see a half-synced index
+                if current is not None:
+                    updated = current.copy()
+                else:
+                    updated = SchemaSemanticSearch(dimension=embedder.dimension, **self.index_options)
+                stats = updated.sync(schema_info, fingerprint, embedder)
+                logger.info(f"Schema index for {self.name} synced: {stats}")
+
+                # Save the index
+                updated.save(self.index_path)
+                self._semantic_search = updated
+                return self._semantic_search
+            except Exception as e:
+                logger.error(f"Semantic search initialization error for {self.name}: {e}")
+                return current
+
+    def warm(self, agent: bool = False) -> Dict[str, float]:
+        """
+        Build synchronously what requests otherwise build on first use, and
+        return the seconds each part took. Materialized views are refreshed
+        here rather than on a background thread, so nothing is left running.
+        """
+        timings = {}
+        started = time.perf_counter()
+        views = self.get_materialized_views()
+        views.refresh_all()
+        timings["materialized_views"] = time.perf_counter() - started
+        started = time.perf_counter()
+        schema_info = self.get_schema_catalog().get()
+        timings["schema_catalog"] = time.perf_counter() - started
+        started = time.perf_counter()
+        self.get_semantic_search()
+        timings["schema_index"] = time.perf_counter() - started
+        value_index = self.get_value_index()
+        if value_index is not None:
+            started = time.perf_counter()
+            value_index.sync(schema_info)
+            timings["value_index"] = time.perf_counter() - started
+        if agent:
+            started = time.perf_counter()
+            self.pool_manager.get_sql_database()
+            timings["sql_database"] = time.perf_counter() - started
+        return {name: round(seconds, 3) for name, seconds in timings.items()}
+
+    def acquire(self):
+        with self._users_lock:
+            self._users += 1
+
+    def release(self):
+        """End one user's claim; the last user of an evicted datasource closes it."""
+        with self._users_lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        """Close now if unused, otherwise once the requests still using it release it."""
+        with self._users_lock:
+            self._retired = True
+            close = self._users == 0
+        if close:
+            self.close()
+        else:
+            logger.info(f"Datasource {self.name} closes when its {self._users} active requests finish")
+
+    def close(self):
+        """Release the pooled connections and in-memory indexes; the index files stay on disk."""
+        self.pool_manager.dispose()
+        self._schema_catalog = None
+        self._semantic_search = None
+        self._materialized_views = None
+        self._value_index = None
+        self._index_advisor = None
+
+
+class DatasourceRegistry:
+    """
+    Configured datasources, of which at most max_active are resident. Others
+    are created on first use, and their schema index is loaded back from
+    its files, evicting the least recently used.
+    """
+
+    def __init__(self, configs: Dict[str, Dict], default: str = DEFAULT_DATASOURCE,
+                 max_active: int = DATASOURCE_MAX_ACTIVE, idle_ttl: float = DATASOURCE_IDLE_TTL,
+                 index_options: Optional[Dict] = None):
+        if default not in configs:
+            raise ValueError(f"Default datasource {default!r} is not configured")
+        self.configs = configs
+        self.default = default
+        self.max_active = max(1, max_active)
+        self.idle_ttl = idle_ttl
+        self.index_options = index_options or {}
+        self.evictions = 0
+        self._active: "OrderedDict[str, Datasource]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        return list(self.configs)
+
+    def get(self, name: Optional[str] = None, acquire: bool = False) -> Datasource:
+        """
+        The named (or default) datasource, made resident and marked most
+        recently used. With acquire=True the caller must release() it, and
+        until then eviction leaves its pool open.
+        """
+        name = name or self.default
+        if name not in self.configs:
+            raise UnknownDatasourceError(f"Unknown datasource {name!r}")
+        evicted = []
+        with self._lock:
+            datasource = self._active.get(name)
+            if datasource is None:
+                config = self.configs[name]
+                datasource = Datasource(name, config["url"], config["index_path"], self.index_options)
+                self._active[name] = datasource
+                logger.info(f"Activated datasource {name}")
+            self._active.move_to_end(name)
+            now = time.monotonic()
+            datasource.last_used = now
+            if acquire:
+                datasource.acquire()
+            for other in list(self._active.values())[:-1]:
+                idle = self.idle_ttl and now - other.last_used > self.idle_ttl
+                if len(self._active) > self.max_active or idle:
+                    evicted.append(self._active.pop(other.name))
+            self.evictions += len(evicted)
+        for other in evicted:
+            logger.info(f"Evicting idle datasource {other.name}")
+            other.retire()
+        return datasource
+
+    def active(self) -> List[Datasource]:
+        """Resident datasources, least recently used first."""
+        with self._lock:
+            return list(self._active.values())
+
+    def evict(self, name: str) -> bool:
+        if name not in self.configs:
+            raise UnknownDatasourceError(f"Unknown datasource {name!r}")
+        with self._lock:
+            datasource = self._active.pop(name, None)
+            if datasource is not None:
+                self.evictions += 1
+        if datasource is not None:
+            datasource.retire()
+        return datasource is not None
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        active = {datasource.name: datasource for datasource in self.active()}
+        datasources = []
+        for name in self.configs:
+            entry = {"name": name, "active": name in active}
+            if name in active:
+                entry["idle_seconds"] = round(now - active[name].last_used, 3)
+                entry["pool"] = active[name].pool_manager.stats()
+            datasources.append(entry)
+        return {
+            "configured": len(self.configs),
+            "active": len(active),
+            "max_active": self.max_active,
+            "evictions": self.evictions,
+            "default": self.default,
+            "datasources": datasources,
+        }
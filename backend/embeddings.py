@@ -0,0 +1,223 @@
+import os
+import re
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKEND = os.getenv('EMBEDDING_BACKEND', 'hashing')
+EMBEDDING_DIMENSION = int(os.getenv('EMBEDDING_DIMENSION', 768))
+EMBEDDING_CACHE_PATH = os.getenv('EMBEDDING_CACHE_PATH', 'embedding_cache.db')
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', 10000))
+EMBEDDING_CACHE_MAX_ROWS = int(os.getenv('EMBEDDING_CACHE_MAX_ROWS', 200000))
+
+_CAMEL_BOUNDARY = re.compile(r'(?<=[a-z0-9])(?=[A-Z])')
+_NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and split identifiers (snake_case, camelCase) into words."""
+    text = _CAMEL_BOUNDARY.sub(' ', text)
+    return _NON_ALNUM.sub(' ', text.lower()).strip()
+
+
+class Embedder:
+    """Turns texts into L2-normalized float32 vectors of a fixed dimension."""
+
+    name = 'base'
+    dimension = EMBEDDING_DIMENSION
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed a batch of texts into an (n, dimension) float32 matrix."""
+        raise NotImplementedError
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic offline embedder: signed feature hashing of words and
+    character n-grams. Needs no model, network or GPU, and identical text
+    always maps to the identical vector.
+    """
+
+    def __init__(self, dimension: int = EMBEDDING_DIMENSION, min_n: int = 3, max_n: int = 5):
+        self.dimension = dimension
+        self.min_n = min_n
+        self.max_n = max_n
+        self.name = f"hashing-{dimension}-{min_n}-{max_n}"
+
+    def _features(self, text: str) -> List[str]:
+        words = normalize_text(text).split()
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f" {word} "
+            for n in range(self.min_n, self.max_n + 1):
+                features.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+        return features
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Embed all texts with a single bincount over the hashed features of the batch."""
+        rows, hashes = [], []
+        for row, text in enumerate(texts):
+            features = self._features(text)
+            rows.extend([row] * len(features))
+            hashes.extend(zlib.crc32(feature.encode('utf-8')) for feature in features)
+        matrix = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        if hashes:
+            hashes = np.array(hashes, dtype=np.uint32)
+            # The low bits pick a bucket, the top bit a sign, so collisions tend to cancel out
+            buckets = np.array(rows, dtype=np.int64) * self.dimension + (hashes % self.dimension)
+            signs = np.where(hashes >> 31, -1.0, 1.0)
+            matrix = np.bincount(buckets, weights=signs, minlength=matrix.size)
+            matrix = matrix.reshape(len(texts), self.dimension).astype(np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.where(norms == 0, 1, norms)
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store: an in-memory LRU in front of an optional
+    SQLite file. The file keeps at most max_rows vectors, dropping the oldest
+    writes first (0 means unbounded).
+    """
+
+    def __init__(self, path: Optional[str] = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_SIZE,
+                 max_rows: int = EMBEDDING_CACHE_MAX_ROWS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self._memory: 'OrderedDict[str, np.ndarray]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._rows = 0
+        if path:
+            self._connection()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """The SQLite file, opened on first use (and again after close()); None when memory-only."""
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # A cache can lose its last writes in a power cut; skip the fsync on every commit
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+            conn.commit()
+            self._conn = conn
+            self._rows = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        return self._conn
+
+    def close(self):
+        """Close the SQLite file, e.g. before forking workers; the next lookup reopens it."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def key(embedder_name: str, text: str) -> str:
+        return hashlib.sha256(f"{embedder_name}\x1f{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """Return the cached vectors for whichever keys are present."""
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+            missing = [key for key in keys if key not in found]
+            conn = self._connection() if missing else None
+            if conn is not None:
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    placeholders = ','.join('?' * len(chunk))
+                    for key, blob in conn.execute(
+                            f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", chunk):
+                        found[key] = np.frombuffer(blob, dtype=np.float32)
+                        self._remember(key, found[key])
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        """Store vectors in memory and, if configured, on disk."""
+        with self._lock:
+            for key, vector in vectors.items():
+                self._remember(key, vector)
+            conn = self._connection()
+            if conn is not None:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                    [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items()]
+                )
+                self._rows += len(vectors)
+                if self.max_rows and self._rows > self.max_rows:
+                    self._trim(conn)
+                conn.commit()
+
+    def _trim(self, conn: sqlite3.Connection):
+        """Delete the oldest rows so the file holds 90% of max_rows; rowids grow with every write."""
+        rows = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = rows - int(self.max_rows * 0.9)
+        if excess > 0:
+            conn.execute("DELETE FROM embeddings WHERE rowid IN "
+                         "(SELECT rowid FROM embeddings ORDER BY rowid LIMIT ?)", (excess,))
+            logger.info(f"Trimmed {excess} embeddings from {self.path}")
+        self._rows = rows - max(excess, 0)
+
+    def _remember(self, key: str, vector: np.ndarray):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+class CachedEmbedder(Embedder):
+    """Wraps an embedder so each distinct text is embedded at most once."""
+
+    def __init__(self, embedder: Embedder, cache: EmbeddingCache):
+        self.embedder = embedder
+        self.cache = cache
+        self.name = embedder.name
+        self.dimension = embedder.dimension
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Serve cached vectors and embed all misses in one batch call."""
+        keys = [EmbeddingCache.key(self.name, text) for text in texts]
+        found = self.cache.get_many(list(dict.fromkeys(keys)))
+        missing = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in found))
+        if missing:
+            fresh = self.embedder.embed(missing)
+            new_vectors = {EmbeddingCache.key(self.name, text): vector for text, vector in zip(missing, fresh)}
+            self.cache.put_many(new_vectors)
+            found.update(new_vectors)
+        matrix = np.empty((len(texts), self.dimension), dtype=np.float32)
+        for row, key in enumerate(keys):
+            matrix[row] = found[key]
+        return matrix
+
+
+_default_embedder: Optional[Embedder] = None
+_default_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder:
+    """Process-wide embedder configured by EMBEDDING_BACKEND, with the persistent cache."""
+    global _default_embedder
+    if _default_embedder is None:
+        with _default_lock:
+            if _default_embedder is None:
+                if EMBEDDING_BACKEND != 'hashing':
+                    raise ValueError(f"Unknown embedding backend: {EMBEDDING_BACKEND}")
+                cache = EmbeddingCache(EMBEDDING_CACHE_PATH or None)
+                _default_embedder = CachedEmbedder(HashingEmbedder(), cache)
+                logger.info(f"Using {_default_embedder.name} embeddings")
+    return _default_embedder
+
+
+def schema_item_text(table_name: str, column_name: str, data_type: str) -> str:
+    """Text that represents a schema column for embedding."""
+    return f"{table_name} {column_name} {data_type}"
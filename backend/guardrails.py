@@ -0,0 +1,356 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql.elements import TextClause
+
+logger = logging.getLogger(__name__)
+
+QUERY_TIMEOUT = float(os.getenv('QUERY_TIMEOUT', 30))
+QUERY_MAX_SCAN_ROWS = int(os.getenv('QUERY_MAX_SCAN_ROWS', 5000000))
+TABLE_SIZE_TTL = float(os.getenv('TABLE_SIZE_TTL', 60))
+
+_LEXER = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<quoted>"(?:[^"]|"")*"?|`[^`]*`?|\[[^\]]*\]?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<semicolon>;)
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+# Keywords that can only appear in a statement that writes, locks or changes session state
+_WRITE_KEYWORDS = {
+    'INSERT', 'UPDATE', 'DELETE', 'MERGE', 'UPSERT', 'DROP', 'ALTER', 'CREATE', 'TRUNCATE', 'GRANT',
+    'REVOKE', 'ATTACH', 'DETACH', 'PRAGMA', 'VACUUM', 'REINDEX', 'COPY', 'CALL', 'EXEC', 'EXECUTE',
+    'INTO', 'LOCK', 'UNLOCK', 'OUTFILE', 'DUMPFILE',
+}
+
+_TIMEOUT_MESSAGES = (
+    'interrupted',                    # SQLite progress handler
+    'canceling statement due to statement timeout',  # Postgres
+    'maximum statement execution time exceeded',     # MySQL
+)
+
+_RETRY_HINT = ("Try a cheaper query: filter on indexed columns, join tables on their keys "
+               "instead of cross joining, and aggregate or LIMIT the result.")
+
+
+class QueryGuardError(SQLAlchemyError):
+    """
+    Base for queries stopped by the guard. Subclassing SQLAlchemyError means
+    the SQL agent's query tool reports the message back to the agent as an
+    observation, so it can retry with a cheaper query.
+    """
+
+
+class QueryRejectedError(QueryGuardError):
+    """Raised before execution for statements that are not read-only or are planned too expensive."""
+
+
+class QueryTimeoutError(QueryGuardError):
+    """Raised when a running query is aborted at its deadline."""
+
+
+def _words(sql: str) -> List[str]:
+    """Upper-cased keywords and identifiers of a statement, ignoring comments, strings and quoted names."""
+    tokens = []
+    for match in _LEXER.finditer(sql):
+        kind = match.lastgroup
+        if kind == 'word':
+            tokens.append(match.group().upper())
+        elif kind == 'semicolon':
+            tokens.append(';')
+    return tokens
+
+
+def check_read_only(sql: str):
+    """
+    Tokenize the statement and reject anything other than one SELECT/WITH
+    query (optionally under EXPLAIN). Raises QueryRejectedError.
+    """
+    words = _words(sql)
+    while words and words[-1] == ';':
+        words.pop()
+    if ';' in words:
+        raise QueryRejectedError("Only a single statement can be executed")
+    if words[:3] == ['EXPLAIN', 'QUERY', 'PLAN']:
+        words = words[3:]
+    elif words[:1] == ['EXPLAIN']:
+        words = words[1:]
+    if not words or words[0] not in ('SELECT', 'WITH'):
+        raise QueryRejectedError("Only SELECT or WITH queries can be executed")
+    writes = sorted(_WRITE_KEYWORDS.intersection(words))
+    if 'FOR' in words and ('UPDATE' in words or 'SHARE' in words):
+        writes.append('FOR UPDATE/SHARE')
+    if writes:
+        raise QueryRejectedError(f"Query is not read-only (contains {', '.join(writes)})")
+
+
+def is_read_only(sql: str) -> bool:
+    try:
+        check_read_only(sql)
+        return True
+    except QueryRejectedError:
+        return False
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    message = str(error).lower()
+    return any(text in message for text in _TIMEOUT_MESSAGES) or getattr(error, 'pgcode', None) == '57014'
+
+
+class QueryGuard:
+    """
+    Limits for free-form SQL: read-only statements only, a plan-based cap on
+    rows read by full scans, and a wall-clock deadline per statement.
+    """
+
+    def __init__(self, timeout: float = QUERY_TIMEOUT, max_scan_rows: int = QUERY_MAX_SCAN_ROWS):
+        self.timeout = timeout
+        self.max_scan_rows = max_scan_rows
+        self._table_sizes: Dict[Tuple[str, str], Tuple[float, int]] = {}
+        self._sqlite_catalogs: Dict[str, Tuple[float, Dict]] = {}
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.timeouts = 0
+
+    # Plan checks
+
+    def _sqlite_catalog(self, dbapi_connection, key: str) -> Dict:
+        """Table names and the aliases used for them in views, cached for TABLE_SIZE_TTL seconds."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._sqlite_catalogs.get(key)
+            if cached and now - cached[0] < TABLE_SIZE_TTL:
+                return cached[1]
+        cursor = dbapi_connection.cursor()
+        try:
+            rows = cursor.execute("SELECT type, name, sql FROM sqlite_master WHERE type IN ('table', 'view')").fetchall()
+        finally:
+            cursor.close()
+        catalog = {
+            'tables': {name.lower(): name for kind, name, _ in rows if kind == 'table'},
+            'view_sql': " ".join(sql or '' for kind, _, sql in rows if kind == 'view'),
+        }
+        with self._lock:
+            self._sqlite_catalogs[key] = (now, catalog)
+        return catalog
+
+    def _sqlite_table_size(self, dbapi_connection, key: str, table: str) -> int:
+        """Approximate row count: MAX(rowid) is an index lookup, COUNT(*) only for WITHOUT ROWID tables."""
+        now = time.monotonic()
+        with self._lock:
+            cached = self._table_sizes.get((key, table))
+            if cached and now - cached[0] < TABLE_SIZE_TTL:
+                return cached[1]
+        quoted = '"' + table.replace('"', '""') + '"'
+        cursor = dbapi_connection.cursor()
+        try:
+            try:
+                size = cursor.execute(f"SELECT MAX(_rowid_) FROM {quoted}").fetchone()[0] or 0
+            except Exception:
+                size = cursor.execute(f"SELECT COUNT(*) FROM {quoted}").fetchone()[0]
+        finally:
+            cursor.close()
+        with self._lock:
+            self._table_sizes[(key, table)] = (now, size)
+        return size
+
+    def _sqlite_scan_rows(self, dbapi_connection, key: str, statement: str, parameters) -> int:
+        """
+        SQLite's plan has no row estimates, so multiply the sizes of the
+        tables it reads with a full SCAN (nested scans multiply in a join).
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            plan = cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ()).fetchall()
+        finally:
+            cursor.close()
+        catalog = self._sqlite_catalog(dbapi_connection, key)
+        tables = catalog['tables']
+        # The plan names tables by alias; the statement's own aliases win over those inside views
+        aliases = {}
+        for text in (statement, catalog['view_sql']):
+            for name in tables.values():
+                for alias in re.findall(rf'\b{re.escape(name)}\b\s+(?:AS\s+)?(\w+)', text, re.IGNORECASE):
+                    aliases.setdefault(alias.lower(), name)
+        estimate = 1
+        scanned = False
+        for row in plan:
+            match = re.match(r'SCAN (?:TABLE )?(\w+)', row[-1])
+            if not match:
+                continue
+            name = match.group(1).lower()
+            table = tables.get(name) or aliases.get(name)
+            if table is None:
+                continue
+            scanned = True
+            estimate *= max(1, self._sqlite_table_size(dbapi_connection, key, table))
+        return estimate if scanned else 0
+
+    @staticmethod
+    def _postgres_scan_rows(dbapi_connection, statement: str, parameters) -> int:
+        """Largest row estimate of any node in the plan; cross joins show up as huge join nodes."""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {statement}", parameters or None)
+            plan = cursor.fetchone()[0]
+        finally:
+            cursor.close()
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = 0
+        stack = [plan[0]['Plan']]
+        while stack:
+            node = stack.pop()
+            estimate = max(estimate, int(node.get('Plan Rows', 0)))
+            stack.extend(node.get('Plans', []))
+        return estimate
+
+    @staticmethod
+    def _mysql_scan_rows(dbapi_connection, statement: str, parameters) -> int:
+        """Product of row estimates of the tables read by full table or index scans."""
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"EXPLAIN {statement}", parameters or None)
+            columns = [column[0].lower() for column in cursor.description]
+            plan = [dict(zip(columns, row)) for row in cursor.fetchall()]
+        finally:
+            cursor.close()
+        estimate = 1
+        scanned = False
+        for row in plan:
+            if row.get('type') in ('ALL', 'index'):
+                scanned = True
+                estimate *= max(1, int(row.get('rows') or 1))
+        return estimate if scanned else 0
+
+    def estimate_scan_rows(self, dbapi_connection, dialect: str, key: str, statement: str,
+                           parameters) -> Optional[int]:
+        """Rows the database expects to read with full scans, or None if the dialect is not supported."""
+        if dialect == 'sqlite':
+            return self._sqlite_scan_rows(dbapi_connection, key, statement, parameters)
+        if dialect == 'postgresql':
+            return self._postgres_scan_rows(dbapi_connection, statement, parameters)
+        if dialect == 'mysql':
+            return self._mysql_scan_rows(dbapi_connection, statement, parameters)
+        return None
+
+    def check_plan(self, dbapi_connection, dialect: str, key: str, statement: str, parameters):
+        if not self.max_scan_rows:
+            return
+        estimate = self.estimate_scan_rows(dbapi_connection, dialect, key, statement, parameters)
+        if estimate is not None and estimate > self.max_scan_rows:
+            self.rejected += 1
+            raise QueryRejectedError(
+                f"Query rejected: the plan scans about {estimate:,} rows, over the limit of "
+                f"{self.max_scan_rows:,}. {_RETRY_HINT}"
+            )
+
+    # Deadlines and read-only sessions
+
+    def arm(self, dbapi_connection, dialect: str):
+        """Make the connection read-only and start this statement's deadline."""
+        if dialect == 'sqlite':
+            deadline = time.monotonic() + self.timeout if self.timeout else None
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only = ON")
+            cursor.close()
+            if deadline is not None:
+                # A non-zero return from the handler interrupts the running statement
+                dbapi_connection.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+        elif dialect == 'postgresql':
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET LOCAL transaction_read_only = on")
+            cursor.execute(f"SET LOCAL statement_timeout = {int(self.timeout * 1000)}")
+            cursor.close()
+        elif dialect == 'mysql':
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET SESSION TRANSACTION READ ONLY")
+            cursor.execute(f"SET SESSION max_execution_time = {int(self.timeout * 1000)}")
+            cursor.close()
+
+    @staticmethod
+    def disarm(dbapi_connection, dialect: str):
+        """Undo arm() before a connection goes back to the pool (Postgres settings end with the transaction)."""
+        if dialect == 'sqlite':
+            dbapi_connection.set_progress_handler(None, 0)
+            cursor = dbapi_connection.cursor()
+            cursor.execute("PRAGMA query_only = OFF")
+            cursor.close()
+        elif dialect == 'mysql':
+            cursor = dbapi_connection.cursor()
+            cursor.execute("SET SESSION TRANSACTION READ WRITE")
+            cursor.execute("SET SESSION max_execution_time = DEFAULT")
+            cursor.close()
+
+    def timeout_error(self) -> QueryTimeoutError:
+        self.timeouts += 1
+        return QueryTimeoutError(f"Query aborted after {self.timeout:g}s. {_RETRY_HINT}")
+
+    def stats(self) -> Dict:
+        return {
+            "timeout": self.timeout,
+            "max_scan_rows": self.max_scan_rows,
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+        }
+
+
+def _guard_for(context) -> Optional[QueryGuard]:
+    """The guard of a text() statement executed with the query_guard option, if any."""
+    if context is None or context.compiled is None:
+        return None
+    if not isinstance(context.compiled.statement, TextClause):
+        return None
+    return context.execution_options.get('query_guard')
+
+
+def install_guard(engine: Engine):
+    """
+    Register the guard hooks on an engine. They only act on text()
+    statements executed with the query_guard execution option, so schema
+    reflection and other internal queries run unguarded.
+    """
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        guard = _guard_for(context)
+        if guard is None:
+            return
+        check_read_only(statement)
+        dialect = conn.dialect.name
+        dbapi_connection = conn.connection.dbapi_connection
+        words = _words(statement)
+        if words[:1] != ['EXPLAIN']:
+            guard.check_plan(dbapi_connection, dialect, str(conn.engine.url), statement, parameters)
+        guard.arm(dbapi_connection, dialect)
+        conn.connection.info['query_guard_armed'] = dialect
+
+    @event.listens_for(engine, 'handle_error')
+    def handle_error(context):
+        guard = _guard_for(context.execution_context)
+        if guard is not None and is_timeout_error(context.original_exception):
+            return guard.timeout_error()
+
+    @event.listens_for(engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        dialect = connection_record.info.pop('query_guard_armed', None)
+        if dialect is not None and dbapi_connection is not None:
+            try:
+                QueryGuard.disarm(dbapi_connection, dialect)
+            except Exception as e:
+                logger.warning(f"Could not reset guarded connection: {e}")
+
+
+def guarded(engine: Engine, guard: QueryGuard) -> Engine:
+    """A view of the engine (same pool) whose text() statements are checked and limited by guard."""
+    return engine.execution_options(query_guard=guard)
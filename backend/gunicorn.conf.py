@@ -0,0 +1,51 @@
+"""
+gunicorn settings for serving SmartSQL in production:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import os
+import sys
+import glob
+import tempfile
+import multiprocessing
+
+bind = os.getenv('GUNICORN_BIND', f"0.0.0.0:{os.getenv('PORT', '5000')}")
+workers = int(os.getenv('WEB_CONCURRENCY', min(4, multiprocessing.cpu_count())))
+# Requests mostly wait on the LLM and the database, so each worker serves several at once on threads
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', 8))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+# Import and warm the app once in the master; workers inherit it copy-on-write
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+# Workers write their metrics here so /api/metrics reports totals over all of them; set before the app is imported
+metrics_dir = os.environ.setdefault('METRICS_MULTIPROC_DIR', tempfile.mkdtemp(prefix='smartsql-metrics-'))
+
+
+def on_starting(server):
+    # Counts left by a previous server would be added to this one's
+    for path in glob.glob(os.path.join(metrics_dir, 'worker_*.json*')):
+        os.remove(path)
+
+
+def pre_fork(server, worker):
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is not None:
+        wsgi.before_fork()
+
+
+def post_fork(server, worker):
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is not None:
+        wsgi.after_fork()
+
+
+def post_worker_init(worker):
+    from metrics import STARTUP, process_memory, start_snapshot_writer
+    start_snapshot_writer()
+    worker.log.info(f"Worker {worker.pid} ready, startup {STARTUP}, memory {process_memory()}")
+
+
+def worker_exit(server, worker):
+    from metrics import write_snapshot
+    write_snapshot()
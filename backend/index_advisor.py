@@ -0,0 +1,805 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.sql.elements import TextClause
+from guardrails import is_read_only
+
+logger = logging.getLogger(__name__)
+
+WORKLOAD_ENABLED = os.getenv('WORKLOAD_ENABLED', 'true').lower() == 'true'
+# SQLite file shared by all workers; empty keeps the workload in memory
+WORKLOAD_PATH = os.getenv('WORKLOAD_PATH', 'workload.db')
+WORKLOAD_FLUSH_INTERVAL = float(os.getenv('WORKLOAD_FLUSH_INTERVAL', 5))
+WORKLOAD_MAX_STATEMENTS = int(os.getenv('WORKLOAD_MAX_STATEMENTS', 5000))
+
+# How many of the most expensive statements to EXPLAIN per analysis
+INDEX_ADVISOR_TOP_STATEMENTS = int(os.getenv('INDEX_ADVISOR_TOP_STATEMENTS', 50))
+# Scans of smaller tables are cheap enough not to need an index
+INDEX_ADVISOR_MIN_ROWS = int(os.getenv('INDEX_ADVISOR_MIN_ROWS', 1000))
+# Index columns at most; the other columns a query reads are appended to make it covering within this limit
+INDEX_ADVISOR_MAX_COLUMNS = int(os.getenv('INDEX_ADVISOR_MAX_COLUMNS', 5))
+INDEX_ADVISOR_AUTO_APPLY = os.getenv('INDEX_ADVISOR_AUTO_APPLY', 'false').lower() == 'true'
+INDEX_ADVISOR_INTERVAL = float(os.getenv('INDEX_ADVISOR_INTERVAL', 600))
+INDEX_ADVISOR_MIN_CALLS = int(os.getenv('INDEX_ADVISOR_MIN_CALLS', 5))
+INDEX_ADVISOR_MIN_SAVED_MS = float(os.getenv('INDEX_ADVISOR_MIN_SAVED_MS', 500))
+INDEX_ADVISOR_MAX_AUTO_INDEXES = int(os.getenv('INDEX_ADVISOR_MAX_AUTO_INDEXES', 10))
+# Rows read to estimate a column's distinct values when the planner has no statistics for it
+INDEX_ADVISOR_SAMPLE_ROWS = int(os.getenv('INDEX_ADVISOR_SAMPLE_ROWS', 10000))
+
+# Fraction of rows a range predicate is assumed to keep (PostgreSQL's default inequality selectivity)
+RANGE_SELECTIVITY = 1 / 3
+
+# A column's distinct values as the planner last measured them (ANALYZE); PostgreSQL gives negatives as a fraction
+_DISTINCT_QUERIES = {
+    'postgresql': "SELECT n_distinct FROM pg_stats "
+                  "WHERE schemaname = current_schema() AND tablename = :table AND attname = :column",
+    'mysql': "SELECT MAX(CARDINALITY) FROM information_schema.STATISTICS "
+             "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column AND SEQ_IN_INDEX = 1",
+}
+
+_TOKEN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|$))
+  | (?P<string>'(?:[^']|'')*'?)
+  | (?P<number>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)
+  | (?P<name>"(?:[^"]|"")*"|`[^`]*`|\[[^\]]*\]|[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<operator><=|>=|<>|!=|==|[=<>])
+  | (?P<other>.)
+""", re.VERBOSE | re.DOTALL)
+
+_KEYWORDS = {
+    'ALL', 'AND', 'AS', 'ASC', 'BETWEEN', 'BY', 'CASE', 'CROSS', 'DESC', 'DISTINCT', 'ELSE', 'END', 'EXCEPT',
+    'EXISTS', 'FROM', 'FULL', 'GROUP', 'HAVING', 'IN', 'INNER', 'INTERSECT', 'IS', 'JOIN', 'LEFT', 'LIKE', 'LIMIT',
+    'NATURAL', 'NOT', 'NULL', 'OFFSET', 'ON', 'OR', 'ORDER', 'OUTER', 'RIGHT', 'SELECT', 'THEN', 'UNION', 'USING',
+    'WHEN', 'WHERE', 'WITH', 'ILIKE', 'GLOB',
+}
+_EQUALITY = {'=', '==', 'IN', 'IS'}
+_RANGE = {'<', '>', '<=', '>=', 'BETWEEN', 'LIKE', 'GLOB'}
+
+
+def _tokens(sql: str) -> List[Tuple[str, str]]:
+    return [(match.lastgroup, match.group()) for match in _TOKEN.finditer(sql)
+            if match.lastgroup not in ('space', 'comment')]
+
+
+def _unquote(name: str) -> str:
+    if name[:1] in ('"', '`', '['):
+        return name[1:-1]
+    return name
+
+
+def normalize_sql(sql: str) -> str:
+    """The statement with literals replaced by ? and IN lists collapsed, so repeats of one pattern match."""
+    parts = []
+    for kind, value in _tokens(sql):
+        parts.append('?' if kind in ('string', 'number') else value)
+    template = re.sub(r'\s*\.\s*', '.', " ".join(parts))
+    template = re.sub(r'\(\s+', '(', re.sub(r'\s+([,)])', r'\1', template))
+    template = re.sub(r'\?(?:\s*,\s*\?)+', '?', template)
+    return re.sub(r'\s*;\s*$', '', template)
+
+
+def explainable_sql(template: str, dialect: str) -> Tuple[str, Tuple]:
+    """
+    A normalized statement and parameters its dialect can EXPLAIN without
+    the original literals: SQLite binds NULLs, PostgreSQL plans a generic
+    plan over $n parameters (version 16 and later), and MySQL, which cannot
+    EXPLAIN placeholders, gets '0' for each value and 1 for LIMIT.
+    """
+    placeholders = sum(1 for _, value in _tokens(template) if value == '?')
+    if not placeholders:
+        return template, ()
+    if dialect == 'sqlite':
+        return template, (None,) * placeholders
+    if dialect == 'postgresql':
+        numbers = iter(range(1, placeholders + 1))
+        return re.sub(r'\?', lambda match: f"${next(numbers)}", template), ()
+    if dialect == 'mysql':
+        template = re.sub(r'\b(LIMIT|OFFSET)\s+\?(?:\s*,\s*\?)?', lambda match: match.group(0).replace('?', '1'),
+                          template, flags=re.IGNORECASE)
+        return template.replace('?', "'0'"), ()
+    return template, ()
+
+
+def estimate_distinct(sampled: int, distinct: int, singletons: int, rows: int) -> int:
+    """
+    Distinct values of a column from a sample of it (Haas and Stokes' Duj1,
+    as PostgreSQL's ANALYZE estimates them): values seen once in the sample
+    suggest more that were not seen.
+    """
+    if sampled >= rows or singletons == 0:
+        return max(1, distinct)
+    estimate = sampled * distinct / (sampled - singletons + singletons * sampled / rows)
+    return max(1, distinct, min(rows, int(estimate)))
+
+
+def workload_key(engine: Engine) -> str:
+    return engine.url.render_as_string(hide_password=True)
+
+
+def column_usage(sql: str) -> Tuple[Dict[str, str], List[Tuple[Optional[str], str, str]]]:
+    """
+    Tables in FROM/JOIN clauses by upper-cased alias and name, and every
+    column reference as (qualifier, column, role). The role is 'eq' or
+    'range' for a comparison with a value, 'join' for an equality between
+    two columns, 'order' in GROUP BY/ORDER BY and 'other' anywhere else; a
+    selected * is reported as column '*'.
+    """
+    tokens = _tokens(sql)
+    words = [value.upper() if kind == 'name' else value for kind, value in tokens]
+
+    def is_name(position: int) -> bool:
+        return 0 <= position < len(tokens) and tokens[position][0] == 'name' and words[position] not in _KEYWORDS
+
+    tables: Dict[str, str] = {}
+    refs: List[Tuple[Optional[str], str, str]] = []
+    clause = None
+    i = 0
+    while i < len(tokens):
+        kind, value = tokens[i]
+        word = words[i]
+        if word in ('FROM', 'JOIN') or (value == ',' and clause == 'from'):
+            clause = 'from'
+            if is_name(i + 1):
+                i += 1
+                table = _unquote(tokens[i][1])
+                tables.setdefault(table.upper(), table)
+                if words[i + 1:i + 2] == ['AS']:
+                    i += 1
+                if is_name(i + 1):
+                    i += 1
+                    tables[_unquote(tokens[i][1]).upper()] = table
+        elif word in ('SELECT', 'WHERE', 'ON', 'HAVING', 'LIMIT', 'OFFSET'):
+            clause = {'SELECT': 'select', 'WHERE': 'filter', 'ON': 'filter'}.get(word, 'other')
+        elif word in ('GROUP', 'ORDER') and words[i + 1:i + 2] == ['BY']:
+            clause = 'order'
+        elif value == '*' and clause == 'select' and i > 0 and words[i - 1] in ('SELECT', 'DISTINCT', ',', '.'):
+            qualifier = _unquote(tokens[i - 2][1]).upper() if words[i - 1] == '.' else None
+            refs.append((qualifier, '*', 'other'))
+        elif is_name(i) and clause not in (None, 'from'):
+            start = i
+            qualifier = None
+            column = _unquote(value)
+            if i + 2 < len(tokens) and tokens[i + 1][1] == '.' and tokens[i + 2][0] == 'name':
+                qualifier, column = column.upper(), _unquote(tokens[i + 2][1])
+                i += 2
+            # Function calls and output aliases are not column references
+            if words[i + 1:i + 2] == ['('] or (start > 0 and words[start - 1] == 'AS'):
+                i += 1
+                continue
+            role = 'other'
+            if clause == 'order':
+                role = 'order'
+            elif clause == 'filter':
+                after = words[i + 1] if i + 1 < len(words) else ''
+                before = words[start - 1] if start > 0 else ''
+                if after in _EQUALITY or after in _RANGE:
+                    operator, other_side = after, i + 2
+                elif before in _EQUALITY or before in _RANGE:
+                    operator, other_side = before, start - 2
+                else:
+                    operator, other_side = None, -1
+                if operator in ('=', '==') and is_name(other_side):
+                    role = 'join'
+                elif operator is not None:
+                    role = 'eq' if operator in _EQUALITY else 'range'
+            refs.append((qualifier, column, role))
+        i += 1
+    return tables, refs
+
+
+class WorkloadStore:
+    """
+    Executed free-form SQL aggregated by normalized statement: calls, total
+    and worst latency. Only the normalized template is kept, never the
+    literals or parameters, which can hold personal data. Calls are
+    buffered in memory and written out every flush_interval seconds by a
+    background thread, so requests never wait on the SQLite file.
+    """
+
+    def __init__(self, path: Optional[str] = WORKLOAD_PATH or None, flush_interval: float = WORKLOAD_FLUSH_INTERVAL,
+                 max_statements: int = WORKLOAD_MAX_STATEMENTS):
+        self.path = path or ':memory:'
+        self.flush_interval = flush_interval
+        self.max_statements = max_statements
+        self.recorded = 0
+        self._pending: Dict[Tuple[str, str], List] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._flusher_pid: Optional[int] = None
+        self._connection()
+
+    def _connection(self) -> sqlite3.Connection:
+        """The SQLite file, opened on first use (and again after close())."""
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(workload)")]
+            if 'statement' in columns:
+                # Files written before templates-only held each statement's literals and parameters
+                conn.execute("DROP TABLE workload")
+                logger.info(f"Workload: dropped statements stored with their literals in {self.path}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS workload (
+                    database_url TEXT,
+                    fingerprint TEXT,
+                    template TEXT,
+                    calls INTEGER,
+                    total_ms REAL,
+                    max_ms REAL,
+                    first_seen REAL,
+                    last_seen REAL,
+                    PRIMARY KEY (database_url, fingerprint)
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS advisor_indexes (
+                    database_url TEXT,
+                    name TEXT,
+                    table_name TEXT,
+                    columns TEXT,
+                    estimated_saved_ms REAL,
+                    created_at REAL,
+                    automatic INTEGER,
+                    PRIMARY KEY (database_url, name)
+                )
+            """)
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Flush and close the SQLite file, e.g. before forking workers; the next call reopens it."""
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def record(self, database_url: str, statement: str, seconds: float):
+        template = normalize_sql(statement)
+        key = (database_url, hashlib.sha256(template.encode('utf-8')).hexdigest()[:16])
+        ms = seconds * 1000
+        now = time.time()
+        with self._lock:
+            self.recorded += 1
+            entry = self._pending.get(key)
+            if entry is None:
+                self._pending[key] = [template, 1, ms, ms, now]
+            else:
+                entry[1] += 1
+                entry[2] += ms
+                entry[3] = max(entry[3], ms)
+                entry[4] = now
+        if self._flusher_pid != os.getpid():
+            self._start_flusher()
+
+    def _start_flusher(self):
+        """Start this process's flush thread; threads do not survive a fork, so each worker starts its own."""
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(max(self.flush_interval, 0.1))
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"Could not flush workload statements: {e}")
+
+        threading.Thread(target=run, name='workload-flush', daemon=True).start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending:
+                return
+            conn = self._connection()
+            conn.executemany("""
+                INSERT INTO workload VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (database_url, fingerprint) DO UPDATE SET
+                    calls = calls + excluded.calls,
+                    total_ms = total_ms + excluded.total_ms,
+                    max_ms = MAX(max_ms, excluded.max_ms),
+                    last_seen = excluded.last_seen
+            """, [
+                (url, fingerprint, template, calls, total, worst, seen, seen)
+                for (url, fingerprint), (template, calls, total, worst, seen) in pending.items()
+            ])
+            conn.execute("""
+                DELETE FROM workload WHERE rowid IN (
+                    SELECT rowid FROM workload ORDER BY last_seen DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_statements,))
+            conn.commit()
+
+    def top(self, database_url: str, limit: int = INDEX_ADVISOR_TOP_STATEMENTS) -> List[Dict]:
+        """The statements with the most total time, most expensive first."""
+        self.flush()
+        with self._lock:
+            rows = self._connection().execute("""
+                SELECT fingerprint, template, calls, total_ms, max_ms, last_seen
+                FROM workload WHERE database_url = ? ORDER BY total_ms DESC LIMIT ?
+            """, (database_url, limit)).fetchall()
+        return [{
+            "fingerprint": fingerprint,
+            "template": template,
+            "calls": calls,
+            "total_ms": round(total_ms, 3),
+            "avg_ms": round(total_ms / calls, 3),
+            "max_ms": round(max_ms, 3),
+            "last_seen": last_seen,
+        } for fingerprint, template, calls, total_ms, max_ms, last_seen in rows]
+
+    def clear(self, database_url: str):
+        with self._lock:
+            self._pending = {key: entry for key, entry in self._pending.items() if key[0] != database_url}
+            conn = self._connection()
+            conn.execute("DELETE FROM workload WHERE database_url = ?", (database_url,))
+            conn.commit()
+
+    def add_index(self, database_url: str, recommendation: Dict, automatic: bool):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("INSERT OR REPLACE INTO advisor_indexes VALUES (?, ?, ?, ?, ?, ?, ?)", (
+                database_url, recommendation["name"], recommendation["table_name"],
+                json.dumps(recommendation["columns"]), recommendation["estimated_saved_ms"], time.time(),
+                int(automatic)))
+            conn.commit()
+
+    def indexes(self, database_url: str) -> List[Dict]:
+        """Indexes the advisor has created on this database."""
+        with self._lock:
+            rows = self._connection().execute("""
+                SELECT name, table_name, columns, estimated_saved_ms, created_at, automatic
+                FROM advisor_indexes WHERE database_url = ? ORDER BY created_at
+            """, (database_url,)).fetchall()
+        return [{"name": name, "table_name": table, "columns": json.loads(columns),
+                 "estimated_saved_ms": saved, "created_at": created_at, "automatic": bool(automatic)}
+                for name, table, columns, saved, created_at, automatic in rows]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            statements = self._connection().execute("SELECT COUNT(*) FROM workload").fetchone()[0]
+            pending = sum(entry[1] for entry in self._pending.values())
+        return {"recorded": self.recorded, "statements": statements, "pending": pending,
+                "persistent": self.path != ':memory:'}
+
+
+def install_workload_recorder(engine: Engine, store: WorkloadStore):
+    """
+    Time text() statements executed with the query_guard option, i.e. the
+    generated and user-supplied SQL, and add them to the workload store.
+    Schema introspection and other internal queries are not recorded. A
+    statement that wraps a user's query (result paging) names that query
+    in the workload_statement option, and is recorded as it, or not at all
+    when the option is False.
+    """
+    database_url = workload_key(engine)
+
+    def recorded(context) -> bool:
+        return (context is not None and context.compiled is not None
+                and isinstance(context.compiled.statement, TextClause)
+                and context.execution_options.get('query_guard') is not None
+                and context.execution_options.get('workload_statement') is not False)
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if recorded(context):
+            context._workload_started = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_workload_started', None)
+        if started is None or statement.lstrip()[:7].upper() == 'EXPLAIN':
+            return
+        recorded_as = context.execution_options.get('workload_statement')
+        if recorded_as is not None:
+            statement = recorded_as
+        try:
+            store.record(database_url, statement, time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Could not record workload statement: {e}")
+
+
+_workload_store: Optional[WorkloadStore] = None
+_workload_lock = threading.Lock()
+
+
+def get_workload_store() -> Optional[WorkloadStore]:
+    """Process-wide workload store, or None when WORKLOAD_ENABLED is false."""
+    global _workload_store
+    if WORKLOAD_ENABLED and _workload_store is None:
+        with _workload_lock:
+            if _workload_store is None:
+                _workload_store = WorkloadStore()
+    return _workload_store
+
+
+class IndexAdvisor:
+    """
+    Recommends indexes for the recorded workload of one database: each of
+    the most expensive statements is EXPLAINed, and every full table scan
+    (or SQLite automatic index) is turned into an index on the columns the
+    statement filters that table by, equality columns first, then one range
+    column, then the columns it reads, to make the index covering.
+    """
+
+    def __init__(self, engine: Engine, store: WorkloadStore, min_rows: int = INDEX_ADVISOR_MIN_ROWS,
+                 max_columns: int = INDEX_ADVISOR_MAX_COLUMNS, auto_apply: bool = INDEX_ADVISOR_AUTO_APPLY,
+                 interval: float = INDEX_ADVISOR_INTERVAL):
+        self.engine = engine
+        self.store = store
+        self.database_url = workload_key(engine)
+        self.min_rows = min_rows
+        self.max_columns = max_columns
+        self.auto_apply = auto_apply
+        self.interval = interval
+        self.last_run: Optional[Dict] = None
+        self._checked_at = time.monotonic()
+        self._run_lock = threading.Lock()
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    # Plans
+
+    def _scans(self, conn, template: str) -> List[Dict]:
+        """
+        Tables the plan of a normalized statement reads in full, in plan
+        order, as {alias, position, columns} where columns is set for a
+        SQLite automatic index.
+        """
+        dialect = self.engine.dialect.name
+        statement, parameters = explainable_sql(template, dialect)
+        cursor = conn.connection.dbapi_connection.cursor()
+        scans = []
+        try:
+            if dialect == 'sqlite':
+                cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+                for position, row in enumerate(cursor.fetchall()):
+                    detail = row[-1]
+                    automatic = re.match(r'SEARCH (\S+) USING AUTOMATIC (?:COVERING |PARTIAL )*INDEX \((.*)\)', detail)
+                    if automatic:
+                        terms = re.findall(r'(\w+)(=|>|<|>=|<=)\?', automatic.group(2))
+                        scans.append({"alias": automatic.group(1), "position": position,
+                                      "columns": [(column, 'eq' if op == '=' else 'range') for column, op in terms]})
+                        continue
+                    scan = re.match(r'SCAN (?:TABLE )?(\S+)(?: AS (\S+))?(.*)', detail)
+                    if scan and 'USING' not in scan.group(3) and not scan.group(1).startswith('('):
+                        scans.append({"alias": scan.group(2) or scan.group(1), "position": position})
+            elif dialect == 'postgresql':
+                options = "FORMAT JSON, GENERIC_PLAN" if statement != template else "FORMAT JSON"
+                cursor.execute(f"EXPLAIN ({options}) {statement}")
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                stack = [plan[0]['Plan']]
+                while stack:
+                    node = stack.pop()
+                    if node.get('Node Type') == 'Seq Scan' and node.get('Filter'):
+                        scans.append({"alias": node.get('Alias') or node['Relation Name'], "position": 0})
+                    stack.extend(node.get('Plans', []))
+            elif dialect == 'mysql':
+                cursor.execute(f"EXPLAIN {statement}")
+                columns = [column[0].lower() for column in cursor.description]
+                for position, row in enumerate(cursor.fetchall()):
+                    row = dict(zip(columns, row))
+                    if row.get('type') == 'ALL' and row.get('table'):
+                        scans.append({"alias": row['table'], "position": position})
+        finally:
+            cursor.close()
+        return scans
+
+    # Table statistics, cached for one analysis
+
+    def _table_info(self, conn, cache: Dict, table: str) -> Dict:
+        if table not in cache:
+            inspector = inspect(conn)
+            columns = {column['name'].upper(): column['name'] for column in inspector.get_columns(table)}
+            table_indexes = inspector.get_indexes(table)
+            indexes = [[name.upper() for name in index['column_names'] if name] for index in table_indexes]
+            # Index names by leading column, to read SQLite's per-index statistics
+            leading: Dict[str, List[str]] = {}
+            for index in table_indexes:
+                if index['column_names'] and index['column_names'][0] and index.get('name'):
+                    leading.setdefault(index['column_names'][0].upper(), []).append(index['name'])
+            primary_key = inspector.get_pk_constraint(table).get('constrained_columns') or []
+            if primary_key:
+                indexes.append([name.upper() for name in primary_key])
+            quoted = self._quote(table)
+            if self.engine.dialect.name == 'sqlite':
+                try:
+                    rows = conn.execute(text(f"SELECT MAX(_rowid_) FROM {quoted}")).scalar() or 0
+                except Exception:
+                    rows = conn.execute(text(f"SELECT COUNT(*) FROM {quoted}")).scalar()
+            elif self.engine.dialect.name == 'postgresql':
+                rows = conn.execute(text("SELECT reltuples::bigint FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+                                    {"t": table}).scalar() or 0
+            elif self.engine.dialect.name == 'mysql':
+                rows = conn.execute(text("SELECT TABLE_ROWS FROM information_schema.TABLES "
+                                         "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t"),
+                                    {"t": table}).scalar() or 0
+            else:
+                rows = conn.execute(text(f"SELECT COUNT(*) FROM {quoted}")).scalar()
+            cache[table] = {"columns": columns, "indexes": indexes, "leading": leading, "rows": max(0, int(rows)),
+                            "distinct": {}}
+        return cache[table]
+
+    def _planner_distinct(self, conn, info: Dict, table: str, column: str) -> Optional[int]:
+        """The column's distinct values from the planner's statistics, if it has gathered any."""
+        dialect = self.engine.dialect.name
+        try:
+            if dialect == 'sqlite':
+                # sqlite_stat1 ("rows rows-per-key ...") exists after ANALYZE, for indexed columns only
+                for index in info["leading"].get(column.upper(), []):
+                    stat = conn.execute(text("SELECT stat FROM sqlite_stat1 WHERE tbl = :table AND idx = :index"),
+                                        {"table": table, "index": index}).scalar()
+                    if stat:
+                        total, per_key = (int(part) for part in stat.split()[:2])
+                        return max(1, round(total / max(1, per_key)))
+                return None
+            query = _DISTINCT_QUERIES.get(dialect)
+            if query is None:
+                return None
+            value = conn.execute(text(query), {"table": table, "column": column}).scalar()
+        except Exception as e:
+            logger.info(f"No planner statistics for {table}.{column}: {e}")
+            return None
+        if not value:
+            return None
+        value = float(value)
+        return max(1, int(-value * info["rows"] if value < 0 else value))
+
+    def _distinct(self, conn, info: Dict, table: str, column: str) -> int:
+        """Distinct values of a column: planner statistics, else an estimate from a sample of its rows."""
+        if column not in info["distinct"]:
+            distinct = self._planner_distinct(conn, info, table, column)
+            if distinct is None:
+                distinct, sampled, singletons = conn.execute(text(
+                    f"SELECT COUNT(*), COALESCE(SUM(k), 0), SUM(CASE WHEN k = 1 THEN 1 ELSE 0 END) FROM ("
+                    f"SELECT COUNT(*) AS k FROM (SELECT {self._quote(column)} AS v FROM {self._quote(table)} "
+                    f"LIMIT {INDEX_ADVISOR_SAMPLE_ROWS}) sample GROUP BY v) value_counts")).one()
+                distinct = estimate_distinct(sampled, distinct, singletons or 0, max(info["rows"], sampled))
+            info["distinct"][column] = distinct
+        return info["distinct"][column]
+
+    def _index_name(self, table: str, columns: Sequence[str]) -> str:
+        name = f"idx_advisor_{table}_{'_'.join(columns)}".lower()
+        if len(name) > 60:
+            name = f"{name[:51]}_{hashlib.sha256(name.encode('utf-8')).hexdigest()[:8]}"
+        return name
+
+    # Recommendations
+
+    def _candidate(self, conn, cache: Dict, statement: Dict, scan: Dict, tables: Dict[str, str],
+                   refs: List, scanned_rows: int) -> Optional[Dict]:
+        table = tables.get(scan["alias"].upper())
+        if table is None:
+            # A table inside a view or subquery: its columns cannot be told apart from the statement
+            return None
+        try:
+            info = self._table_info(conn, cache, table)
+        except Exception:
+            return None
+        if info["rows"] < self.min_rows:
+            return None
+        columns = info["columns"]
+        names = {alias for alias, name in tables.items() if name == table}
+        owners = {}
+        for name in set(tables.values()):
+            if name != table:
+                try:
+                    for column in self._table_info(conn, cache, name)["columns"]:
+                        owners.setdefault(column, name)
+                except Exception:
+                    pass
+        roles: Dict[str, Set[str]] = {}
+        star = False
+        for qualifier, column, role in refs:
+            column = column.upper()
+            if qualifier is not None and qualifier not in names:
+                continue
+            if column == '*':
+                star = True
+                continue
+            if column not in columns:
+                continue
+            if qualifier is None and column in owners:
+                continue
+            roles.setdefault(columns[column], set()).add(role)
+        if "columns" in scan:
+            # SQLite already builds this index for every run of the statement
+            terms = [(columns.get(column.upper(), column), role) for column, role in scan["columns"]]
+            equality = [column for column, role in terms if role == 'eq']
+            ranges = [column for column, role in terms if role == 'range']
+        else:
+            inner = scan["position"] > 0
+            equality = sorted(column for column, kinds in roles.items()
+                              if 'eq' in kinds or (inner and 'join' in kinds))
+            ranges = sorted(column for column, kinds in roles.items() if 'range' in kinds and column not in equality)
+        if not equality and not ranges:
+            return None
+        # Most selective equality columns first
+        distinct = {column: self._distinct(conn, info, table, column) for column in equality}
+        equality.sort(key=lambda column: -distinct[column])
+        key = equality + ranges[:1]
+        selectivity = 1.0
+        for column in equality:
+            selectivity /= max(1, distinct[column])
+        if ranges:
+            selectivity *= RANGE_SELECTIVITY
+        if any(index[:len(key)] == [column.upper() for column in key] for index in info["indexes"]):
+            return None
+        covering = key + sorted(column for column in roles if column not in key)
+        index_columns = covering if not star and len(covering) <= self.max_columns else key[:self.max_columns]
+        estimated_rows = max(1, int(info["rows"] * selectivity))
+        share = info["rows"] / max(1, scanned_rows)
+        saved = statement["total_ms"] * share * max(0.0, 1 - estimated_rows / max(1, info["rows"]))
+        return {
+            "name": self._index_name(table, index_columns),
+            "table_name": table,
+            "columns": index_columns,
+            "covering": index_columns == covering and len(covering) > len(key),
+            "ddl": f"CREATE INDEX {self._quote(self._index_name(table, index_columns))} ON {self._quote(table)} "
+                   f"({', '.join(self._quote(column) for column in index_columns)})",
+            "reason": "automatic index" if "columns" in scan else "full scan",
+            "table_rows": info["rows"],
+            "estimated_rows": estimated_rows,
+            "estimated_speedup": round(info["rows"] / estimated_rows, 1),
+            "estimated_saved_ms": round(saved, 3),
+            "calls": statement["calls"],
+            "statements": [statement["fingerprint"]],
+        }
+
+    def recommend(self, limit: int = INDEX_ADVISOR_TOP_STATEMENTS) -> List[Dict]:
+        """
+        Index recommendations for the most expensive recorded statements,
+        largest estimated saving first. estimated_saved_ms is the share of
+        the statements' recorded time spent scanning the table, scaled by
+        the fraction of rows the index would skip (equality columns assumed
+        independent and uniform, a range keeping a third of the rows).
+        """
+        candidates: Dict[Tuple[str, Tuple[str, ...]], Dict] = {}
+        cache: Dict = {}
+        with self.engine.connect() as conn:
+            # Views and CTEs cannot be indexed; names are matched case-insensitively, as unquoted SQL names are
+            actual = {name.upper(): name for name in inspect(conn).get_table_names()}
+            for statement in self.store.top(self.database_url, limit):
+                if not is_read_only(statement["template"]):
+                    continue
+                try:
+                    scans = self._scans(conn, statement["template"])
+                except Exception as e:
+                    logger.info(f"Could not explain workload statement {statement['fingerprint']}: {e}")
+                    continue
+                if not scans:
+                    continue
+                tables, refs = column_usage(statement["template"])
+                tables = {alias: actual[name.upper()] for alias, name in tables.items() if name.upper() in actual}
+                scanned_rows = 0
+                for scan in scans:
+                    table = tables.get(scan["alias"].upper())
+                    if table is not None:
+                        try:
+                            scanned_rows += self._table_info(conn, cache, table)["rows"]
+                        except Exception:
+                            pass
+                for scan in scans:
+                    try:
+                        candidate = self._candidate(conn, cache, statement, scan, tables, refs, scanned_rows)
+                    except Exception as e:
+                        logger.info(f"Could not analyze a scan of {scan['alias']}: {e}")
+                        continue
+                    if candidate is None:
+                        continue
+                    key = (candidate["table_name"], tuple(candidate["columns"]))
+                    if key in candidates:
+                        merged = candidates[key]
+                        merged["estimated_saved_ms"] = round(merged["estimated_saved_ms"]
+                                                             + candidate["estimated_saved_ms"], 3)
+                        merged["calls"] += candidate["calls"]
+                        merged["statements"] += candidate["statements"]
+                    else:
+                        candidates[key] = candidate
+        # An index whose columns start with another's serves that one's statements too
+        recommendations = sorted(candidates.values(), key=lambda item: -len(item["columns"]))
+        kept: List[Dict] = []
+        for candidate in recommendations:
+            wider = next((other for other in kept if other["table_name"] == candidate["table_name"]
+                          and other["columns"][:len(candidate["columns"])] == candidate["columns"]), None)
+            if wider is None:
+                kept.append(candidate)
+            else:
+                wider["estimated_saved_ms"] = round(wider["estimated_saved_ms"] + candidate["estimated_saved_ms"], 3)
+                wider["calls"] += candidate["calls"]
+                wider["statements"] += candidate["statements"]
+        kept.sort(key=lambda item: -item["estimated_saved_ms"])
+        return kept
+
+    def apply(self, recommendations: List[Dict], automatic: bool = False) -> List[Dict]:
+        """Create the recommended indexes and refresh the planner statistics of their tables."""
+        applied = []
+        dialect = self.engine.dialect.name
+        for recommendation in recommendations:
+            started = time.perf_counter()
+            try:
+                if dialect == 'postgresql':
+                    # Build without blocking writes; CONCURRENTLY cannot run inside a transaction
+                    ddl = recommendation["ddl"].replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY IF NOT EXISTS", 1)
+                    with self.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        conn.execute(text(ddl))
+                        conn.execute(text(f"ANALYZE {self._quote(recommendation['table_name'])}"))
+                else:
+                    with self.engine.begin() as conn:
+                        conn.execute(text(recommendation["ddl"]))
+                    if dialect in ('sqlite', 'mysql'):
+                        with self.engine.begin() as conn:
+                            statement = "ANALYZE" if dialect == 'sqlite' else "ANALYZE TABLE"
+                            conn.execute(text(f"{statement} {self._quote(recommendation['table_name'])}"))
+            except Exception as e:
+                logger.warning(f"Could not create index {recommendation['name']}: {e}")
+                applied.append({"name": recommendation["name"], "error": str(e)})
+                continue
+            self.store.add_index(self.database_url, recommendation, automatic)
+            seconds = round(time.perf_counter() - started, 3)
+            logger.info(f"Created index {recommendation['name']} on {recommendation['table_name']} "
+                        f"({', '.join(recommendation['columns'])}) in {seconds}s")
+            applied.append({"name": recommendation["name"], "seconds": seconds})
+        return applied
+
+    def run(self) -> Dict:
+        """Recommend, then create the recommendations that clear the auto-apply thresholds."""
+        started = time.perf_counter()
+        recommendations = self.recommend()
+        budget = INDEX_ADVISOR_MAX_AUTO_INDEXES - sum(
+            1 for index in self.store.indexes(self.database_url) if index["automatic"])
+        chosen = [recommendation for recommendation in recommendations
+                  if recommendation["calls"] >= INDEX_ADVISOR_MIN_CALLS
+                  and recommendation["estimated_saved_ms"] >= INDEX_ADVISOR_MIN_SAVED_MS][:max(0, budget)]
+        applied = self.apply(chosen, automatic=True) if chosen else []
+        self.last_run = {
+            "at": time.time(),
+            "recommendations": len(recommendations),
+            "applied": applied,
+            "ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        return self.last_run
+
+    def maybe_run(self):
+        """With auto_apply, run in a background thread at most every interval seconds."""
+        if not self.auto_apply:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.interval:
+            return
+        if not self._run_lock.acquire(blocking=False):
+            return
+        self._checked_at = now
+        threading.Thread(target=self._run_quietly, daemon=True).start()
+
+    def _run_quietly(self):
+        try:
+            self.run()
+        except Exception as e:
+            logger.warning(f"Index advisor run failed: {e}")
+        finally:
+            self._run_lock.release()
+
+    def status(self) -> Dict:
+        return {
+            "auto_apply": self.auto_apply,
+            "interval": self.interval,
+            "last_run": self.last_run,
+            "indexes": self.store.indexes(self.database_url),
+        }
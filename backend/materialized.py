@@ -0,0 +1,336 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Sequence
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated views to keep as indexed tables, e.g. MATERIALIZED_VIEWS=student_performance
+MATERIALIZED_VIEWS = [name.strip() for name in os.getenv('MATERIALIZED_VIEWS', '').split(',') if name.strip()]
+MATERIALIZED_AUTO_REFRESH = os.getenv('MATERIALIZED_AUTO_REFRESH', 'true').lower() == 'true'
+MATERIALIZED_CHECK_INTERVAL = float(os.getenv('MATERIALIZED_CHECK_INTERVAL', 5))
+
+STATE_TABLE = '_materialized_state'
+
+_STATE_DDL = f"""
+CREATE TABLE IF NOT EXISTS {STATE_TABLE} (
+    name VARCHAR(64) PRIMARY KEY,
+    definition VARCHAR(64),
+    watermark BIGINT,
+    dirty INTEGER NOT NULL DEFAULT 1,
+    refreshed_at FLOAT
+)
+"""
+
+_PG_MARK_DIRTY = f"""
+CREATE OR REPLACE FUNCTION _materialized_mark_dirty() RETURNS trigger AS $$
+BEGIN
+    UPDATE {STATE_TABLE} SET dirty = 1 WHERE name = TG_ARGV[0];
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+# Runs at commit (deferred), so a sequence value that commits after a refresh moved the watermark past it
+# is still caught; locking the state row makes a concurrent refresh finish first or wait for this commit
+_PG_MARK_DIRTY_BELOW_WATERMARK = f"""
+CREATE OR REPLACE FUNCTION _materialized_mark_dirty_below_watermark() RETURNS trigger AS $$
+DECLARE
+    mark BIGINT;
+BEGIN
+    SELECT watermark INTO mark FROM {STATE_TABLE} WHERE name = TG_ARGV[0] FOR UPDATE;
+    IF mark IS NOT NULL AND CAST(to_jsonb(NEW) ->> TG_ARGV[1] AS BIGINT) <= mark THEN
+        UPDATE {STATE_TABLE} SET dirty = 1 WHERE name = TG_ARGV[0];
+    END IF;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql
+"""
+
+
+class ViewDefinition:
+    """
+    A view rebuilt as a table. New rows of the fact table (found by its
+    increasing key) are appended incrementally; updates and deletes on any
+    base table mark the table dirty, and the next refresh rebuilds it.
+    """
+
+    def __init__(self, name: str, select: str, fact_table: str, fact_key: str, key_expression: str,
+                 tables: Sequence[str], indexes: Sequence[Sequence[str]] = ()):
+        self.name = name
+        self.table = f"{name}_mv"
+        self.select = select.strip()
+        self.fact_table = fact_table
+        self.fact_key = fact_key
+        self.key_expression = key_expression
+        self.tables = list(tables)
+        self.indexes = [list(columns) for columns in indexes]
+        self.index_names = [f"idx_{self.table}_{'_'.join(columns)}".lower() for columns in self.indexes]
+        self.digest = hashlib.sha256(
+            (self.select + repr(self.indexes)).encode('utf-8')).hexdigest()[:16]
+
+
+# The student_performance view from sqlite.py, plus the grade ID that drives incremental refresh
+DEFINITIONS = {
+    'student_performance': ViewDefinition(
+        name='student_performance',
+        select="""
+            SELECT
+                sg.ID AS GRADE_ID,
+                s.STUDENT_ID,
+                s.NAME AS STUDENT_NAME,
+                s.CLASS,
+                s.SECTION,
+                c.NAME AS COURSE_NAME,
+                c.DEPARTMENT,
+                sg.MARKS,
+                sg.GRADE,
+                t.NAME AS TEACHER_NAME
+            FROM STUDENT s
+            JOIN STUDENT_GRADES sg ON s.STUDENT_ID = sg.STUDENT_ID
+            JOIN COURSE c ON sg.COURSE_ID = c.COURSE_ID
+            JOIN TEACHER t ON c.TEACHER_ID = t.TEACHER_ID
+        """,
+        fact_table='STUDENT_GRADES',
+        fact_key='ID',
+        key_expression='sg.ID',
+        tables=['STUDENT', 'STUDENT_GRADES', 'COURSE', 'TEACHER'],
+        # Covering indexes for the usual per-student, per-course and per-class questions
+        indexes=[['STUDENT_ID'], ['COURSE_NAME', 'MARKS'], ['CLASS', 'SECTION', 'MARKS'], ['TEACHER_NAME']],
+    ),
+}
+
+
+class MaterializedViews:
+    """Creates, refreshes and reports on the materialized tables named in MATERIALIZED_VIEWS."""
+
+    def __init__(self, engine: Engine, names: Sequence[str] = MATERIALIZED_VIEWS,
+                 auto_refresh: bool = MATERIALIZED_AUTO_REFRESH, check_interval: float = MATERIALIZED_CHECK_INTERVAL):
+        self.engine = engine
+        self.names = list(names)
+        self.auto_refresh = auto_refresh
+        self.check_interval = check_interval
+        self.active: Dict[str, ViewDefinition] = {}
+        self.last_refresh: Dict[str, Dict] = {}
+        self._checked_at = 0.0
+        self._refresh_lock = threading.Lock()
+
+    def setup(self):
+        """Create the state table, the materialized tables and their change triggers."""
+        if not self.names:
+            return
+        inspector = inspect(self.engine)
+        existing = set(inspector.get_table_names()) | set(inspector.get_view_names())
+        for name in self.names:
+            definition = DEFINITIONS.get(name)
+            if definition is None:
+                logger.warning(f"No materialization is defined for view {name}; skipping it")
+                continue
+            missing = [table for table in definition.tables if table not in existing]
+            if missing:
+                logger.warning(f"Not materializing {name}: missing tables {missing}")
+                continue
+            try:
+                self._create(definition, definition.table in existing)
+                self.active[name] = definition
+                self.refresh(name)
+            except Exception as e:
+                logger.error(f"Could not materialize {name}: {e}")
+
+    def _create(self, definition: ViewDefinition, table_exists: bool):
+        dialect = self.engine.dialect.name
+        with self.engine.begin() as conn:
+            conn.execute(text(_STATE_DDL))
+            stored = conn.execute(text(f"SELECT definition FROM {STATE_TABLE} WHERE name = :name"),
+                                  {"name": definition.name}).scalar()
+            if not table_exists or stored != definition.digest:
+                # New or changed definition: start over with an empty table
+                conn.execute(text(f"DROP TABLE IF EXISTS {definition.table}"))
+                conn.execute(text(f"CREATE TABLE {definition.table} AS {definition.select} WHERE 1 = 0"))
+                self._create_indexes(conn, definition)
+                conn.execute(text(f"DELETE FROM {STATE_TABLE} WHERE name = :name"), {"name": definition.name})
+                conn.execute(text(f"INSERT INTO {STATE_TABLE} (name, definition, watermark, dirty) "
+                                  f"VALUES (:name, :definition, NULL, 1)"),
+                             {"name": definition.name, "definition": definition.digest})
+                logger.info(f"Created materialized table {definition.table} for view {definition.name}")
+            if dialect == 'sqlite':
+                self._sqlite_triggers(conn, definition)
+            elif dialect == 'postgresql':
+                self._postgres_triggers(conn, definition)
+            else:
+                logger.info(f"No change triggers on {dialect}: {definition.table} picks up new "
+                            f"{definition.fact_table} rows only; use a full refresh after updates or deletes")
+
+    @staticmethod
+    def _create_indexes(conn, definition: ViewDefinition):
+        for index, columns in zip(definition.index_names, definition.indexes):
+            conn.execute(text(f"CREATE INDEX {index} ON {definition.table} ({', '.join(columns)})"))
+
+    def _drop_indexes(self, conn, definition: ViewDefinition):
+        for index in definition.index_names:
+            if self.engine.dialect.name == 'mysql':
+                conn.execute(text(f"DROP INDEX {index} ON {definition.table}"))
+            else:
+                conn.execute(text(f"DROP INDEX IF EXISTS {index}"))
+
+    @staticmethod
+    def _sqlite_triggers(conn, definition: ViewDefinition):
+        mark_dirty = f"UPDATE {STATE_TABLE} SET dirty = 1 WHERE name = '{definition.name}';"
+        for table in definition.tables:
+            for event in ('UPDATE', 'DELETE'):
+                trigger = f"_mv_{definition.name}_{table}_{event}".lower()
+                conn.execute(text(f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER {event} ON {table} "
+                                  f"BEGIN {mark_dirty} END"))
+        # A fact row inserted below the watermark would never be picked up incrementally
+        trigger = f"_mv_{definition.name}_{definition.fact_table}_insert".lower()
+        conn.execute(text(
+            f"CREATE TRIGGER IF NOT EXISTS {trigger} AFTER INSERT ON {definition.fact_table} "
+            f"WHEN NEW.{definition.fact_key} <= (SELECT watermark FROM {STATE_TABLE} WHERE name = '{definition.name}') "
+            f"BEGIN {mark_dirty} END"))
+
+    @staticmethod
+    def _postgres_triggers(conn, definition: ViewDefinition):
+        conn.execute(text(_PG_MARK_DIRTY))
+        for table in definition.tables:
+            trigger = f"_mv_{definition.name}_{table}".lower()
+            conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {table}"))
+            conn.execute(text(f"CREATE TRIGGER {trigger} AFTER UPDATE OR DELETE OR TRUNCATE ON {table} "
+                              f"FOR EACH STATEMENT EXECUTE PROCEDURE _materialized_mark_dirty('{definition.name}')"))
+        # A fact row inserted below the watermark would never be picked up incrementally
+        conn.execute(text(_PG_MARK_DIRTY_BELOW_WATERMARK))
+        trigger = f"_mv_{definition.name}_{definition.fact_table}_insert".lower()
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {definition.fact_table}"))
+        # Unquoted names are folded to lower case, and to_jsonb(NEW) uses the folded column names
+        conn.execute(text(
+            f"CREATE CONSTRAINT TRIGGER {trigger} AFTER INSERT ON {definition.fact_table} "
+            f"DEFERRABLE INITIALLY DEFERRED FOR EACH ROW EXECUTE PROCEDURE "
+            f"_materialized_mark_dirty_below_watermark('{definition.name}', '{definition.fact_key.lower()}')"))
+
+    def _get(self, name: str) -> ViewDefinition:
+        if name not in self.active:
+            raise KeyError(f"View {name} is not materialized")
+        return self.active[name]
+
+    def refresh(self, name: str, full: bool = False) -> Dict:
+        """
+        Bring one materialized table up to date: append fact rows past the
+        watermark, or rebuild it if it is dirty or full=True.
+        """
+        definition = self._get(name)
+        started = time.perf_counter()
+        with self.engine.begin() as conn:
+            # Lock the state row first, so refreshes from other workers and trigger updates queue behind us
+            conn.execute(text(f"UPDATE {STATE_TABLE} SET dirty = dirty WHERE name = :name"), {"name": name})
+            watermark, dirty = conn.execute(text(f"SELECT watermark, dirty FROM {STATE_TABLE} WHERE name = :name"),
+                                            {"name": name}).one()
+            high = conn.execute(text(
+                f"SELECT MAX({definition.fact_key}) FROM {definition.fact_table}")).scalar()
+            rows = 0
+            if full or dirty or watermark is None:
+                mode = 'full'
+                # Reloading without the indexes and building them afterwards is much faster
+                self._drop_indexes(conn, definition)
+                conn.execute(text(f"DELETE FROM {definition.table}"))
+                if high is not None:
+                    rows = conn.execute(text(
+                        f"INSERT INTO {definition.table} {definition.select} "
+                        f"WHERE {definition.key_expression} <= :high"), {"high": high}).rowcount
+                self._create_indexes(conn, definition)
+            elif high is not None and high > watermark:
+                mode = 'incremental'
+                rows = conn.execute(text(
+                    f"INSERT INTO {definition.table} {definition.select} "
+                    f"WHERE {definition.key_expression} > :low AND {definition.key_expression} <= :high"),
+                    {"low": watermark, "high": high}).rowcount
+            else:
+                mode = 'none'
+                high = watermark
+            conn.execute(text(f"UPDATE {STATE_TABLE} SET watermark = :high, dirty = 0, refreshed_at = :now "
+                              f"WHERE name = :name"), {"high": high, "now": time.time(), "name": name})
+        result = {"view": name, "table": definition.table, "mode": mode, "rows": rows,
+                  "ms": round((time.perf_counter() - started) * 1000, 3)}
+        self.last_refresh[name] = result
+        if mode != 'none':
+            logger.info(f"Refreshed {definition.table}: {result}")
+        return result
+
+    def refresh_all(self, full: bool = False) -> List[Dict]:
+        return [self.refresh(name, full) for name in list(self.active)]
+
+    def status(self, name: str) -> Dict:
+        """Watermarks and staleness of one materialized table."""
+        definition = self._get(name)
+        with self.engine.connect() as conn:
+            watermark, dirty, refreshed_at = conn.execute(text(
+                f"SELECT watermark, dirty, refreshed_at FROM {STATE_TABLE} WHERE name = :name"),
+                {"name": name}).one()
+            high = conn.execute(text(
+                f"SELECT MAX({definition.fact_key}) FROM {definition.fact_table}")).scalar()
+            pending = 0
+            if high is not None and (watermark is None or high > watermark):
+                pending = conn.execute(text(
+                    f"SELECT COUNT(*) FROM {definition.fact_table} WHERE {definition.fact_key} > :low"),
+                    {"low": watermark if watermark is not None else -1}).scalar()
+        return {
+            "view": name,
+            "table": definition.table,
+            "watermark": watermark,
+            "source_watermark": high,
+            "pending_rows": pending,
+            "dirty": bool(dirty),
+            "stale": bool(dirty) or pending > 0,
+            "refreshed_at": refreshed_at,
+            "age_seconds": round(time.time() - refreshed_at, 3) if refreshed_at else None,
+            "last_refresh": self.last_refresh.get(name),
+        }
+
+    def status_all(self) -> List[Dict]:
+        return [self.status(name) for name in list(self.active)]
+
+    def maybe_refresh(self):
+        """
+        Refresh stale tables in a background thread, checking at most every
+        check_interval seconds. Readers never wait: until the refresh commits
+        they see the previous, consistent contents.
+        """
+        if not self.active or not self.auto_refresh:
+            return
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval:
+            return
+        if not self._refresh_lock.acquire(blocking=False):
+            return
+        self._checked_at = now
+        threading.Thread(target=self._refresh_stale, daemon=True).start()
+
+    def _refresh_stale(self):
+        try:
+            for name in list(self.active):
+                if self.status(name)["stale"]:
+                    self.refresh(name)
+        except Exception as e:
+            logger.warning(f"Materialized view refresh failed: {e}")
+        finally:
+            self._refresh_lock.release()
+
+    def hidden_tables(self) -> List[str]:
+        """Bookkeeping tables the LLM should not see."""
+        return [STATE_TABLE] if self.active else []
+
+    def overlay(self, schema_info: Dict) -> Dict:
+        """
+        Advertise each materialized table in place of its view, so generated
+        SQL reads the indexed table instead of re-running the join.
+        """
+        if not self.active:
+            return schema_info
+        hidden = set(self.hidden_tables()) | set(self.active)
+        overlaid = {name: info for name, info in schema_info.items() if name not in hidden}
+        for name, definition in self.active.items():
+            if definition.table in overlaid:
+                overlaid[definition.table] = {**overlaid[definition.table], "materialized_from": name}
+        return overlaid
@@ -0,0 +1,322 @@
+import os
+import sys
+import glob
+import json
+import time
+import logging
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Directory the worker processes of one server write their series to (gunicorn.conf.py sets it), so any
+# worker's /api/metrics reports the totals of all of them; empty for a single process
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _label_text(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format(value: float) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self) -> Dict[Tuple, float]:
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(value: float, other: float) -> float:
+        return value + other
+
+    def render(self, series: Optional[Dict[Tuple, float]] = None) -> List[str]:
+        """This process's values, or series merged from several processes."""
+        series = self.snapshot() if series is None else series
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(series.items()):
+            lines.append(f"{self.name}{_label_text(labels)} {_format(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in the Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts (the last one is +Inf), then sum and count
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][bisect_left(self.buckets, value)] += 1
+            series[1] += value
+            series[2] += 1
+
+    def snapshot(self) -> Dict[Tuple, list]:
+        with self._lock:
+            return {key: [list(counts), total, count] for key, (counts, total, count) in self._series.items()}
+
+    @staticmethod
+    def merge(value: list, other: list) -> list:
+        return [[a + b for a, b in zip(value[0], other[0])], value[1] + other[1], value[2] + other[2]]
+
+    def render(self, series: Optional[Dict[Tuple, list]] = None) -> List[str]:
+        """This process's series, or series merged from several processes."""
+        series = self.snapshot() if series is None else series
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                bucket_labels = labels + (('le', _format(bound)),)
+                lines.append(f"{self.name}_bucket{_label_text(bucket_labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(labels)} {_format(total)}")
+            lines.append(f"{self.name}_count{_label_text(labels)} {count}")
+        return lines
+
+
+def sampled(name: str, documentation: str, samples: Iterable[Tuple[Dict, float]], kind: str = 'gauge') -> List[str]:
+    """
+    Render a metric read at scrape time from a component's stats(). These
+    describe the process serving the scrape, so with several workers they
+    carry its pid as a worker label.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        if METRICS_MULTIPROC_DIR:
+            labels = {**labels, "worker": str(os.getpid())}
+        lines.append(f"{name}{_label_text(tuple(sorted(labels.items())))} {_format(value)}")
+    return lines
+
+
+def process_memory() -> Dict[str, float]:
+    """
+    This process's memory in MB. Besides rss, Linux reports pss (shared
+    pages split evenly between the processes mapping them) and private
+    (pages no other process shares), which show what a forked worker adds.
+    """
+    memory = {}
+    try:
+        with open('/proc/self/smaps_rollup') as smaps:
+            fields = dict(line.split(':', 1) for line in smaps if ':' in line and line[0].isupper())
+        kilobytes = {key: int(value.split()[0]) for key, value in fields.items() if value.strip().endswith('kB')}
+        memory = {
+            "rss_mb": kilobytes.get('Rss', 0) / 1024,
+            "pss_mb": kilobytes.get('Pss', 0) / 1024,
+            "private_mb": (kilobytes.get('Private_Clean', 0) + kilobytes.get('Private_Dirty', 0)) / 1024,
+        }
+    except (OSError, ValueError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory = {"rss_mb": peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024}
+    return {key: round(value, 1) for key, value in memory.items()}
+
+
+REQUEST_SECONDS = Histogram('smartsql_request_seconds', 'HTTP request latency by endpoint.')
+REQUESTS = Counter('smartsql_requests_total', 'HTTP requests by endpoint and status code.')
+STAGE_SECONDS = Histogram('smartsql_stage_seconds', 'Latency of each stage of answering a question.')
+LLM_CALLS = Counter('smartsql_llm_calls_total', 'LLM calls made.')
+LLM_TOKENS = Counter('smartsql_llm_tokens_total', 'LLM tokens used, by kind (prompt or completion).')
+ANSWERS = Counter('smartsql_answers_total', 'Answered questions by source (cache tier or generation mode).')
+
+REGISTRY = [REQUEST_SECONDS, REQUESTS, STAGE_SECONDS, LLM_CALLS, LLM_TOKENS, ANSWERS]
+
+_snapshot_lock = threading.Lock()
+_writer_pid: Optional[int] = None
+
+
+def _snapshot_path(pid: int) -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, f"worker_{pid}.json")
+
+
+def write_snapshot():
+    """Save this process's series to METRICS_MULTIPROC_DIR, where the other workers read them."""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    data = {metric.name: [[list(labels), value] for labels, value in metric.snapshot().items()]
+            for metric in REGISTRY}
+    path = _snapshot_path(os.getpid())
+    with _snapshot_lock:
+        os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(data, f)
+        # Readers see the previous file or this one, never a partial write
+        os.replace(f"{path}.tmp", path)
+
+
+def start_snapshot_writer(interval: float = METRICS_FLUSH_INTERVAL):
+    """Write this process's snapshot every interval seconds on a daemon thread; call once in each worker."""
+    global _writer_pid
+    if not METRICS_MULTIPROC_DIR or interval <= 0 or _writer_pid == os.getpid():
+        return
+    _writer_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                write_snapshot()
+            except OSError as e:
+                logger.warning(f"Could not write metrics snapshot: {e}")
+
+    threading.Thread(target=run, name='metrics-snapshot', daemon=True).start()
+
+
+def aggregate() -> Dict[str, Dict[Tuple, object]]:
+    """
+    Series of every worker that wrote a snapshot, summed per metric and
+    labels. Files of exited workers stay, so totals never go backwards.
+    """
+    write_snapshot()
+    totals: Dict[str, Dict[Tuple, object]] = {metric.name: {} for metric in REGISTRY}
+    merges = {metric.name: metric.merge for metric in REGISTRY}
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, 'worker_*.json')):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipping metrics snapshot {path}: {e}")
+            continue
+        for name, series in data.items():
+            if name not in totals:
+                continue
+            merged = totals[name]
+            for labels, value in series:
+                key = tuple(tuple(pair) for pair in labels)
+                merged[key] = merges[name](merged[key], value) if key in merged else value
+    return totals
+
+
+# Seconds spent in each startup phase, filled in by wsgi.py when the app is preloaded
+STARTUP: Dict[str, float] = {}
+
+
+class Trace:
+    """Per-request record of stage timings and LLM calls."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: List[Dict] = []
+        self.llm_calls: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages.append({"stage": name, "ms": round(seconds * 1000, 3)})
+
+    def add_llm_call(self, seconds: float, prompt_tokens: Optional[int], completion_tokens: Optional[int]):
+        with self._lock:
+            self.llm_calls.append({
+                "ms": round(seconds * 1000, 3),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+            })
+
+    def to_dict(self) -> Dict:
+        with self._lock:
+            totals: Dict[str, float] = {}
+            for entry in self.stages:
+                totals[entry["stage"]] = round(totals.get(entry["stage"], 0) + entry["ms"], 3)
+            return {
+                "total_ms": round((time.perf_counter() - self.started) * 1000, 3),
+                "stages": list(self.stages),
+                "stage_totals_ms": totals,
+                "llm_calls": list(self.llm_calls),
+            }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar('current_trace', default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def tracing():
+    """Collect the stages run inside the block into a new Trace."""
+    trace = Trace()
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the stage histogram and the current request's trace."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - started
+        STAGE_SECONDS.observe(seconds, stage=name)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add_stage(name, seconds)
+
+
+def record_llm_call(seconds: float, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None,
+                    trace: Optional[Trace] = None):
+    """Count one LLM call with its latency and token usage."""
+    STAGE_SECONDS.observe(seconds, stage='llm_call')
+    LLM_CALLS.inc()
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind='prompt')
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, kind='completion')
+    trace = trace or _current_trace.get()
+    if trace is not None:
+        trace.add_llm_call(seconds, prompt_tokens, completion_tokens)
+
+
+def render_metrics(extra: Iterable[List[str]] = ()) -> str:
+    """
+    All registered metrics, summed over the workers when METRICS_MULTIPROC_DIR
+    is set, plus scrape-time gauges of this process, in the Prometheus text
+    exposition format.
+    """
+    series = aggregate() if METRICS_MULTIPROC_DIR else {}
+    lines: List[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render(series.get(metric.name)))
+    for block in extra:
+        lines.extend(block)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,353 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional
+import numpy as np
+import faiss
+from embeddings import Embedder
+
+logger = logging.getLogger(__name__)
+
+QUERY_CACHE_SIZE = int(os.getenv('QUERY_CACHE_SIZE', 1000))
+QUERY_CACHE_TTL = float(os.getenv('QUERY_CACHE_TTL', 3600))
+QUERY_CACHE_PATH = os.getenv('QUERY_CACHE_PATH', '')
+# Cosine similarity of canonical questions; paraphrases score >= 0.94 and questions about other columns <= 0.75
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.9))
+SEMANTIC_CACHE_SIZE = int(os.getenv('SEMANTIC_CACHE_SIZE', 5000))
+
+# Fields of a /api/query response worth replaying
+CACHED_FIELDS = ('sql', 'result', 'answer', 'columns', 'column_types', 'truncated', 'next_cursor', 'raw_output',
+                 'error', 'relevant_schema', 'relevant_values', 'mode')
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'[^']*'|\"[^\"]*\"|\b\d+(?:\.\d+)?\b|\b\w*(?:[A-Z]\w*[A-Z]|_)\w*\b|(?<=\s)[A-Z][a-z]+\b|\b[A-Z]\b|\b[b-hj-z]\b")
+
+# Words that change what is computed or which rows qualify; synonyms share one marker so paraphrases still match
+_INTENT_WORDS = {
+    'top': 'max', 'best': 'max', 'highest': 'max', 'max': 'max', 'maximum': 'max', 'most': 'max',
+    'bottom': 'min', 'worst': 'min', 'lowest': 'min', 'min': 'min', 'minimum': 'min', 'least': 'min',
+    'average': 'avg', 'avg': 'avg', 'mean': 'avg',
+    'count': 'count', 'many': 'count', 'number': 'count',
+    'sum': 'sum', 'total': 'sum',
+    'not': 'not', 'without': 'not', 'except': 'not', 'no': 'not',
+    'above': 'gt', 'greater': 'gt', 'more': 'gt', 'over': 'gt', 'higher': 'gt', 'exceeding': 'gt',
+    'below': 'lt', 'less': 'lt', 'fewer': 'lt', 'under': 'lt', 'lower': 'lt',
+    'asc': 'asc', 'ascending': 'asc', 'increasing': 'asc',
+    'desc': 'desc', 'descending': 'desc', 'decreasing': 'desc',
+    'before': 'before', 'earlier': 'before', 'prior': 'before',
+    'after': 'after', 'later': 'after', 'since': 'after',
+    'pass': 'pass', 'passed': 'pass', 'passing': 'pass',
+    'fail': 'fail', 'failed': 'fail', 'failing': 'fail',
+}
+
+# Words that only phrase the request; dropped before embedding so "show"/"list"/"which" paraphrases line up
+_FILLER_WORDS = {
+    'a', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'be', 'by', 'did', 'display', 'do', 'does', 'each',
+    'every', 'find', 'for', 'from', 'get', 'give', 'has', 'have', 'how', 'i', 'in', 'is', 'it', 'its', 'list',
+    'me', 'of', 'on', 'or', 'order', 'ordered', 'per', 'please', 'return', 'show', 'sort', 'sorted', 'than',
+    'that', 'the', 'their', 'there', 'these', 'this', 'those', 'to', 'was', 'we', 'were', 'what', 'which',
+    'who', 'whose', 'with',
+}
+
+
+def normalize_question(question: str) -> str:
+    """Case- and whitespace-insensitive form of a question, without trailing punctuation."""
+    return _WHITESPACE.sub(' ', question).strip().lower().rstrip('?.!; ')
+
+
+def canonical_question(question: str) -> str:
+    """
+    The words of a question that carry its meaning, as embedded by the
+    semantic cache: filler dropped, intent words replaced by their marker
+    and plurals trimmed ('Show the best AI_ML students' -> 'max ai_ml student').
+    """
+    words = []
+    for word in re.findall(r'\w+', question):
+        lowered = word.lower()
+        # A capital single letter is a value, like section A
+        if lowered in _FILLER_WORDS and not (len(word) == 1 and word.isupper()):
+            continue
+        lowered = _INTENT_WORDS.get(lowered, lowered)
+        if len(lowered) > 3 and lowered.endswith('s') and not lowered.endswith('ss'):
+            lowered = lowered[:-1]
+        words.append(lowered)
+    return " ".join(words)
+
+
+def question_literals(question: str) -> List[str]:
+    """
+    Value-like tokens of a question (quoted strings, numbers, identifiers
+    such as AI_ML or CS, capitalized names such as Algorithms, single
+    letters like section B) plus markers for aggregate, comparison,
+    ordering and pass/fail words. Questions that differ in these must not
+    share SQL.
+    """
+    literals = {match.lower() for match in _LITERALS.findall(question)}
+    literals.update(f"#{_INTENT_WORDS[word]}" for word in re.findall(r'[a-z]+', question.lower())
+                    if word in _INTENT_WORDS)
+    return sorted(literals)
+
+
+class QueryCache:
+    """
+    Exact-match cache of NL->SQL responses keyed by question, database and
+    schema fingerprint. An in-memory LRU with TTL sits in front of an
+    optional SQLite file that survives restarts.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 path: Optional[str] = QUERY_CACHE_PATH or None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._memory: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._fingerprints: Dict[str, str] = {}
+        # Memory hits since the last write, applied to last_used before the file is trimmed
+        self._touched: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        if path:
+            self._connection()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        """The SQLite file, opened on first use (and again after close()); None when not persistent."""
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(query_cache)")]
+            if 'database_url' in columns:
+                # Files written before database_hash held the URLs, credentials included
+                conn.execute("DROP TABLE query_cache")
+                logger.info(f"Query cache: dropped entries stored with raw database URLs in {self.path}")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_cache (
+                    key TEXT PRIMARY KEY,
+                    database_hash TEXT,
+                    fingerprint TEXT,
+                    question TEXT,
+                    response TEXT,
+                    created_at REAL,
+                    last_used REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_query_cache_last_used ON query_cache(last_used)")
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        """Close the SQLite file, e.g. before forking workers; the next lookup reopens it."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    @staticmethod
+    def database_hash(database_url: str) -> str:
+        """What the SQLite file stores in place of a URL, which can carry a password."""
+        return hashlib.sha256(database_url.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def key(question: str, database_url: str, fingerprint: str) -> str:
+        payload = f"{normalize_question(question)}\x1f{database_url}\x1f{fingerprint}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _check_fingerprint(self, database_url: str, fingerprint: str):
+        """Drop entries built against an older schema of the same database."""
+        if self._fingerprints.get(database_url) == fingerprint:
+            return
+        self._fingerprints[database_url] = fingerprint
+        stale = [key for key, (url, fp, _, _) in self._memory.items() if url == database_url and fp != fingerprint]
+        for key in stale:
+            del self._memory[key]
+        conn = self._connection()
+        if conn is not None:
+            conn.execute("DELETE FROM query_cache WHERE database_hash = ? AND fingerprint != ?",
+                         (self.database_hash(database_url), fingerprint))
+            conn.commit()
+        if stale:
+            logger.info(f"Query cache: schema changed, dropped {len(stale)} entries")
+
+    def get(self, question: str, database_url: str, fingerprint: str) -> Optional[Dict]:
+        """Return a cached response, or None on a miss or an expired entry."""
+        key = self.key(question, database_url, fingerprint)
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint(database_url, fingerprint)
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[2] < self.ttl:
+                self._memory.move_to_end(key)
+                if self.path:
+                    self._touched[key] = now
+                self.hits += 1
+                return dict(entry[3])
+            if entry is not None:
+                del self._memory[key]
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute("SELECT response, created_at FROM query_cache WHERE key = ?",
+                                   (key,)).fetchone()
+                if row is not None and now - row[1] < self.ttl:
+                    conn.execute("UPDATE query_cache SET last_used = ? WHERE key = ?", (now, key))
+                    conn.commit()
+                    response = json.loads(row[0])
+                    self._remember(key, database_url, fingerprint, row[1], response)
+                    self.hits += 1
+                    return dict(response)
+            self.misses += 1
+            return None
+
+    def put(self, question: str, database_url: str, fingerprint: str, response: Dict):
+        """Store the replayable fields of a response."""
+        key = self.key(question, database_url, fingerprint)
+        payload = {field: response.get(field) for field in CACHED_FIELDS}
+        now = time.time()
+        with self._lock:
+            self._check_fingerprint(database_url, fingerprint)
+            self._remember(key, database_url, fingerprint, now, payload)
+            conn = self._connection()
+            if conn is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO query_cache VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, self.database_hash(database_url), fingerprint, question,
+                     json.dumps(payload, default=str), now, now)
+                )
+                conn.executemany("UPDATE query_cache SET last_used = ? WHERE key = ?",
+                                 [(used, touched) for touched, used in self._touched.items()])
+                self._touched.clear()
+                conn.execute("""
+                    DELETE FROM query_cache WHERE key IN (
+                        SELECT key FROM query_cache ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,))
+                conn.execute("DELETE FROM query_cache WHERE created_at < ?", (now - self.ttl,))
+                conn.commit()
+
+    def _remember(self, key: str, database_url: str, fingerprint: str, created_at: float, response: Dict):
+        self._memory[key] = (database_url, fingerprint, created_at, response)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._touched.clear()
+            conn = self._connection()
+            if conn is not None:
+                conn.execute("DELETE FROM query_cache")
+                conn.commit()
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "persistent": bool(self.path),
+        }
+
+
+class SemanticQueryCache:
+    """
+    Second-tier cache matching new questions to previously answered ones by
+    embedding similarity of their canonical forms. A hit returns the earlier
+    SQL so it can be re-run against the live database instead of calling
+    the LLM agent.
+    """
+
+    def __init__(self, embedder: Embedder, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries: int = SEMANTIC_CACHE_SIZE):
+        self.embedder = embedder
+        self.dimension = embedder.dimension
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._scopes: Dict[str, Dict] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _scope(self, database_url: str, fingerprint: str) -> Dict:
+        """Per-database vector index, reset when that database's schema changes."""
+        scope = self._scopes.get(database_url)
+        if scope is None or scope['fingerprint'] != fingerprint:
+            scope = {
+                'fingerprint': fingerprint,
+                'index': faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension)),
+                'entries': {},
+                'questions': {},
+                'order': deque(),
+            }
+            self._scopes[database_url] = scope
+        return scope
+
+    def _vector(self, question: str) -> np.ndarray:
+        matrix = np.array(self.embedder.embed([canonical_question(question)]), dtype=np.float32).reshape(1, -1)
+        faiss.normalize_L2(matrix)
+        return matrix
+
+    def lookup(self, question: str, database_url: str, fingerprint: str) -> Optional[Dict]:
+        """Closest earlier question above the similarity threshold with the same literals, if any."""
+        query = self._vector(question)
+        literals = question_literals(question)
+        with self._lock:
+            scope = self._scope(database_url, fingerprint)
+            if scope['index'].ntotal:
+                scores, ids = scope['index'].search(query, min(5, scope['index'].ntotal))
+                for score, entry_id in zip(scores[0].tolist(), ids[0].tolist()):
+                    if score < self.threshold:
+                        break
+                    entry = scope['entries'].get(entry_id)
+                    if entry is not None and entry['literals'] == literals:
+                        self.hits += 1
+                        return {'question': entry['question'], 'sql': entry['sql'], 'similarity': score}
+            self.misses += 1
+            return None
+
+    def add(self, question: str, sql: str, database_url: str, fingerprint: str):
+        """Remember the SQL generated for a question."""
+        normalized = normalize_question(question)
+        matrix = self._vector(question)
+        with self._lock:
+            scope = self._scope(database_url, fingerprint)
+            if normalized in scope['questions']:
+                return
+            entry_id = self._next_id
+            self._next_id += 1
+            scope['entries'][entry_id] = {
+                'question': question,
+                'sql': sql,
+                'literals': question_literals(question),
+            }
+            scope['questions'][normalized] = entry_id
+            scope['order'].append((entry_id, normalized))
+            scope['index'].add_with_ids(matrix, np.array([entry_id], dtype=np.int64))
+            while len(scope['order']) > self.max_entries:
+                old_id, old_question = scope['order'].popleft()
+                scope['index'].remove_ids(np.array([old_id], dtype=np.int64))
+                scope['entries'].pop(old_id, None)
+                scope['questions'].pop(old_question, None)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "entries": sum(len(scope['entries']) for scope in self._scopes.values()),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._scopes.clear()
@@ -0,0 +1,386 @@
+import io
+import os
+import re
+import csv
+import json
+import base64
+import hashlib
+import logging
+import datetime
+from decimal import Decimal
+from typing import Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from database import iter_query_chunks
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+RESULT_PAGE_SIZE = int(os.getenv('RESULT_PAGE_SIZE', 1000))
+RESULT_MAX_PAGE_SIZE = int(os.getenv('RESULT_MAX_PAGE_SIZE', 10000))
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 5000))
+EXPORT_TIMEOUT = float(os.getenv('EXPORT_TIMEOUT', 600))
+EXPORT_FORMATS = ('csv', 'arrow')
+
+# Queries with an ORDER BY that cannot be keyset-paged are paged by position, at most this deep
+RESULT_MAX_OFFSET = int(os.getenv('RESULT_MAX_OFFSET', 100000))
+
+_TOKENS = re.compile(r"'(?:[^']|'')*'|\"[^\"]*\"|`[^`]*`|--[^\n]*|/\*.*?\*/|\(|\)|,|\bORDER\s+BY\b"
+                     r"|\b(?:LIMIT|OFFSET|FETCH|FOR|UNION|INTERSECT|EXCEPT)\b", re.IGNORECASE | re.DOTALL)
+_ORDER_TERM = re.compile(r"^(?P<expr>.*?)(?:\s+(?P<direction>ASC|DESC))?(?:\s+NULLS\s+(?P<nulls>FIRST|LAST))?$",
+                         re.IGNORECASE | re.DOTALL)
+_QUALIFIED_NAME = re.compile(r'^(?:(?:"[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)\.)*(?P<name>"[^"]+"|`[^`]+`|\[[^\]]+\]|\w+)$')
+
+class InvalidCursorError(ValueError):
+    """Raised for a pagination token that is malformed or belongs to different SQL."""
+
+
+def order_by_terms(sql: str) -> Optional[List[str]]:
+    """The terms of the statement's own ORDER BY (outside any parentheses), or None if it has none."""
+    depth = 0
+    terms: Optional[List[str]] = None
+    start = None
+    for match in _TOKENS.finditer(sql):
+        token = match.group(0).upper()
+        if token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token[0] in '\'"`-/':
+            continue
+        elif token.startswith('ORDER'):
+            terms, start = [], match.end()
+        elif start is None:
+            if token in ('UNION', 'INTERSECT', 'EXCEPT'):
+                terms = None
+        elif token == ',':
+            terms.append(sql[start:match.start()].strip())
+            start = match.end()
+        else:
+            terms.append(sql[start:match.start()].strip())
+            start = None
+            if token in ('UNION', 'INTERSECT', 'EXCEPT'):
+                terms = None
+    if start is not None:
+        terms.append(sql[start:].strip())
+    return terms
+
+
+def _comparable_name(name: str) -> str:
+    return re.sub(r'\s+|["`\[\]]', '', name).lower()
+
+
+def sort_keys(terms: List[str], columns: List[str], nulls_last_ascending: bool) -> Optional[List[Tuple[int, bool, bool]]]:
+    """
+    Map ORDER BY terms to result columns as (position, descending,
+    nulls_first), or None if a term does not name a selected column (an
+    expression that is not selected, a collation, an ambiguous name).
+    """
+    names = [_comparable_name(column) for column in columns]
+    keys = []
+    for term in terms:
+        match = _ORDER_TERM.match(term)
+        expr = match.group('expr').strip()
+        if not expr or 'COLLATE' in expr.upper():
+            return None
+        if expr.isdigit():
+            position = int(expr) - 1
+            if not 0 <= position < len(columns):
+                return None
+        else:
+            candidates = [_comparable_name(expr)]
+            qualified = _QUALIFIED_NAME.match(expr)
+            if qualified:
+                candidates.append(_comparable_name(qualified.group('name')))
+            position = None
+            for candidate in candidates:
+                found = [i for i, name in enumerate(names) if name == candidate]
+                if len(found) > 1:
+                    return None
+                if found:
+                    position = found[0]
+                    break
+            if position is None:
+                return None
+        descending = (match.group('direction') or '').upper() == 'DESC'
+        nulls = (match.group('nulls') or '').upper()
+        # Without NULLS FIRST/LAST, nulls sort as the dialect's smallest or largest value
+        nulls_first = nulls == 'FIRST' if nulls else descending == nulls_last_ascending
+        if position not in [key[0] for key in keys]:
+            keys.append((position, descending, nulls_first))
+    return keys
+
+
+def value_type(value) -> str:
+    """JSON-facing type name of a database value."""
+    if isinstance(value, bool):
+        return 'boolean'
+    if isinstance(value, int):
+        return 'integer'
+    if isinstance(value, float):
+        return 'float'
+    if isinstance(value, Decimal):
+        return 'decimal'
+    if isinstance(value, datetime.datetime):
+        return 'datetime'
+    if isinstance(value, datetime.date):
+        return 'date'
+    if isinstance(value, datetime.time):
+        return 'time'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return 'binary'
+    return 'string'
+
+
+def encode_value(value):
+    """Convert a database value to its JSON form (ISO dates, decimal strings, base64 bytes)."""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(value)).decode('ascii')
+    return str(value)
+
+
+def column_types(rows: List[List], width: int) -> List[Optional[str]]:
+    """Type of each column, taken from its first non-null value (None if all are null)."""
+    types: List[Optional[str]] = [None] * width
+    for row in rows:
+        for i, value in enumerate(row):
+            if types[i] is None and value is not None:
+                types[i] = value_type(value)
+        if all(types):
+            break
+    return types
+
+
+def _pack(value):
+    """Encode a key value for a cursor token so it round-trips with its type."""
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$binary': base64.b64encode(bytes(value)).decode('ascii')}
+    return value
+
+
+def _unpack(value):
+    if not isinstance(value, dict):
+        return value
+    (tag, raw), = value.items()
+    return {
+        '$datetime': datetime.datetime.fromisoformat,
+        '$date': datetime.date.fromisoformat,
+        '$time': datetime.time.fromisoformat,
+        '$decimal': Decimal,
+        '$binary': base64.b64decode,
+    }[tag](raw)
+
+
+def sql_digest(sql: str) -> str:
+    return hashlib.sha256(sql.strip().encode('utf-8')).hexdigest()[:16]
+
+
+def encode_cursor(state: Dict) -> str:
+    payload = json.dumps(state, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token: str, sql: str) -> Dict:
+    """Parse a pagination token and check that it was issued for this SQL."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if 'after' in state:
+            state['after'] = [_unpack(value) for value in state['after']]
+    except Exception as e:
+        raise InvalidCursorError(f"Invalid cursor: {e}") from e
+    if state.get('sql') != sql_digest(sql):
+        raise InvalidCursorError("Cursor does not belong to this query")
+    if not isinstance(state.get('columns'), list) or ('after' not in state and 'offset' not in state):
+        raise InvalidCursorError("Invalid cursor: missing paging state")
+    return state
+
+
+def _keyset_query(sql: str, width: int, keys: List[Tuple[int, bool, bool]], after: Optional[List],
+                  limit: int, nulls_last_ascending: bool = False) -> Tuple[str, Dict]:
+    """
+    Wrap the query so its rows come back sorted by keys, given as
+    (position, descending, nulls_first), then by every other column, and
+    start at the key of the last row already returned. Rows equal to that
+    key are included; the caller skips the ones it has sent. Sort terms and
+    the range on the first key are kept in plain form where the dialect's
+    own null ordering allows, so an index on the key can serve them.
+    """
+    names = [f"c{i}" for i in range(width)]
+    keyed = {position for position, _, _ in keys}
+    keys = list(keys) + [(i, False, not nulls_last_ascending) for i in range(width) if i not in keyed]
+    order = []
+    for i, descending, nulls_first in keys:
+        if nulls_first != (descending == nulls_last_ascending):
+            order.append(f"CASE WHEN {names[i]} IS NULL THEN {0 if nulls_first else 1} ELSE {1 if nulls_first else 0} END")
+        order.append(f"{names[i]}{' DESC' if descending else ''}")
+    params: Dict = {}
+    where = ""
+    if after is not None:
+        clauses, equal, bound = [], [], None
+        for i, descending, nulls_first in keys:
+            name, value = names[i], after[i]
+            if value is None:
+                # Only non-null values follow a null that sorts first; nothing follows one that sorts last
+                greater, same = (f"{name} IS NOT NULL" if nulls_first else None), f"{name} IS NULL"
+                if not equal and not nulls_first:
+                    bound = same
+            else:
+                params[f"k{i}"] = value
+                greater, same = f"{name} {'<' if descending else '>'} :k{i}", f"{name} = :k{i}"
+                if not equal:
+                    bound = f"{name} {'<=' if descending else '>='} :k{i}"
+                if not nulls_first:
+                    greater = f"({greater} OR {name} IS NULL)"
+                    bound = bound and f"({bound} OR {name} IS NULL)"
+            if greater is not None:
+                clauses.append(" AND ".join(equal + [greater]))
+            equal.append(same)
+        clauses.append(" AND ".join(equal))
+        where = "WHERE " + " OR ".join(f"({clause})" for clause in clauses)
+        if bound:
+            where = f"WHERE {bound} AND ({where[len('WHERE '):]})"
+    query = (f"WITH _page({', '.join(names)}) AS ({sql}) "
+             f"SELECT * FROM _page {where} ORDER BY {', '.join(order)} LIMIT {int(limit)}")
+    return query, params
+
+
+def _first_rows(conn, sql: str, count: int) -> Tuple[List[str], List[List]]:
+    """The column names and up to count rows of the query as written, read from a streaming cursor."""
+    result = conn.execution_options(stream_results=True, yield_per=count).execute(text(sql))
+    columns = list(result.keys())
+    rows = [list(row) for row in result.fetchmany(count)]
+    result.close()
+    return columns, rows
+
+
+def _offset_page(conn, sql: str, offset: int, page_size: int) -> List[List]:
+    """Rows after the first offset of the query as written, skipped on a streaming cursor."""
+    result = conn.execution_options(stream_results=True, yield_per=page_size).execute(text(sql))
+    skipped = 0
+    while skipped < offset:
+        batch = result.fetchmany(min(offset - skipped, 10000))
+        if not batch:
+            break
+        skipped += len(batch)
+    rows = [list(row) for row in result.fetchmany(page_size + 1)]
+    result.close()
+    return rows
+
+
+def fetch_page(engine: Engine, sql: str, page_size: int = RESULT_PAGE_SIZE, cursor: Optional[str] = None) -> Dict:
+    """
+    One page of a query's rows plus a token for the next page. A result
+    that fits in one page is returned as the query produced it. Larger
+    ones are paged by keyset: on the query's ORDER BY columns (then the
+    other columns, to break ties) or, for unordered queries, on all
+    columns. An ORDER BY on something that is not a selected column can
+    only be paged by position, up to RESULT_MAX_OFFSET rows deep.
+    """
+    page_size = max(1, min(page_size, RESULT_MAX_PAGE_SIZE))
+    state = decode_cursor(cursor, sql) if cursor else {}
+    digest = sql_digest(sql)
+    next_state = None
+    with stage('sql_execution'), engine.connect() as conn:
+        if not state:
+            columns, rows = _first_rows(conn, sql, page_size + 1)
+        else:
+            columns = state['columns']
+        nulls_last_ascending = engine.dialect.name in ('postgresql', 'oracle')
+        terms = order_by_terms(sql)
+        keys = []
+        if terms is not None:
+            keys = sort_keys(terms, columns, nulls_last_ascending)
+        if state.get('offset') is not None or (state == {} and keys is None and len(rows) > page_size):
+            # The ORDER BY cannot be expressed over the result columns: page by position on the query as written
+            offset = int(state.get('offset', 0))
+            if offset:
+                rows = _offset_page(conn, sql, offset, page_size)
+            if offset + page_size < RESULT_MAX_OFFSET:
+                next_state = {'sql': digest, 'columns': columns, 'offset': offset + page_size}
+        elif state or len(rows) > page_size:
+            after, skip = state.get('after'), int(state.get('skip', 0))
+            query, params = _keyset_query(sql, len(columns), keys, after, skip + page_size + 1, nulls_last_ascending)
+            # The workload records the user's query once per page: the first page already ran it as written
+            recorded_as = sql if state else False
+            result = conn.execution_options(workload_statement=recorded_as).execute(text(query), params)
+            rows = [list(row) for row in result.fetchall()][skip:]
+            if len(rows) > page_size:
+                last = rows[page_size - 1]
+                repeats = sum(1 for row in rows[:page_size] if row == last)
+                if after is not None and last == list(after):
+                    repeats += skip
+                next_state = {'sql': digest, 'columns': columns,
+                              'after': [_pack(value) for value in last], 'skip': repeats}
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    return {
+        "columns": columns,
+        "column_types": column_types(rows, len(columns)),
+        "rows": [[encode_value(value) for value in row] for row in rows],
+        "truncated": has_more,
+        "next_cursor": encode_cursor(next_state) if has_more and next_state else None,
+    }
+
+
+def iter_csv(engine: Engine, sql: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[str]:
+    """Stream a query as CSV, one chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    chunks = iter_query_chunks(engine, sql, chunk_size)
+    writer.writerow(next(chunks))
+    for rows in chunks:
+        writer.writerows([encode_value(value) for value in row] for row in rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+def iter_arrow(engine: Engine, sql: str, chunk_size: int = EXPORT_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Stream a query in the Arrow IPC stream format, one record batch per
+    chunk. The schema is inferred from the first chunk; columns that are
+    all null there are sent as strings.
+    """
+    import pyarrow as pa
+
+    chunks = iter_query_chunks(engine, sql, chunk_size)
+    columns = next(chunks)
+    sink = io.BytesIO()
+    writer = None
+    schema = None
+    for rows in chunks:
+        arrays = list(zip(*rows)) if rows else [()] * len(columns)
+        if schema is None:
+            fields = []
+            for name, values in zip(columns, arrays):
+                inferred = pa.array(values).type
+                fields.append(pa.field(name, pa.string() if pa.types.is_null(inferred) else inferred))
+            schema = pa.schema(fields)
+            writer = pa.ipc.new_stream(sink, schema)
+        batch = pa.record_batch([
+            pa.array([None if value is None else str(value) for value in values], type=field.type)
+            if pa.types.is_string(field.type) else pa.array(values, type=field.type)
+            for field, values in zip(schema, arrays)
+        ], schema=schema)
+        writer.write_batch(batch)
+        yield sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+    if writer is None:
+        schema = pa.schema([pa.field(name, pa.string()) for name in columns])
+        writer = pa.ipc.new_stream(sink, schema)
+    writer.close()
+    yield sink.getvalue()
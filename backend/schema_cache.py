@@ -0,0 +1,140 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from typing import Callable, Dict, Optional, Tuple
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_TTL = float(os.getenv('SCHEMA_CACHE_TTL', 300))
+SCHEMA_CHECK_INTERVAL = float(os.getenv('SCHEMA_CHECK_INTERVAL', 1))
+
+# Cheap one-round-trip queries whose result changes whenever the schema does
+_VERSION_QUERIES = {
+    'sqlite': "PRAGMA schema_version",
+    'postgresql': """
+        SELECT md5(coalesce(string_agg(
+            c.relname || '.' || a.attname || ':' || format_type(a.atttypid, a.atttypmod),
+            ',' ORDER BY c.relname, a.attnum), '')) ||
+            (SELECT md5(coalesce(string_agg(con.conname || ':' || pg_get_constraintdef(con.oid),
+                ',' ORDER BY con.conname), ''))
+             FROM pg_catalog.pg_constraint con
+             JOIN pg_catalog.pg_namespace cn ON cn.oid = con.connamespace
+             WHERE cn.nspname = current_schema() AND con.contype = 'f')
+        FROM pg_catalog.pg_class c
+        JOIN pg_catalog.pg_namespace n ON n.oid = c.relnamespace
+        JOIN pg_catalog.pg_attribute a ON a.attrelid = c.oid
+        WHERE n.nspname = current_schema()
+          AND c.relkind IN ('r', 'v', 'm', 'p')
+          AND a.attnum > 0 AND NOT a.attisdropped
+    """,
+    'mysql': """
+        SELECT CONCAT(COUNT(*), ':', COALESCE(SUM(CRC32(CONCAT_WS(':', TABLE_NAME, COLUMN_NAME, COLUMN_TYPE))), 0))
+        FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE()
+    """,
+}
+
+
+def build_schema_info(engine: Engine) -> Dict:
+    """Introspect tables and views into the schema_info dict used by the API."""
+    schema_info = {}
+    inspector = inspect(engine)
+    tables = inspector.get_table_names()
+    views = inspector.get_view_names()
+    for name in tables + views:
+        is_view = name in views
+        columns = inspector.get_columns(name)
+        schema_info[name] = {
+            "columns": [col["name"] for col in columns],
+            "types": {col["name"]: str(col["type"]) for col in columns},
+            "is_view": is_view
+        }
+        if not is_view:
+            try:
+                foreign_keys = inspector.get_foreign_keys(name)
+                if foreign_keys:
+                    schema_info[name]["foreign_keys"] = foreign_keys
+            except Exception as e:
+                logger.warning(f"Could not get foreign keys for {name}: {e}")
+    return schema_info
+
+
+def schema_fingerprint(schema_info: Dict) -> str:
+    """Stable hash of a schema_info dict, used as its ETag."""
+    payload = json.dumps(schema_info, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SchemaCatalog:
+    """In-memory schema_info cache that rebuilds only when the schema changes."""
+
+    def __init__(self, engine: Engine, ttl: float = SCHEMA_CACHE_TTL,
+                 check_interval: float = SCHEMA_CHECK_INTERVAL,
+                 overlay: Optional[Callable[[Dict], Dict]] = None):
+        self.engine = engine
+        self.overlay = overlay
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._schema_info: Optional[Dict] = None
+        self._fingerprint: Optional[str] = None
+        self._version: Optional[str] = None
+        self._built_at = 0.0
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _schema_version(self) -> Optional[str]:
+        """Return the database's schema version token, or None if the dialect has none."""
+        query = _VERSION_QUERIES.get(self.engine.dialect.name)
+        if query is None:
+            return None
+        try:
+            with self.engine.connect() as conn:
+                return str(conn.execute(text(query)).scalar())
+        except Exception as e:
+            logger.warning(f"Schema version check failed, falling back to TTL: {e}")
+            return None
+
+    def _check(self, now: float) -> Tuple[bool, Optional[str]]:
+        """Whether to rebuild, and the version token read to decide it (kept for the rebuild)."""
+        if self._schema_info is None:
+            return True, self._schema_version()
+        if now - self._checked_at < self.check_interval:
+            return False, None
+        self._checked_at = now
+        version = self._schema_version()
+        if version is None:
+            return now - self._built_at >= self.ttl, None
+        return version != self._version, version
+
+    def get(self) -> Dict:
+        """Return the cached schema_info, rebuilding it if the schema changed."""
+        with self._lock:
+            now = time.monotonic()
+            stale, version = self._check(now)
+            if stale:
+                self._version = version
+                self._schema_info = build_schema_info(self.engine)
+                if self.overlay is not None:
+                    self._schema_info = self.overlay(self._schema_info)
+                self._fingerprint = schema_fingerprint(self._schema_info)
+                self._built_at = self._checked_at = now
+                logger.info(f"Schema catalog rebuilt ({len(self._schema_info)} tables and views)")
+            return self._schema_info
+
+    @property
+    def fingerprint(self) -> str:
+        """Fingerprint of the current schema, refreshed if necessary."""
+        self.get()
+        return self._fingerprint
+
+    def invalidate(self):
+        """Force a rebuild on the next access."""
+        with self._lock:
+            self._schema_info = None
+            self._fingerprint = None
+            self._version = None
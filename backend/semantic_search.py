@@ -1,84 +1,496 @@
 import numpy as np
 import faiss
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
+import os
+import time
 import json
+import hashlib
 from pathlib import Path
+from embeddings import Embedder, get_embedder, schema_item_text
+
+# Open flat index storage with mmap where the installed FAISS supports it
+_MMAP_FLAGS = faiss.IO_FLAG_MMAP | getattr(faiss, 'IO_FLAG_MMAP_IFC', 0) | faiss.IO_FLAG_READ_ONLY
+
+# Supported index layouts: exact inner product, inverted lists, or an HNSW graph
+INDEX_TYPES = ('flat', 'ivf', 'hnsw')
+
+# Options that change the index structure (the rest are search-time knobs)
+_STRUCTURAL_OPTIONS = ('index_type', 'nlist', 'hnsw_m')
+
+def schema_item_id(table_name: str, column_name: str, data_type: str) -> int:
+    """Stable 63-bit ID fingerprinting a (table, column, type) triple."""
+    digest = hashlib.sha1(f"{table_name}\x1f{column_name}\x1f{data_type}".encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') & 0x7FFFFFFFFFFFFFFF
 
 class SchemaSemanticSearch:
-    def __init__(self, dimension: int = 768):
+    def __init__(self, dimension: int = 768, index_type: str = 'flat', nlist: int = 100, nprobe: int = 8,
+                 hnsw_m: int = 32, ef_search: int = 64, two_stage: bool = False, table_candidates: int = 5):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {index_type!r}, expected one of {INDEX_TYPES}")
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.two_stage = two_stage
+        self.table_candidates = table_candidates
+        self.index = self._with_ids(self._new_base_index())
         self.schema_items: List[Dict] = []
-        self.vectors: List[np.ndarray] = []
+        self.ids: List[int] = []
+        self.schema_fingerprint: Optional[str] = None
+        self.embedder_name: Optional[str] = None
+        self._positions: Dict[int, int] = {}
+        self._vectors = np.empty((0, dimension), dtype=np.float32)
+        self._pending: List[np.ndarray] = []
+        self._lookup: Optional[Tuple[np.ndarray, np.ndarray]] = None
+        self._tables: Optional[Tuple[List[str], faiss.Index, List[np.ndarray]]] = None
+        self._read_only = False
+
+    @property
+    def options(self) -> Dict:
+        """Index layout and search settings, as accepted by the constructor."""
+        return {
+            'index_type': self.index_type,
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'hnsw_m': self.hnsw_m,
+            'ef_search': self.ef_search,
+            'two_stage': self.two_stage,
+            'table_candidates': self.table_candidates,
+        }
+
+    def _new_base_index(self, train_matrix: Optional[np.ndarray] = None) -> faiss.Index:
+        """Empty inner-product index of the configured type; IVF is trained on train_matrix if given."""
+        if self.index_type == 'hnsw':
+            return faiss.IndexHNSWFlat(self.dimension, self.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        if self.index_type == 'ivf':
+            # IVF needs roughly 39 training points per list; shrink nlist for small schemas
+            n = 0 if train_matrix is None else len(train_matrix)
+            nlist = max(1, min(self.nlist, n // 39))
+            quantizer = faiss.IndexFlatIP(self.dimension)
+            index = faiss.IndexIVFFlat(quantizer, self.dimension, nlist, faiss.METRIC_INNER_PRODUCT)
+            index.own_fields = True
+            quantizer.this.disown()
+            if n:
+                index.train(train_matrix)
+            return index
+        return faiss.IndexFlatIP(self.dimension)
+
+    def _with_ids(self, base: faiss.Index) -> faiss.Index:
+        """Make base searchable by schema item ID."""
+        # IVF lists store IDs themselves, and an IDMap2 over IVF loses track of them on removal
+        if self.index_type == 'ivf':
+            return base
+        return faiss.IndexIDMap2(base)
+
+    def _search_params(self) -> Optional[faiss.SearchParameters]:
+        if self.index_type == 'ivf':
+            return faiss.SearchParametersIVF(nprobe=self.nprobe)
+        if self.index_type == 'hnsw':
+            return faiss.SearchParametersHNSW(efSearch=self.ef_search)
+        return None
+
+    def _rebuild_index(self):
+        """Rebuild the FAISS index from the stored vectors with the current options."""
+        vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+        index = self._with_ids(self._new_base_index(vectors))
+        if len(vectors):
+            index.add_with_ids(vectors, np.array(self.ids, dtype=np.int64))
+        self.index = index
+        self._vectors = vectors
+        self._read_only = False
+
+    def configure(self, **options) -> bool:
+        """Apply index options; returns True if the index had to be rebuilt (and should be saved)."""
+        unknown = set(options) - set(self.options)
+        if unknown:
+            raise ValueError(f"Unknown index options: {sorted(unknown)}")
+        if options.get('index_type', self.index_type) not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type {options['index_type']!r}, expected one of {INDEX_TYPES}")
+        rebuild = any(options.get(name, getattr(self, name)) != getattr(self, name) for name in _STRUCTURAL_OPTIONS)
+        for name, value in options.items():
+            setattr(self, name, value)
+        if rebuild:
+            self._rebuild_index()
+        return rebuild
+
+    @property
+    def vectors(self) -> np.ndarray:
+        """All stored vectors as one float32 matrix (possibly memory-mapped)."""
+        if self._pending:
+            self._vectors = np.vstack([self._vectors] + self._pending).astype(np.float32, copy=False)
+            self._pending = []
+        return self._vectors
+
+    def _ensure_writable(self):
+        """Swap a memory-mapped, read-only index for an in-memory copy before mutating it."""
+        if self._read_only:
+            self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+            self._vectors = np.array(self._vectors, dtype=np.float32)
+            self._read_only = False
+
+    def copy(self) -> 'SchemaSemanticSearch':
+        """Independent in-memory copy, so updates can be swapped in atomically."""
+        clone = SchemaSemanticSearch(self.dimension, **self.options)
+        clone.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        clone.schema_items = list(self.schema_items)
+        clone.ids = list(self.ids)
+        clone.schema_fingerprint = self.schema_fingerprint
+        clone.embedder_name = self.embedder_name
+        clone._positions = dict(self._positions)
+        clone._vectors = np.array(self.vectors, dtype=np.float32)
+        return clone
 
     def add_schema_item(self, table_name: str, column_name: str, data_type: str, vector: np.ndarray):
         """Add a schema item to the index."""
-        self.schema_items.append({
+        self.add_items([{
             'table_name': table_name,
             'column_name': column_name,
             'data_type': data_type
-        })
-        self.vectors.append(vector)
-        self.index.add(np.array([vector], dtype=np.float32))
+        }], np.asarray(vector, dtype=np.float32).reshape(1, -1))
+
+    def add_items(self, items: List[Dict], matrix: np.ndarray) -> int:
+        """Add many schema items with one (n, dimension) float32 matrix and a single FAISS call."""
+        matrix = np.array(matrix, dtype=np.float32).reshape(-1, self.dimension)
+        faiss.normalize_L2(matrix)
+        if len(items) != matrix.shape[0]:
+            raise ValueError(f"Got {len(items)} items but {matrix.shape[0]} vectors")
+        item_ids = np.array([schema_item_id(item['table_name'], item['column_name'], item['data_type'])
+                             for item in items], dtype=np.int64)
+
+        # Skip items already indexed and duplicates within the batch
+        _, first = np.unique(item_ids, return_index=True)
+        fresh = np.zeros(len(items), dtype=bool)
+        fresh[first] = True
+        fresh &= np.array([int(item_id) not in self._positions for item_id in item_ids], dtype=bool)
+        if not fresh.any():
+            return 0
+
+        self._ensure_writable()
+        item_ids, matrix = item_ids[fresh], matrix[fresh]
+        start = len(self.schema_items)
+        self.schema_items.extend(
+            {'table_name': item['table_name'], 'column_name': item['column_name'], 'data_type': item['data_type']}
+            for item, keep in zip(items, fresh) if keep
+        )
+        self.ids.extend(item_ids.tolist())
+        self._positions.update((item_id, start + i) for i, item_id in enumerate(item_ids.tolist()))
+        self._pending.append(matrix)
+        self._lookup = None
+        self._tables = None
+        if not self.index.is_trained:
+            if self.index.ntotal == 0:
+                self.index = self._with_ids(self._new_base_index(matrix))
+            else:
+                self._rebuild_index()
+                return len(item_ids)
+        self.index.add_with_ids(matrix, item_ids)
+        return len(item_ids)
+
+    def remove_schema_items(self, item_ids: List[int]) -> int:
+        """Remove schema items by fingerprint ID; returns how many were removed."""
+        drop = {item_id for item_id in item_ids if item_id in self._positions}
+        if not drop:
+            return 0
+        self._ensure_writable()
+        keep = np.array([item_id not in drop for item_id in self.ids], dtype=bool)
+        self._vectors = self.vectors[keep]
+        self.schema_items = [item for item, kept in zip(self.schema_items, keep) if kept]
+        self.ids = [item_id for item_id, kept in zip(self.ids, keep) if kept]
+        self._positions = {item_id: pos for pos, item_id in enumerate(self.ids)}
+        self._lookup = None
+        self._tables = None
+        if self.index_type == 'hnsw' or isinstance(self.index, faiss.IndexIDMap2) and self.index_type == 'ivf':
+            # HNSW graphs do not support deletion; IVF indexes saved inside an IDMap2 move to native IDs
+            self._rebuild_index()
+        else:
+            self.index.remove_ids(np.array(sorted(drop), dtype=np.int64))
+        return len(drop)
+
+    def sync(self, schema_info: Dict, fingerprint: Optional[str] = None,
+             embedder: Optional[Embedder] = None) -> Dict[str, int]:
+        """Bring the index in line with schema_info, embedding only added or changed columns."""
+        embedder = embedder or get_embedder()
+        removed = 0
+        if self.embedder_name != embedder.name:
+            # Vectors from another embedder are not comparable; start over
+            removed = self.remove_schema_items(list(self.ids))
+            self.embedder_name = embedder.name
+        wanted = {}
+        for table_name, info in schema_info.items():
+            for column_name, data_type in info['types'].items():
+                wanted[schema_item_id(table_name, column_name, data_type)] = (table_name, column_name, data_type)
+
+        removed += self.remove_schema_items([item_id for item_id in self.ids if item_id not in wanted])
+
+        # Embed only the columns the index has not seen with this type
+        missing = {}
+        for item_id, (table_name, column_name, data_type) in wanted.items():
+            if item_id not in self._positions:
+                missing.setdefault(table_name, {'types': {}})['types'][column_name] = data_type
+        added = 0
+        if missing:
+            embeddings = get_schema_embeddings(missing, embedder)
+            items = [{'table_name': t, 'column_name': c, 'data_type': d} for t, c, d, _ in embeddings]
+            added = self.add_items(items, np.stack([vector for *_, vector in embeddings]))
+
+        self.schema_fingerprint = fingerprint
+        return {'added': added, 'removed': removed, 'total': len(self.ids)}
+
+    def _positions_for(self, item_ids: np.ndarray) -> np.ndarray:
+        """Map a matrix of FAISS result IDs to row positions (-1 where missing) in one vectorized lookup."""
+        if self._lookup is None:
+            ids = np.array(self.ids, dtype=np.int64)
+            order = np.argsort(ids)
+            self._lookup = (ids[order], order)
+        sorted_ids, order = self._lookup
+        if len(sorted_ids) == 0:
+            return np.full(item_ids.shape, -1, dtype=np.int64)
+        slots = np.clip(np.searchsorted(sorted_ids, item_ids), 0, len(sorted_ids) - 1)
+        return np.where(sorted_ids[slots] == item_ids, order[slots], -1)
+
+    def _table_index(self) -> Tuple[List[str], faiss.Index, List[np.ndarray]]:
+        """Table-level vectors (normalized mean of each table's columns) and each table's row positions."""
+        if self._tables is None:
+            rows_by_table: Dict[str, List[int]] = {}
+            for pos, item in enumerate(self.schema_items):
+                rows_by_table.setdefault(item['table_name'], []).append(pos)
+            names = list(rows_by_table)
+            rows = [np.array(rows_by_table[name], dtype=np.int64) for name in names]
+            vectors = self.vectors
+            table_matrix = np.zeros((len(names), self.dimension), dtype=np.float32)
+            for i, table_rows in enumerate(rows):
+                table_matrix[i] = vectors[table_rows].mean(axis=0)
+            faiss.normalize_L2(table_matrix)
+            table_index = faiss.IndexFlatIP(self.dimension)
+            table_index.add(table_matrix)
+            self._tables = (names, table_index, rows)
+        return self._tables
+
+    def _search_two_stage(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Pick candidate tables first, then rank columns only within those tables."""
+        _, table_index, rows = self._table_index()
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        positions = np.full((len(queries), k), -1, dtype=np.int64)
+        if table_index.ntotal == 0:
+            return scores, positions
+        _, tables = table_index.search(queries, min(self.table_candidates, table_index.ntotal))
+        vectors = self.vectors
+        for q, table_ids in enumerate(tables):
+            candidates = np.concatenate([rows[t] for t in table_ids if t >= 0])
+            candidate_scores = vectors[candidates] @ queries[q]
+            top = min(k, len(candidates))
+            best = np.argpartition(-candidate_scores, top - 1)[:top]
+            best = best[np.argsort(-candidate_scores[best])]
+            scores[q, :top] = candidate_scores[best]
+            positions[q, :top] = candidates[best]
+        return scores, positions
+
+    def search_many(self, query_matrix: np.ndarray, k: int = 5) -> List[List[Dict]]:
+        """Search a (m, dimension) batch of query vectors with a single FAISS call."""
+        queries = np.array(query_matrix, dtype=np.float32).reshape(-1, self.dimension)
+        faiss.normalize_L2(queries)
+        if self.two_stage:
+            scores, positions = self._search_two_stage(queries, k)
+        else:
+            # Vectors are normalized, so inner product is the cosine similarity
+            scores, item_ids = self.index.search(queries, k, params=self._search_params())
+            positions = self._positions_for(item_ids)
+        items = self.schema_items
+        return [
+            [{**items[pos], 'similarity_score': score}
+             for pos, score in zip(row_positions.tolist(), row_scores.tolist()) if pos >= 0]
+            for row_positions, row_scores in zip(positions, scores)
+        ]
 
     def search(self, query_vector: np.ndarray, k: int = 5) -> List[Dict]:
         """Search for similar schema items."""
-        distances, indices = self.index.search(np.array([query_vector], dtype=np.float32), k)
-        results = []
-        for i, idx in enumerate(indices[0]):
-            if idx < len(self.schema_items):
-                results.append({
-                    **self.schema_items[idx],
-                    'similarity_score': float(1 / (1 + distances[0][i]))
-                })
-        return results
+        return self.search_many(np.asarray(query_vector).reshape(1, -1), k)[0]
 
     def save(self, path: str):
-        """Save the index and schema items to disk."""
+        """Save the index, schema items and float32 vectors to disk."""
         save_path = Path(path)
         save_path.mkdir(parents=True, exist_ok=True)
-        
-        # Save FAISS index
-        faiss.write_index(self.index, str(save_path / 'schema.index'))
-        
-        # Save schema items and vectors
-        with open(save_path / 'schema_data.json', 'w') as f:
+
+        # Write to temporary files and rename, so processes that mmap the old files never see a partial write
+        index_tmp = save_path / 'schema.index.tmp'
+        faiss.write_index(self.index, str(index_tmp))
+
+        # Save schema items as JSON and vectors as a raw float32 .npy matrix
+        items_tmp = save_path / 'schema_items.json.tmp'
+        with open(items_tmp, 'w') as f:
             json.dump({
+                'dimension': self.dimension,
+                'options': self.options,
+                'schema_fingerprint': self.schema_fingerprint,
+                'embedder': self.embedder_name,
                 'schema_items': self.schema_items,
-                'vectors': [v.tolist() for v in self.vectors]
+                'ids': self.ids
             }, f)
+        vectors_tmp = save_path / 'vectors.tmp.npy'
+        np.save(vectors_tmp, np.ascontiguousarray(self.vectors, dtype=np.float32))
+
+        os.replace(vectors_tmp, save_path / 'vectors.npy')
+        os.replace(index_tmp, save_path / 'schema.index')
+        os.replace(items_tmp, save_path / 'schema_items.json')
+
+        # Drop the legacy JSON vector dump if one is lying around
+        legacy_path = save_path / 'schema_data.json'
+        if legacy_path.exists():
+            legacy_path.unlink()
 
     @classmethod
-    def load(cls, path: str) -> 'SchemaSemanticSearch':
-        """Load the index and schema items from disk."""
+    def load(cls, path: str, mmap: bool = True) -> 'SchemaSemanticSearch':
+        """Load the index and schema items from disk, memory-mapping the vectors by default."""
         load_path = Path(path)
-        
+
+        # Older indexes stored vectors as JSON lists; convert them once
+        if not (load_path / 'vectors.npy').exists() and (load_path / 'schema_data.json').exists():
+            cls._load_legacy(load_path).save(path)
+
+        with open(load_path / 'schema_items.json', 'r') as f:
+            data = json.load(f)
+
         # Create new instance
+        instance = cls(dimension=data['dimension'], **data.get('options', {}))
+        instance.schema_items = data['schema_items']
+        instance.schema_fingerprint = data.get('schema_fingerprint')
+        instance.embedder_name = data.get('embedder')
+
+        # Indexes saved before fingerprint IDs or inner-product search existed are rebuilt once
+        if 'ids' not in data or 'options' not in data:
+            instance._vectors = np.load(load_path / 'vectors.npy')
+            instance._rekey()
+            instance.save(path)
+            return instance
+
+        instance.ids = data['ids']
+        instance._positions = {item_id: pos for pos, item_id in enumerate(instance.ids)}
+
+        # Load FAISS index and vectors; mmapped pages are shared between worker processes
+        if mmap:
+            # Only flat storage can be mapped directly; IVF and HNSW are read into memory
+            flags = _MMAP_FLAGS if instance.index_type == 'flat' else 0
+            instance.index = faiss.read_index(str(load_path / 'schema.index'), flags)
+            instance._vectors = np.load(load_path / 'vectors.npy', mmap_mode='r')
+            instance._read_only = True
+        else:
+            instance.index = faiss.read_index(str(load_path / 'schema.index'))
+            instance._vectors = np.load(load_path / 'vectors.npy')
+
+        return instance
+
+    def _rekey(self):
+        """Rebuild an ID-mapped index keyed by schema item fingerprints."""
+        self.ids = [schema_item_id(item['table_name'], item['column_name'], item['data_type'])
+                    for item in self.schema_items]
+        self._positions = {item_id: pos for pos, item_id in enumerate(self.ids)}
+        self._lookup = None
+        self._tables = None
+        vectors = np.array(self.vectors, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        self._vectors = vectors
+        self._rebuild_index()
+
+    @classmethod
+    def _load_legacy(cls, load_path: Path) -> 'SchemaSemanticSearch':
+        """Load an index saved in the old schema_data.json format."""
         instance = cls()
-        
-        # Load FAISS index
-        instance.index = faiss.read_index(str(load_path / 'schema.index'))
-        
-        # Load schema items and vectors
         with open(load_path / 'schema_data.json', 'r') as f:
             data = json.load(f)
             instance.schema_items = data['schema_items']
-            instance.vectors = [np.array(v) for v in data['vectors']]
-        
+            instance._vectors = np.asarray(data['vectors'], dtype=np.float32).reshape(-1, instance.dimension)
+        instance._rekey()
         return instance
 
-def get_schema_embeddings(schema_info: Dict) -> List[Tuple[str, str, str, np.ndarray]]:
+def get_schema_embeddings(schema_info: Dict, embedder: Optional[Embedder] = None) -> List[Tuple[str, str, str, np.ndarray]]:
+    """Embed every (table, column, type) in schema_info with a single batched embedder call."""
+    embedder = embedder or get_embedder()
+    columns = [(table_name, column_name, data_type)
+               for table_name, info in schema_info.items()
+               for column_name, data_type in info['types'].items()]
+    if not columns:
+        return []
+    matrix = embedder.embed([schema_item_text(*column) for column in columns])
+    return [(*column, vector) for column, vector in zip(columns, matrix)]
+
+def recall_report(search: SchemaSemanticSearch, queries: np.ndarray, k: int = 5,
+                  configs: Optional[List[Dict]] = None) -> List[Dict]:
     """
-    Generate embeddings for schema items.
-    In a real implementation, this would use a proper embedding model.
-    For now, we'll use a simple random vector as a placeholder.
+    Measure recall@k and latency of index configurations against exact flat search.
+    Each config is a dict of index options (see SchemaSemanticSearch.options).
     """
-    embeddings = []
-    for table_name, info in schema_info.items():
-        for column_name, data_type in info['types'].items():
-            # Generate a random vector as a placeholder
-            # In production, replace this with actual embeddings from a model
-            vector = np.random.randn(768).astype(np.float32)
-            vector = vector / np.linalg.norm(vector)  # Normalize
-            embeddings.append((table_name, column_name, data_type, vector))
-    return embeddings 
\ No newline at end of file
+    if configs is None:
+        configs = [
+            {'index_type': 'flat'},
+            {'index_type': 'ivf', 'nprobe': 1},
+            {'index_type': 'ivf', 'nprobe': 8},
+            {'index_type': 'ivf', 'nprobe': 32},
+            {'index_type': 'hnsw', 'ef_search': 16},
+            {'index_type': 'hnsw', 'ef_search': 64},
+            {'index_type': 'hnsw', 'ef_search': 256},
+            {'index_type': 'flat', 'two_stage': True, 'table_candidates': 5},
+            {'index_type': 'flat', 'two_stage': True, 'table_candidates': 20},
+        ]
+    queries = np.array(queries, dtype=np.float32).reshape(-1, search.dimension)
+    faiss.normalize_L2(queries)
+
+    # Exact top-k by brute-force inner product
+    vectors = np.asarray(search.vectors, dtype=np.float32)
+    ids = np.array(search.ids, dtype=np.int64)
+    exact = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    truth = [set(ids[row].tolist()) for row in exact]
+
+    report = []
+    for config in configs:
+        candidate = search.copy()
+        candidate.configure(**{**search.options, 'two_stage': False, **config})
+        start = time.perf_counter()
+        results = candidate.search_many(queries, k)
+        elapsed = time.perf_counter() - start
+        found = [{schema_item_id(r['table_name'], r['column_name'], r['data_type']) for r in row}
+                 for row in results]
+        recall = np.mean([len(f & t) / len(t) for f, t in zip(found, truth) if t]) if truth else 1.0
+        report.append({
+            **config,
+            'recall_at_k': float(recall),
+            'latency_ms_per_query': 1000 * elapsed / max(1, len(queries)),
+        })
+    return report
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recall vs. latency of schema index settings against flat search")
+    parser.add_argument('--index', help="Saved index directory; defaults to a synthetic schema")
+    parser.add_argument('--tables', type=int, default=500, help="Tables in the synthetic schema")
+    parser.add_argument('--columns', type=int, default=40, help="Columns per synthetic table")
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.index:
+        base = SchemaSemanticSearch.load(args.index, mmap=False)
+    else:
+        # Clustered synthetic vectors: columns of a table lie near the table's centroid
+        rng = np.random.default_rng(0)
+        base = SchemaSemanticSearch()
+        centroids = rng.standard_normal((args.tables, base.dimension)).astype(np.float32)
+        matrix = np.repeat(centroids, args.columns, axis=0)
+        matrix += 0.8 * rng.standard_normal(matrix.shape).astype(np.float32)
+        items = [{'table_name': f"T{t}", 'column_name': f"C{c}", 'data_type': 'INTEGER'}
+                 for t in range(args.tables) for c in range(args.columns)]
+        base.add_items(items, matrix)
+
+    rng = np.random.default_rng(1)
+    sample = rng.choice(len(base.ids), size=min(args.queries, len(base.ids)), replace=False)
+    query_matrix = np.asarray(base.vectors)[sample]
+    query_matrix = query_matrix + 0.5 * rng.standard_normal(query_matrix.shape).astype(np.float32)
+
+    print(f"{len(base.ids)} schema items, {len(query_matrix)} queries, k={args.k}")
+    print(f"{'configuration':<60} {'recall@k':>9} {'ms/query':>9}")
+    for row in recall_report(base, query_matrix, args.k):
+        config = ', '.join(f"{key}={value}" for key, value in row.items()
+                           if key not in ('recall_at_k', 'latency_ms_per_query'))
+        print(f"{config:<60} {row['recall_at_k']:>9.3f} {row['latency_ms_per_query']:>9.3f}")
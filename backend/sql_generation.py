@@ -0,0 +1,201 @@
+import re
+import json
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from results import fetch_page
+from guardrails import QueryRejectedError, check_read_only
+from metrics import current_trace, record_llm_call, stage
+from value_index import format_values
+
+logger = logging.getLogger(__name__)
+
+PROMPT_TEMPLATE = """You are an expert {dialect} SQL developer.
+Write one read-only SQL query (SELECT or WITH) that answers the question, using only these tables and columns:
+
+{schema}
+{values}
+Question: {question}
+
+Respond with JSON only, no explanation: {{"sql": "<the query>"}}"""
+
+_JSON_OBJECT = re.compile(r'\{.*\}', re.DOTALL)
+_SQL_FENCE = re.compile(r'```(?:sql)?\s*(.*?)```', re.DOTALL | re.IGNORECASE)
+
+
+class SQLGenerationError(Exception):
+    """Raised when the single-shot path cannot produce runnable SQL."""
+
+
+def token_usage(response) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt, completion) token counts reported by the provider, if any."""
+    usage = (getattr(response, 'llm_output', None) or {}).get('token_usage') or {}
+    if not usage:
+        for generations in getattr(response, 'generations', []):
+            for generation in generations:
+                message = getattr(generation, 'message', None)
+                usage = (getattr(message, 'response_metadata', None) or {}).get('token_usage') or {}
+                if usage:
+                    break
+    return usage.get('prompt_tokens'), usage.get('completion_tokens')
+
+
+class LLMCallCounter:
+    """Counts LLM calls made while answering one question and records their latency and token usage."""
+
+    def __init__(self):
+        self.calls = 0
+        self.trace = current_trace()
+        self._started: Dict = {}
+
+    def on_llm_start(self, serialized, prompts, *, run_id=None, **kwargs):
+        self.calls += 1
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id=None, **kwargs):
+        self.calls += 1
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id=None, **kwargs):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            record_llm_call(time.perf_counter() - started, *token_usage(response), trace=self.trace)
+
+    def on_llm_error(self, error, *, run_id=None, **kwargs):
+        self._started.pop(run_id, None)
+
+
+class AgentStepStreamer:
+    """Forwards each agent action and tool observation to a callback as it happens."""
+
+    def __init__(self, emit: Callable[[str, Dict], None], max_observation: int = 2000):
+        self.emit = emit
+        self.max_observation = max_observation
+
+    def on_agent_action(self, action, **kwargs):
+        self.emit('step', {'tool': action.tool, 'tool_input': action.tool_input, 'log': action.log})
+
+    def on_tool_end(self, output, **kwargs):
+        self.emit('observation', {'output': str(output)[:self.max_observation]})
+
+
+_handler_classes: Dict[type, type] = {}
+
+
+def callback_handler(cls: type, *args, **kwargs):
+    """
+    An instance of cls (LLMCallCounter, AgentStepStreamer) as a langchain
+    callback handler. Only the agent needs these, so langchain_core is
+    imported on first use rather than with this module.
+    """
+    handler_class = _handler_classes.get(cls)
+    if handler_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+        handler_class = _handler_classes.setdefault(cls, type(cls.__name__, (cls, BaseCallbackHandler), {}))
+    return handler_class(*args, **kwargs)
+
+
+def prune_schema(schema_info: Dict, relevant_items: List[Dict]) -> Dict:
+    """Tables mentioned by the semantic search results plus the tables they reference."""
+    tables = {item['table_name'] for item in relevant_items if item['table_name'] in schema_info}
+    if not tables:
+        return schema_info
+    for name in list(tables):
+        for fk in schema_info[name].get('foreign_keys', []):
+            if fk.get('referred_table') in schema_info:
+                tables.add(fk['referred_table'])
+    return {name: info for name, info in schema_info.items() if name in tables}
+
+
+def format_schema(schema_info: Dict) -> str:
+    """Compact one-line-per-table schema description for the prompt."""
+    lines = []
+    for name, info in schema_info.items():
+        columns = ", ".join(f"{column} {info['types'][column]}" for column in info['columns'])
+        line = f"{'VIEW' if info.get('is_view') else 'TABLE'} {name} ({columns})"
+        foreign_keys = [
+            f"{', '.join(fk['constrained_columns'])} -> {fk['referred_table']}({', '.join(fk['referred_columns'])})"
+            for fk in info.get('foreign_keys', [])
+        ]
+        if foreign_keys:
+            line += f" FOREIGN KEYS: {'; '.join(foreign_keys)}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def parse_sql(output: str) -> str:
+    """Pull the SQL out of the model's JSON answer, tolerating code fences and stray prose."""
+    match = _JSON_OBJECT.search(output)
+    if match:
+        try:
+            sql = json.loads(match.group(0)).get('sql', '')
+            if sql:
+                return sql.strip().rstrip(';').strip()
+        except (ValueError, AttributeError):
+            pass
+    match = _SQL_FENCE.search(output)
+    if match:
+        return match.group(1).strip().rstrip(';').strip()
+    raise SQLGenerationError(f"No SQL found in model output: {output[:200]}")
+
+
+def validate_sql(engine: Engine, sql: str):
+    """Reject anything but a single read-only statement and let the database plan it."""
+    try:
+        check_read_only(sql)
+    except QueryRejectedError as e:
+        raise SQLGenerationError(f"Generated SQL is not a single read-only query: {e}") from e
+    explain = "EXPLAIN QUERY PLAN" if engine.dialect.name == 'sqlite' else "EXPLAIN"
+    try:
+        with engine.connect() as conn:
+            conn.execute(text(f"{explain} {sql}")).fetchall()
+    except Exception as e:
+        raise SQLGenerationError(f"Generated SQL failed validation: {e}") from e
+
+
+def generate_single_shot_sql(llm, engine: Engine, question: str, relevant_items: List[Dict],
+                             schema_info: Dict, relevant_values: Optional[List[Dict]] = None) -> Tuple[str, str]:
+    """One LLM call for validated SQL; returns (sql, raw model output)."""
+    relevant_values = relevant_values or []
+    values = ""
+    if relevant_values:
+        values = f"\nValues mentioned in the question, spelled as stored:\n{format_values(relevant_values)}\n"
+    prompt = PROMPT_TEMPLATE.format(
+        dialect=engine.dialect.name,
+        # The tables holding matched values are needed even if the column search missed them
+        schema=format_schema(prune_schema(schema_info, relevant_items + relevant_values)),
+        values=values,
+        question=question,
+    )
+    with stage('llm'):
+        message = llm.invoke(prompt, config={"callbacks": [callback_handler(LLMCallCounter)]})
+    output = getattr(message, 'content', message)
+    sql = parse_sql(output)
+    with stage('sql_validation'):
+        validate_sql(engine, sql)
+    return sql, output
+
+
+def answer_single_shot(llm, engine: Engine, question: str, relevant_items: List[Dict],
+                       schema_info: Dict, max_rows: int = 1000, relevant_values: Optional[List[Dict]] = None) -> Dict:
+    """Generate SQL with one LLM call, check it with EXPLAIN and run it directly, returning the first page."""
+    sql, output = generate_single_shot_sql(llm, engine, question, relevant_items, schema_info, relevant_values)
+    try:
+        rows = fetch_page(engine, sql, max_rows)
+    except Exception as e:
+        raise SQLGenerationError(f"Generated SQL failed to execute: {e}") from e
+    return {
+        "sql": sql,
+        "result": rows["rows"],
+        "columns": rows["columns"],
+        "column_types": rows["column_types"],
+        "truncated": rows["truncated"],
+        "next_cursor": rows["next_cursor"],
+        "raw_output": output,
+        "error": None,
+        "relevant_schema": relevant_items,
+        "relevant_values": relevant_values or [],
+        "llm_calls": 1
+    }
@@ -1,26 +1,32 @@
 import sqlite3
-import pandas as pd
 import os
-from faker import Faker
+import time
 import random
+import argparse
+import datetime
+from faker import Faker
 
 # Initialize faker for generating realistic student data
 fake = Faker()
 
-# Create or connect to the SQLite database
-def create_student_database():
-    print("Creating enhanced student database...")
-    connection = sqlite3.connect("student.db")
-    cursor = connection.cursor()
-    
-    # Drop tables if they exist
-    cursor.execute("DROP TABLE IF EXISTS STUDENT_GRADES")
-    cursor.execute("DROP TABLE IF EXISTS STUDENT")
-    cursor.execute("DROP TABLE IF EXISTS COURSE")
-    cursor.execute("DROP TABLE IF EXISTS TEACHER")
-    
-    # Create TEACHER table
-    cursor.execute("""
+DEPARTMENTS = ["Computer Science", "Mathematics", "Physics", "Engineering", "Biology"]
+COURSE_NAMES = [
+    "Introduction to Programming", "Data Structures", "Algorithms",
+    "Machine Learning", "Artificial Intelligence", "Database Systems",
+    "Computer Networks", "Operating Systems", "Software Engineering",
+    "Calculus I", "Linear Algebra", "Statistics", "Physics I",
+    "Digital Logic", "Computer Architecture", "Web Development"
+]
+CLASSES = ["AI_ML", "CS", "DSA", "IoT", "Cybersecurity"]
+SECTIONS = ["A", "B", "C"]
+GRADUATION_YEARS = [2023, 2024, 2025, 2026]
+SEMESTERS = ["Fall", "Spring", "Summer"]
+
+# Grade letter for each mark from 0 to 100
+GRADES = ["F"] * 50 + ["D"] * 10 + ["C"] * 10 + ["B"] * 10 + ["B+"] * 10 + ["A"] * 11
+
+SCHEMA = [
+    """
     CREATE TABLE TEACHER (
         TEACHER_ID INTEGER PRIMARY KEY,
         NAME VARCHAR(50),
@@ -28,10 +34,8 @@ def create_student_database():
         YEARS_EXPERIENCE INTEGER,
         EMAIL VARCHAR(100)
     )
-    """)
-    
-    # Create COURSE table
-    cursor.execute("""
+    """,
+    """
     CREATE TABLE COURSE (
         COURSE_ID INTEGER PRIMARY KEY,
         NAME VARCHAR(50),
@@ -40,10 +44,8 @@ def create_student_database():
         TEACHER_ID INTEGER,
         FOREIGN KEY (TEACHER_ID) REFERENCES TEACHER(TEACHER_ID)
     )
-    """)
-    
-    # Create STUDENT table with more fields
-    cursor.execute("""
+    """,
+    """
     CREATE TABLE STUDENT (
         STUDENT_ID INTEGER PRIMARY KEY,
         NAME VARCHAR(50),
@@ -53,10 +55,8 @@ def create_student_database():
         EMAIL VARCHAR(100),
         GRADUATION_YEAR INTEGER
     )
-    """)
-    
-    # Create STUDENT_GRADES table for normalized structure
-    cursor.execute("""
+    """,
+    """
     CREATE TABLE STUDENT_GRADES (
         ID INTEGER PRIMARY KEY,
         STUDENT_ID INTEGER,
@@ -68,134 +68,214 @@ def create_student_database():
         FOREIGN KEY (STUDENT_ID) REFERENCES STUDENT(STUDENT_ID),
         FOREIGN KEY (COURSE_ID) REFERENCES COURSE(COURSE_ID)
     )
-    """)
-    
-    # Generate and insert sample data
-    # Teachers
-    teachers = []
-    departments = ["Computer Science", "Mathematics", "Physics", "Engineering", "Biology"]
-    for i in range(1, 11):
-        teacher = (
-            i,
-            fake.name(),
-            random.choice(departments),
-            random.randint(1, 20),
-            fake.email()
-        )
-        teachers.append(teacher)
-        cursor.execute("INSERT INTO TEACHER VALUES (?, ?, ?, ?, ?)", teacher)
-    
-    # Courses
-    courses = []
-    course_names = [
-        "Introduction to Programming", "Data Structures", "Algorithms", 
-        "Machine Learning", "Artificial Intelligence", "Database Systems",
-        "Computer Networks", "Operating Systems", "Software Engineering",
-        "Calculus I", "Linear Algebra", "Statistics", "Physics I",
-        "Digital Logic", "Computer Architecture", "Web Development"
-    ]
-    
-    for i in range(1, len(course_names) + 1):
-        dept = random.choice(departments)
-        course = (
-            i,
-            course_names[i-1],
-            dept,
-            random.choice([3, 4, 5]),
-            random.choice([t[0] for t in teachers])
-        )
-        courses.append(course)
-        cursor.execute("INSERT INTO COURSE VALUES (?, ?, ?, ?, ?)", course)
-    
-    # Students
-    students = []
-    classes = ["AI_ML", "CS", "DSA", "IoT", "Cybersecurity"]
-    sections = ["A", "B", "C"]
-    years = [2023, 2024, 2025, 2026]
-    
-    for i in range(1, 101):  # Generate 100 students
-        student = (
-            i,
-            fake.name(),
-            random.choice(classes),
-            random.choice(sections),
-            fake.date_between(start_date="-3y", end_date="today"),
-            fake.email(),
-            random.choice(years)
-        )
-        students.append(student)
-        cursor.execute("INSERT INTO STUDENT VALUES (?, ?, ?, ?, ?, ?, ?)", student)
-    
-    # Student Grades
-    semesters = ["Fall", "Spring", "Summer"]
-    grades_map = {
-        range(0, 50): "F",
-        range(50, 60): "D",
-        range(60, 70): "C",
-        range(70, 80): "B",
-        range(80, 90): "B+",
-        range(90, 101): "A"
-    }
-    
+    """,
+]
+
+# Created after the bulk load, which is much faster than maintaining them row by row
+INDEXES = [
+    "CREATE INDEX idx_student_grades_student_id ON STUDENT_GRADES(STUDENT_ID)",
+    "CREATE INDEX idx_student_grades_course_id ON STUDENT_GRADES(COURSE_ID)",
+    "CREATE INDEX idx_course_teacher_id ON COURSE(TEACHER_ID)",
+]
+
+VIEW = """
+CREATE VIEW student_performance AS
+SELECT
+    s.STUDENT_ID,
+    s.NAME as STUDENT_NAME,
+    s.CLASS,
+    s.SECTION,
+    c.NAME as COURSE_NAME,
+    c.DEPARTMENT,
+    sg.MARKS,
+    sg.GRADE,
+    t.NAME as TEACHER_NAME
+FROM STUDENT s
+JOIN STUDENT_GRADES sg ON s.STUDENT_ID = sg.STUDENT_ID
+JOIN COURSE c ON sg.COURSE_ID = c.COURSE_ID
+JOIN TEACHER t ON c.TEACHER_ID = t.TEACHER_ID
+"""
+
+TABLES = ["TEACHER", "COURSE", "STUDENT", "STUDENT_GRADES"]
+
+
+class ValuePools:
+    """Names and email domains drawn from Faker once, then combined per row with a seeded RNG."""
+
+    def __init__(self, rng: random.Random, size: int = 500):
+        self.rng = rng
+        self.first_names = [fake.first_name() for _ in range(size)]
+        self.last_names = [fake.last_name() for _ in range(size)]
+        self.domains = [fake.free_email_domain() for _ in range(20)]
+
+    def person(self, number: int, prefix: str = ""):
+        """A (name, email) pair; the number keeps emails unique."""
+        first = self.rng.choice(self.first_names)
+        last = self.rng.choice(self.last_names)
+        email = f"{prefix}{first.lower()}.{last.lower()}{number}@{self.rng.choice(self.domains)}"
+        return f"{first} {last}", email
+
+
+def generate_teachers(rng, pools, count):
+    for i in range(1, count + 1):
+        name, email = pools.person(i, "t.")
+        yield (i, name, rng.choice(DEPARTMENTS), rng.randint(1, 20), email)
+
+
+def generate_courses(rng, count, teachers):
+    for i in range(1, count + 1):
+        base = COURSE_NAMES[(i - 1) % len(COURSE_NAMES)]
+        copy = (i - 1) // len(COURSE_NAMES)
+        name = base if copy == 0 else f"{base} ({copy + 1})"
+        yield (i, name, rng.choice(DEPARTMENTS), rng.choice([3, 4, 5]), rng.randint(1, teachers))
+
+
+def generate_students(rng, pools, count):
+    today = datetime.date.today()
+    for i in range(1, count + 1):
+        name, email = pools.person(i)
+        enrolled = today - datetime.timedelta(days=rng.randint(0, 3 * 365))
+        yield (i, name, rng.choice(CLASSES), rng.choice(SECTIONS), enrolled.isoformat(), email,
+               rng.choice(GRADUATION_YEARS))
+
+
+def generate_grades(rng, students, courses):
     grade_id = 1
-    for student in students:
+    course_ids = range(1, courses + 1)
+    for student_id in range(1, students + 1):
         # Each student takes 3-6 random courses
-        num_courses = random.randint(3, 6)
-        taken_courses = random.sample(courses, num_courses)
-        
-        for course in taken_courses:
-            marks = random.randint(35, 100)
-            grade = next(g for r, g in grades_map.items() if marks in r)
-            
-            grade_entry = (
-                grade_id,
-                student[0],
-                course[0],
-                random.choice(semesters),
-                random.randint(2022, 2024),
-                marks,
-                grade
-            )
-            cursor.execute("INSERT INTO STUDENT_GRADES VALUES (?, ?, ?, ?, ?, ?, ?)", grade_entry)
+        for course_id in rng.sample(course_ids, min(courses, rng.randint(3, 6))):
+            marks = rng.randint(35, 100)
+            yield (grade_id, student_id, course_id, rng.choice(SEMESTERS), rng.randint(2022, 2024), marks,
+                   GRADES[marks])
             grade_id += 1
-    
+
+
+def insert_batches(cursor, table, rows, batch_size):
+    """executemany in fixed-size batches so memory stays flat at any scale."""
+    total = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(row))})", batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(batch[0]))})", batch)
+        total += len(batch)
+    return total
+
+
+def _copy_value(value):
+    if value is None:
+        return r"\N"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def write_postgres_dump(connection, path, batch_size=10000):
+    """Write the database as a psql script: tables, COPY data, then indexes and the view."""
+    cursor = connection.cursor()
+    with open(path, "w", encoding="utf-8") as dump:
+        dump.write("BEGIN;\n")
+        dump.write("DROP VIEW IF EXISTS student_performance;\n")
+        for table in reversed(TABLES):
+            dump.write(f"DROP TABLE IF EXISTS {table};\n")
+        for statement in SCHEMA:
+            dump.write(statement.replace("MARKS FLOAT", "MARKS DOUBLE PRECISION").strip() + ";\n")
+        for table in TABLES:
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+            dump.write(f"COPY {table} ({', '.join(columns)}) FROM stdin;\n")
+            result = cursor.execute(f"SELECT * FROM {table} ORDER BY 1")
+            while True:
+                rows = result.fetchmany(batch_size)
+                if not rows:
+                    break
+                dump.writelines("\t".join(_copy_value(value) for value in row) + "\n" for row in rows)
+            dump.write("\\.\n")
+        for statement in INDEXES:
+            dump.write(statement + ";\n")
+        dump.write(VIEW.strip() + ";\n")
+        dump.write("ANALYZE;\nCOMMIT;\n")
+
+
+# Create or connect to the SQLite database
+def create_student_database(path="student.db", scale=1, seed=None, batch_size=50000, pg_dump=None):
+    """
+    Build the student database. scale=1 gives 100 students and 10 teachers;
+    larger scales multiply both (scale 1000: 100k students, ~450k grades).
+    """
+    print(f"Creating enhanced student database (scale {scale})...")
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    if seed is not None:
+        Faker.seed(seed)
+    pools = ValuePools(rng)
+    teachers = 10 * scale
+    students = 100 * scale
+    courses = len(COURSE_NAMES) * max(1, scale // 10)
+
+    connection = sqlite3.connect(path)
+    cursor = connection.cursor()
+    # Bulk-load settings: no fsync, WAL journaling; restored once the load is done
+    cursor.execute("PRAGMA journal_mode = WAL")
+    cursor.execute("PRAGMA synchronous = OFF")
+    cursor.execute("PRAGMA cache_size = -200000")
+
+    # Drop tables if they exist
+    cursor.execute("DROP VIEW IF EXISTS student_performance")
+    for table in reversed(TABLES):
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+    for statement in SCHEMA:
+        cursor.execute(statement)
+
+    counts = {
+        "teachers": insert_batches(cursor, "TEACHER", generate_teachers(rng, pools, teachers), batch_size),
+        "courses": insert_batches(cursor, "COURSE", generate_courses(rng, courses, teachers), batch_size),
+        "students": insert_batches(cursor, "STUDENT", generate_students(rng, pools, students), batch_size),
+        "grade records": insert_batches(cursor, "STUDENT_GRADES", generate_grades(rng, students, courses),
+                                        batch_size),
+    }
+    connection.commit()
+    loaded = time.perf_counter() - started
+
+    for statement in INDEXES:
+        cursor.execute(statement)
     # Create some views for convenience
-    cursor.execute("""
-    CREATE VIEW student_performance AS
-    SELECT 
-        s.STUDENT_ID,
-        s.NAME as STUDENT_NAME,
-        s.CLASS,
-        s.SECTION,
-        c.NAME as COURSE_NAME,
-        c.DEPARTMENT,
-        sg.MARKS,
-        sg.GRADE,
-        t.NAME as TEACHER_NAME
-    FROM STUDENT s
-    JOIN STUDENT_GRADES sg ON s.STUDENT_ID = sg.STUDENT_ID
-    JOIN COURSE c ON sg.COURSE_ID = c.COURSE_ID
-    JOIN TEACHER t ON c.TEACHER_ID = t.TEACHER_ID
-    """)
-    
-    # Commit and create a summary report
+    cursor.execute(VIEW)
+    cursor.execute("ANALYZE")
     connection.commit()
-    
+    cursor.execute("PRAGMA synchronous = FULL")
+    cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    cursor.execute("PRAGMA journal_mode = DELETE")
+
     # Output database summary
     print("\nDatabase created successfully with the following structure:")
-    print(f"- {len(teachers)} teachers")
-    print(f"- {len(courses)} courses")
-    print(f"- {len(students)} students")
-    print(f"- {grade_id-1} grade records")
-    
+    for label, count in counts.items():
+        print(f"- {count} {label}")
+    print(f"Loaded in {loaded:.1f}s, indexed in {time.perf_counter() - started - loaded:.1f}s")
+
     # Show example data
     print("\nSample student performance data:")
     sample_data = cursor.execute("SELECT * FROM student_performance LIMIT 5").fetchall()
     for row in sample_data:
         print(row)
-    
+
+    if pg_dump:
+        write_postgres_dump(connection, pg_dump)
+        print(f"\nPostgres dump written to {pg_dump} (load with: psql -f {os.path.basename(pg_dump)})")
+
     connection.close()
     print("\nDatabase setup completed!")
+    return counts
+
 
 if __name__ == "__main__":
-    create_student_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate the student database, optionally at a larger scale")
+    parser.add_argument("--scale", type=int, default=1, help="Multiplier: 100 x scale students, 10 x scale teachers")
+    parser.add_argument("--path", default="student.db", help="SQLite file to (re)create")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible data")
+    parser.add_argument("--batch-size", type=int, default=50000, help="Rows per executemany batch")
+    parser.add_argument("--pg-dump", help="Also write a Postgres-compatible SQL dump to this file")
+    args = parser.parse_args()
+    create_student_database(args.path, args.scale, args.seed, args.batch_size, args.pg_dump)
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import pytest
+
+# Settings are read when modules are imported, so point every file the app writes at a scratch directory first
+SCRATCH = tempfile.mkdtemp(prefix='smartsql-tests-')
+STUDENT_DB = os.path.join(SCRATCH, 'student.db')
+os.environ.update({
+    'GROQ_API_KEY': 'test',
+    'DATABASE_URL': f'sqlite:///{STUDENT_DB}',
+    'SCHEMA_INDEX_PATH': os.path.join(SCRATCH, 'schema_index'),
+    'DATASOURCE_INDEX_DIR': os.path.join(SCRATCH, 'schema_indexes'),
+    'EMBEDDING_CACHE_PATH': '',
+    'QUERY_CACHE_PATH': '',
+    'WORKLOAD_PATH': os.path.join(SCRATCH, 'workload.db'),
+})
+
+
+@pytest.fixture(scope='session')
+def student_db():
+    """Path of a demo student database (scale 1) shared by the session."""
+    if not os.path.exists(STUDENT_DB):
+        from sqlite import create_student_database
+        create_student_database(STUDENT_DB, scale=1, seed=7)
+    return STUDENT_DB
+
+
+@pytest.fixture(scope='session')
+def app_module(student_db):
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def llm(app_module, monkeypatch):
+    """The benchmark's scripted stand-in LLM in place of ChatGroq, with empty caches."""
+    from benchmark import DEFAULT_CORPUS, MockLLM
+    from query_cache import normalize_question
+    stand_in = MockLLM(script={normalize_question(question): sql for question, sql in DEFAULT_CORPUS})
+    monkeypatch.setattr(app_module, 'get_llm', lambda: stand_in)
+    app_module.query_cache.clear()
+    semantic_cache = app_module.get_semantic_query_cache()
+    if semantic_cache is not None:
+        semantic_cache.clear()
+    return stand_in
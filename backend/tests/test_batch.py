@@ -0,0 +1,94 @@
+import threading
+import time
+import pytest
+import batch
+from batch import parse_max_workers, run_batch
+
+
+@pytest.mark.parametrize("value, expected", [(None, 16), (1, 1), (4, 4), ("4", 4), (4.0, 4), (10 ** 6, 16)])
+def test_parse_max_workers(value, expected):
+    assert parse_max_workers(value, limit=16) == expected
+
+
+@pytest.mark.parametrize("value", [0, -3, "x", "", 2.5, True, [4], {"n": 4}])
+def test_parse_max_workers_rejects(value):
+    with pytest.raises(ValueError):
+        parse_max_workers(value, limit=16)
+
+
+def test_run_batch_dedupes_and_maps_positions():
+    calls = []
+
+    def answer(question):
+        calls.append(question)
+        return {"answer": question.upper()}
+
+    results = list(run_batch(["a", "b", "A ", "c", "b?"], answer, max_workers=2))
+    assert sorted(calls) == ["a", "b", "c"]
+    by_index = {result["index"]: result for result in results}
+    assert by_index[0]["indices"] == [0, 2]
+    assert by_index[1]["indices"] == [1, 4]
+    assert by_index[3]["answer"] == "C"
+
+
+def test_run_batch_reports_failures():
+    def answer(question):
+        if question == "bad":
+            raise RuntimeError("boom")
+        return {"answer": question}
+
+    results = {result["query"]: result for result in run_batch(["ok", "bad"], answer)}
+    assert results["bad"]["status"] == 500 and results["bad"]["error"] == "boom"
+    assert results["ok"]["answer"] == "ok"
+
+
+def test_run_batch_caps_workers(monkeypatch):
+    monkeypatch.setattr(batch, 'BATCH_MAX_WORKERS', 2)
+    lock = threading.Lock()
+    running = peak = 0
+
+    def answer(question):
+        nonlocal running, peak
+        with lock:
+            running += 1
+            peak = max(peak, running)
+        time.sleep(0.02)
+        with lock:
+            running -= 1
+        return {}
+
+    list(run_batch([str(i) for i in range(8)], answer, max_workers=100))
+    assert peak <= 2
+
+
+def test_closing_the_batch_early_cancels_pending_questions():
+    started = []
+    release = threading.Event()
+
+    def answer(question):
+        started.append(question)
+        if question != "0":
+            release.wait(5)
+        return {}
+
+    results = run_batch([str(i) for i in range(20)], answer, max_workers=2)
+    assert next(results)["query"] == "0"
+    began = time.monotonic()
+    results.close()
+    # The generator returned without waiting for the blocked call
+    assert time.monotonic() - began < 1
+    release.set()
+    time.sleep(0.1)
+    assert len(started) <= 3
+
+
+@pytest.mark.parametrize("max_workers", ["x", 0, -1, 1.5, [2]])
+def test_batch_endpoint_rejects_invalid_max_workers(client, max_workers):
+    response = client.post('/api/query/batch', json={"queries": ["How many students?"], "max_workers": max_workers})
+    assert response.status_code == 400
+    assert "max_workers" in response.get_json()["error"]
+
+
+def test_batch_endpoint_rejects_invalid_queries(client):
+    assert client.post('/api/query/batch', json={"queries": []}).status_code == 400
+    assert client.post('/api/query/batch', json={"queries": ["ok", 3]}).status_code == 400
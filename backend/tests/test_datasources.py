@@ -0,0 +1,75 @@
+import pytest
+from sqlalchemy import text
+from datasources import DatasourceRegistry, UnknownDatasourceError
+
+
+@pytest.fixture
+def registry(tmp_path):
+    configs = {name: {"url": f"sqlite:///{tmp_path / name}.db", "index_path": str(tmp_path / f"{name}_index")}
+               for name in ("a", "b", "c")}
+    return DatasourceRegistry(configs, default="a", max_active=1)
+
+
+def test_unknown_datasource(registry):
+    with pytest.raises(UnknownDatasourceError):
+        registry.get("missing")
+
+
+def test_eviction_waits_for_active_users(registry):
+    held = registry.get("a", acquire=True)
+    with held.pool_manager.engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    engine = held.pool_manager.engine
+
+    registry.get("b")
+    assert [datasource.name for datasource in registry.active()] == ["b"]
+    # Still usable by the request holding it, on the same engine and pool
+    assert held.pool_manager.engine is engine
+    assert held.pool_manager.ping()
+
+    held.release()
+    assert held.pool_manager._engine is None
+
+
+def test_eviction_of_unused_datasource_closes_it(registry):
+    first = registry.get("a")
+    first.pool_manager.ping()
+    registry.get("b")
+    assert first.pool_manager._engine is None
+    assert registry.evict("b") and registry.stats()["active"] == 0
+
+
+@pytest.mark.parametrize("method, path, body", [
+    ("post", "/api/query", {"query": "How many students?"}),
+    ("post", "/api/query/batch", {"queries": ["How many students?"]}),
+    ("post", "/api/results", {"sql": "SELECT 1"}),
+    ("post", "/api/semantic-search", {"query": "students"}),
+    ("get", "/api/schema", None),
+])
+def test_unknown_datasource_is_a_404(client, method, path, body):
+    response = getattr(client, method)(f"{path}?datasource=missing", json=body)
+    assert response.status_code == 404
+    assert "missing" in response.get_json()["error"]
+
+
+def test_requests_release_their_datasource(app_module, client):
+    assert client.post('/api/results', json={"sql": "SELECT 1"}).status_code == 200
+    assert client.get('/api/schema').status_code == 200
+    # Streamed responses hold theirs until the stream ends
+    response = client.get('/api/results/export?sql=SELECT%201', buffered=False)
+    assert app_module.datasources.get()._users == 1
+    assert response.get_data(as_text=True).splitlines()[1] == "1"
+    response.close()
+    assert app_module.datasources.get()._users == 0
+
+
+def test_eviction_during_an_export_waits_for_the_stream(app_module, client):
+    datasource = app_module.datasources.get()
+    datasource.pool_manager.ping()
+    response = client.get('/api/results/export?sql=SELECT%20STUDENT_ID%20FROM%20STUDENT', buffered=False)
+    assert client.delete('/api/datasources?datasource=default').get_json()["evicted"]
+    # The pool stays open for the export, and closes once it is done
+    assert datasource.pool_manager._engine is not None
+    assert len(response.get_data(as_text=True).splitlines()) > 1
+    response.close()
+    assert datasource.pool_manager._engine is None and datasource._users == 0
@@ -0,0 +1,61 @@
+import sqlite3
+import numpy as np
+from embeddings import CachedEmbedder, EmbeddingCache, HashingEmbedder
+
+
+class CountingEmbedder(HashingEmbedder):
+    def __init__(self):
+        super().__init__(dimension=64)
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return super().embed(texts)
+
+
+def vector(i):
+    return np.full(4, i, dtype=np.float32)
+
+
+def test_each_distinct_text_is_embedded_once():
+    inner = CountingEmbedder()
+    embedder = CachedEmbedder(inner, EmbeddingCache(None))
+    first = embedder.embed(["how many students", "list courses", "how many students"])
+    assert inner.texts == ["how many students", "list courses"]
+    assert np.array_equal(first[0], first[2])
+    assert np.array_equal(embedder.embed(["list courses"])[0], first[1])
+    assert len(inner.texts) == 2
+
+
+def test_disk_hits_survive_a_restart(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    inner = CountingEmbedder()
+    expected = CachedEmbedder(inner, EmbeddingCache(path)).embed(["average marks", "teachers"])
+    restarted = CountingEmbedder()
+    embedder = CachedEmbedder(restarted, EmbeddingCache(path))
+    assert np.array_equal(embedder.embed(["teachers", "average marks"]), expected[::-1])
+    assert restarted.texts == []
+
+
+def test_memory_lru_keeps_its_bound():
+    cache = EmbeddingCache(None, max_entries=3)
+    cache.put_many({f"k{i}": vector(i) for i in range(3)})
+    cache.get_many(["k0"])
+    cache.put_many({"k3": vector(3)})
+    # k1 was least recently used
+    assert set(cache.get_many([f"k{i}" for i in range(4)])) == {"k0", "k2", "k3"}
+    assert len(cache._memory) == 3
+
+
+def test_disk_tier_drops_the_oldest_rows(tmp_path):
+    path = str(tmp_path / 'embeddings.db')
+    cache = EmbeddingCache(path, max_entries=1, max_rows=10)
+    for i in range(25):
+        cache.put_many({f"k{i}": vector(i)})
+    with sqlite3.connect(path) as conn:
+        keys = [key for key, in conn.execute("SELECT key FROM embeddings ORDER BY rowid")]
+    assert len(keys) <= 10 and keys[-1] == "k24"
+    assert keys == [f"k{i}" for i in range(25 - len(keys), 25)]
+    reopened = EmbeddingCache(path, max_rows=10)
+    assert set(reopened.get_many(["k0", "k24"])) == {"k24"}
+    assert np.array_equal(reopened.get_many(["k24"])["k24"], vector(24))
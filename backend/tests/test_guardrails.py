@@ -0,0 +1,94 @@
+import pytest
+from sqlalchemy import create_engine, text
+from guardrails import (QueryGuard, QueryRejectedError, QueryTimeoutError, check_read_only, guarded,
+                        install_guard, is_read_only)
+
+READ_ONLY = [
+    "SELECT * FROM t",
+    "select a from t where b = 'x';",
+    "WITH x AS (SELECT a FROM t) SELECT * FROM x",
+    "EXPLAIN QUERY PLAN SELECT * FROM t",
+    "EXPLAIN SELECT 1",
+    "SELECT 'DROP TABLE t; DELETE FROM t' AS note",
+    'SELECT "update" FROM t -- insert into t',
+    "SELECT a FROM t /* ; DELETE FROM t */",
+]
+
+NOT_READ_ONLY = [
+    "",
+    "DELETE FROM t",
+    "UPDATE t SET a = 1",
+    "INSERT INTO t VALUES (1)",
+    "DROP TABLE t",
+    "PRAGMA query_only = OFF",
+    "SELECT 1; DROP TABLE t",
+    "SELECT * INTO copy FROM t",
+    "SELECT * FROM t FOR UPDATE",
+    "WITH gone AS (DELETE FROM t RETURNING *) SELECT * FROM gone",
+    "EXPLAIN DELETE FROM t",
+    "ATTACH DATABASE 'other.db' AS other",
+]
+
+
+@pytest.mark.parametrize("sql", READ_ONLY)
+def test_read_only_statements_pass(sql):
+    assert is_read_only(sql)
+    check_read_only(sql)
+
+
+@pytest.mark.parametrize("sql", NOT_READ_ONLY)
+def test_other_statements_are_rejected(sql):
+    assert not is_read_only(sql)
+    with pytest.raises(QueryRejectedError):
+        check_read_only(sql)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'guard.db'}")
+    install_guard(engine)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE big (id INTEGER PRIMARY KEY, v INTEGER)"))
+        conn.execute(text("CREATE TABLE small (id INTEGER PRIMARY KEY, v INTEGER)"))
+        conn.execute(text("INSERT INTO big VALUES (:id, :v)"), [{"id": i, "v": i % 7} for i in range(1, 1001)])
+        conn.execute(text("INSERT INTO small VALUES (:id, :v)"), [{"id": i, "v": i} for i in range(1, 11)])
+    return engine
+
+
+def run(engine, sql):
+    with engine.connect() as conn:
+        return conn.execute(text(sql)).fetchall()
+
+
+def test_plan_guard_rejects_large_scans(engine):
+    guard = QueryGuard(timeout=5, max_scan_rows=5000)
+    view = guarded(engine, guard)
+    assert len(run(view, "SELECT * FROM big")) == 1000
+    assert run(view, "SELECT v FROM big WHERE id = 3") == [(3,)]
+    # A cross join reads 1000 * 1000 rows
+    with pytest.raises(QueryRejectedError, match="scans about 1,000,000 rows"):
+        run(view, "SELECT COUNT(*) FROM big a, big b")
+    assert guard.rejected == 1
+    # The same statement runs when the limit allows it, and unguarded connections are not checked
+    assert run(guarded(engine, QueryGuard(timeout=5, max_scan_rows=0)), "SELECT COUNT(*) FROM big a, small b") \
+        == [(10000,)]
+    assert run(engine, "SELECT COUNT(*) FROM big a, big b") == [(1000000,)]
+
+
+def test_plan_guard_blocks_writes_and_resets_connections(engine):
+    view = guarded(engine, QueryGuard(timeout=5, max_scan_rows=5000))
+    with pytest.raises(QueryRejectedError):
+        run(view, "DELETE FROM big")
+    run(view, "SELECT COUNT(*) FROM small")
+    # The pooled connection went back read-write
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM small WHERE id = 1"))
+    assert run(engine, "SELECT COUNT(*) FROM small") == [(9,)]
+
+
+def test_deadline_aborts_long_queries(engine):
+    guard = QueryGuard(timeout=0.05, max_scan_rows=0)
+    with pytest.raises(QueryTimeoutError):
+        run(guarded(engine, guard), "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n) "
+                                    "SELECT COUNT(*) FROM n")
+    assert guard.timeouts == 1
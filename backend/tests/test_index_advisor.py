@@ -0,0 +1,167 @@
+import sqlite3
+import time
+import pytest
+from sqlalchemy import create_engine, event, text
+from guardrails import QueryGuard, guarded, install_guard
+from index_advisor import (IndexAdvisor, WorkloadStore, estimate_distinct, explainable_sql, install_workload_recorder,
+                            normalize_sql, workload_key)
+from results import fetch_page
+
+
+def stored_rows(path):
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT template, calls FROM workload").fetchall()
+
+
+def test_record_leaves_writing_to_the_flush_thread(tmp_path):
+    path = str(tmp_path / 'workload.db')
+    store = WorkloadStore(path, flush_interval=0.2)
+    store.record('db', "SELECT * FROM t WHERE a = 1", 0.01)
+    store.record('db', "SELECT * FROM t WHERE a = 2", 0.03)
+    assert stored_rows(path) == [] and store.stats()["pending"] == 2
+    deadline = time.monotonic() + 5
+    while not stored_rows(path) and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stored_rows(path) == [("SELECT * FROM t WHERE a = ?", 2)]
+    assert store.stats()["pending"] == 0
+
+
+@pytest.fixture
+def recorded_engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'paging.db'}")
+    install_guard(engine)
+    store = WorkloadStore(None, flush_interval=3600)
+    install_workload_recorder(engine, store)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER, a INTEGER, b TEXT)"))
+        conn.execute(text("INSERT INTO t VALUES (:id, :a, :b)"),
+                     [{"id": i, "a": i % 4, "b": f"x{i}"} for i in range(95)])
+    return guarded(engine, QueryGuard(timeout=5, max_scan_rows=0)), store
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT id, b FROM t WHERE a = 1 ORDER BY b",
+    "SELECT a, b FROM t WHERE id > 3",
+])
+def test_paging_is_recorded_as_the_user_query(recorded_engine, sql):
+    engine, store = recorded_engine
+    cursor, pages = None, 0
+    while True:
+        page = fetch_page(engine, sql, 5, cursor)
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    statements = store.top(workload_key(engine))
+    assert [(entry["template"], entry["calls"]) for entry in statements] == [(normalize_sql(sql), pages)]
+    assert pages > 1
+
+
+def test_only_templates_reach_the_workload_file(tmp_path):
+    path = str(tmp_path / 'workload.db')
+    engine = create_engine(f"sqlite:///{tmp_path / 'people.db'}")
+    install_guard(engine)
+    store = WorkloadStore(path, flush_interval=3600)
+    install_workload_recorder(engine, store)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE people (id INTEGER, email TEXT)"))
+    with guarded(engine, QueryGuard(timeout=5, max_scan_rows=0)).connect() as conn:
+        conn.execute(text("SELECT id FROM people WHERE email = 'jane@example.com'")).fetchall()
+        conn.execute(text("SELECT id FROM people WHERE email = :email"), {"email": "joe@example.com"}).fetchall()
+    store.close()
+    with open(path, 'rb') as f:
+        assert b'example.com' not in f.read()
+    assert sorted(stored_rows(path)) == [("SELECT id FROM people WHERE email = ?", 2)]
+
+
+def test_files_with_raw_statements_are_dropped(tmp_path):
+    path = str(tmp_path / 'workload.db')
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE workload (database_url TEXT, fingerprint TEXT, template TEXT, statement TEXT, "
+                     "parameters TEXT, calls INTEGER, total_ms REAL, max_ms REAL, first_seen REAL, last_seen REAL, "
+                     "PRIMARY KEY (database_url, fingerprint))")
+        conn.execute("INSERT INTO workload VALUES ('db', 'f', 't', 'SELECT 1 WHERE ssn = ''123''', '[]', "
+                     "1, 1, 1, 0, 0)")
+    WorkloadStore(path).close()
+    assert stored_rows(path) == []
+
+
+@pytest.mark.parametrize("dialect, expected", [
+    ('sqlite', ("SELECT a FROM t WHERE b = ? AND c IN (?) LIMIT ?", (None, None, None))),
+    ('postgresql', ("SELECT a FROM t WHERE b = $1 AND c IN ($2) LIMIT $3", ())),
+    ('mysql', ("SELECT a FROM t WHERE b = '0' AND c IN ('0') LIMIT 1", ())),
+])
+def test_explainable_sql(dialect, expected):
+    template = normalize_sql("SELECT a FROM t WHERE b = 'x' AND c IN (1, 2, 3) LIMIT 10")
+    assert explainable_sql(template, dialect) == expected
+    assert explainable_sql("SELECT a FROM t", dialect) == ("SELECT a FROM t", ())
+
+
+def test_estimate_distinct():
+    # The whole table was read, or every sampled value repeated: the sample saw them all
+    assert estimate_distinct(500, 40, 3, 500) == 40
+    assert estimate_distinct(1000, 7, 0, 10 ** 6) == 7
+    # Every sampled value unique: a key
+    assert estimate_distinct(1000, 1000, 1000, 10 ** 6) == 10 ** 6
+    assert 1000 < estimate_distinct(1000, 800, 600, 10 ** 6) < 10 ** 6
+    assert estimate_distinct(0, 0, 0, 0) == 1
+
+
+@pytest.fixture
+def advised(tmp_path):
+    """An advisor over 5000 rows of t(id, a, b), with a filter on a recorded ten times."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'advised.db'}")
+    install_guard(engine)
+    store = WorkloadStore(None, flush_interval=3600)
+    install_workload_recorder(engine, store)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY, a INTEGER, b TEXT)"))
+        conn.execute(text("INSERT INTO t VALUES (:id, :a, :b)"),
+                     [{"id": i, "a": i % 250, "b": f"x{i % 7}"} for i in range(1, 5001)])
+    with guarded(engine, QueryGuard(timeout=5, max_scan_rows=0)).connect() as conn:
+        for value in range(10):
+            conn.execute(text(f"SELECT id, b FROM t WHERE a = {value}")).fetchall()
+    return IndexAdvisor(engine, store, min_rows=1000), engine
+
+
+def test_recommends_from_templates_with_sampled_statistics(advised):
+    advisor, engine = advised
+    seen = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *args: seen.append(sql))
+    recommendations = advisor.recommend()
+    assert [(item["table_name"], item["columns"]) for item in recommendations] == [("t", ["a", "b", "id"])]
+    # 250 values of a keep 20 of the 5000 rows
+    assert recommendations[0]["estimated_rows"] == 20
+    assert not any("DISTINCT" in sql.upper() for sql in seen)
+    assert any("LIMIT 10000" in sql for sql in seen)
+
+
+def test_sqlite_planner_statistics_replace_the_sample(advised):
+    advisor, engine = advised
+    with engine.begin() as conn:
+        conn.execute(text("CREATE INDEX t_b_a ON t (b, a)"))
+        conn.execute(text("ANALYZE"))
+    with engine.connect() as conn:
+        assert advisor._distinct(conn, {"leading": {"B": ["t_b_a"]}, "rows": 5000, "distinct": {}}, "t", "b") == 7
+        assert advisor._planner_distinct(conn, {"leading": {}, "rows": 5000}, "t", "a") is None
+
+
+def test_advisor_post_requires_an_explicit_choice(client):
+    assert client.post('/api/index-advisor').status_code == 400
+    assert client.post('/api/index-advisor', json={}).status_code == 400
+    assert client.post('/api/index-advisor', json={"apply": "everything"}).status_code == 400
+    assert client.post('/api/index-advisor', json={"apply": [1]}).status_code == 400
+    response = client.post('/api/index-advisor', json={"apply": []})
+    assert response.status_code == 200 and response.get_json()["applied"] == []
+
+
+@pytest.mark.parametrize("limit", ["abc", "0", "-1", "2.5"])
+def test_advisor_rejects_bad_limits(client, limit):
+    response = client.get(f'/api/index-advisor?limit={limit}')
+    assert response.status_code == 400
+    assert "limit" in response.get_json()["error"]
+
+
+def test_advisor_lists_the_workload(client):
+    response = client.get('/api/index-advisor?limit=5')
+    assert response.status_code == 200 and response.get_json()["enabled"]
@@ -0,0 +1,92 @@
+import shutil
+import pytest
+from sqlalchemy import create_engine, text
+from materialized import DEFINITIONS, MaterializedViews
+
+
+@pytest.fixture
+def views(student_db, tmp_path):
+    """student_performance materialized in a private copy of the demo database."""
+    path = tmp_path / 'student.db'
+    shutil.copy(student_db, path)
+    views = MaterializedViews(create_engine(f"sqlite:///{path}"), ['student_performance'], auto_refresh=False)
+    views.setup()
+    assert 'student_performance' in views.active
+    return views
+
+
+def contents(views):
+    """The materialized table and the view it stands in for, in the same order."""
+    definition = DEFINITIONS['student_performance']
+    with views.engine.connect() as conn:
+        table = conn.execute(text(f"SELECT * FROM {definition.table} ORDER BY GRADE_ID")).fetchall()
+        view = conn.execute(text(f"SELECT * FROM ({definition.select}) ORDER BY GRADE_ID")).fetchall()
+    return table, view
+
+
+def insert_grade(views, grade_id=None):
+    with views.engine.begin() as conn:
+        if grade_id is None:
+            grade_id = conn.execute(text("SELECT MAX(ID) + 1 FROM STUDENT_GRADES")).scalar()
+        conn.execute(text(
+            "INSERT INTO STUDENT_GRADES (ID, STUDENT_ID, COURSE_ID, SEMESTER, YEAR, MARKS, GRADE) "
+            "SELECT :id, STUDENT_ID, COURSE_ID, SEMESTER, YEAR, 99.5, 'A+' FROM STUDENT_GRADES "
+            "ORDER BY ID LIMIT 1"), {"id": grade_id})
+    return grade_id
+
+
+def test_setup_fills_the_table(views):
+    table, view = contents(views)
+    assert table and table == view
+    assert views.last_refresh['student_performance']['mode'] == 'full'
+    assert not views.status('student_performance')['stale']
+
+
+def test_new_rows_are_appended_incrementally(views):
+    watermark = views.status('student_performance')['watermark']
+    for _ in range(3):
+        insert_grade(views)
+    status = views.status('student_performance')
+    assert status['pending_rows'] == 3 and status['stale'] and not status['dirty']
+    result = views.refresh('student_performance')
+    assert result['mode'] == 'incremental' and result['rows'] == 3
+    table, view = contents(views)
+    assert table == view
+    assert views.status('student_performance')['watermark'] == watermark + 3
+    assert views.refresh('student_performance')['mode'] == 'none'
+
+
+@pytest.mark.parametrize("change", [
+    "UPDATE STUDENT_GRADES SET MARKS = 1 WHERE ID = 1",
+    "DELETE FROM STUDENT_GRADES WHERE ID = 2",
+    "UPDATE STUDENT SET NAME = 'Renamed' WHERE STUDENT_ID = 1",
+    "UPDATE TEACHER SET NAME = 'Renamed' WHERE TEACHER_ID = 1",
+])
+def test_changes_to_base_rows_force_a_full_refresh(views, change):
+    with views.engine.begin() as conn:
+        conn.execute(text(change))
+    assert views.status('student_performance')['dirty']
+    assert views.refresh('student_performance')['mode'] == 'full'
+    table, view = contents(views)
+    assert table == view
+
+
+def test_insert_below_the_watermark_forces_a_full_refresh(views):
+    with views.engine.begin() as conn:
+        conn.execute(text("DELETE FROM STUDENT_GRADES WHERE ID = 5"))
+    views.refresh('student_performance')
+    # Reusing a key at or below the watermark is invisible to an incremental refresh
+    insert_grade(views, grade_id=5)
+    status = views.status('student_performance')
+    assert status['dirty'] and status['pending_rows'] == 0
+    assert views.refresh('student_performance')['mode'] == 'full'
+    table, view = contents(views)
+    assert table == view and any(row[0] == 5 for row in table)
+
+
+def test_full_refresh_on_request(views):
+    insert_grade(views)
+    result = views.refresh('student_performance', full=True)
+    assert result['mode'] == 'full'
+    table, view = contents(views)
+    assert result['rows'] == len(view) and table == view
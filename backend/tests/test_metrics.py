@@ -0,0 +1,79 @@
+import json
+import os
+import pytest
+import metrics
+from metrics import Counter, Histogram, render_metrics, sampled
+
+
+@pytest.fixture
+def shared_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROC_DIR', str(tmp_path))
+    return tmp_path
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    counter = Counter('test_requests_total', 'Requests.')
+    histogram = Histogram('test_seconds', 'Latency.', buckets=(0.1, 1))
+    monkeypatch.setattr(metrics, 'REGISTRY', [counter, histogram])
+    return counter, histogram
+
+
+def other_worker(shared_dir, pid, counter, histogram):
+    """Write another process's snapshot the way write_snapshot does."""
+    data = {
+        'test_requests_total': [[[['endpoint', '/api/query']], counter]],
+        'test_seconds': [[[['stage', 'llm']], histogram]],
+    }
+    (shared_dir / f"worker_{pid}.json").write_text(json.dumps(data))
+
+
+def series(text, name):
+    return {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1])
+            for line in text.splitlines() if line.startswith(name)}
+
+
+def test_single_process_renders_its_own_series(registry, monkeypatch):
+    monkeypatch.setattr(metrics, 'METRICS_MULTIPROC_DIR', '')
+    counter, histogram = registry
+    counter.inc(endpoint='/api/query')
+    histogram.observe(0.5, stage='llm')
+    text = render_metrics()
+    assert series(text, 'test_requests_total') == {'test_requests_total{endpoint="/api/query"}': 1}
+    assert series(text, 'test_seconds_count') == {'test_seconds_count{stage="llm"}': 1}
+
+
+def test_workers_are_summed(shared_dir, registry):
+    counter, histogram = registry
+    counter.inc(2, endpoint='/api/query')
+    counter.inc(endpoint='/api/schema')
+    histogram.observe(0.05, stage='llm')
+    # One live worker and one that has exited: both still count
+    other_worker(shared_dir, 1, 3, [[1, 0, 1], 2.05, 2])
+    other_worker(shared_dir, 2, 5, [[0, 1, 0], 0.5, 1])
+    text = render_metrics()
+    assert series(text, 'test_requests_total') == {
+        'test_requests_total{endpoint="/api/query"}': 10,
+        'test_requests_total{endpoint="/api/schema"}': 1,
+    }
+    assert series(text, 'test_seconds_bucket') == {
+        'test_seconds_bucket{stage="llm",le="0.1"}': 2,
+        'test_seconds_bucket{stage="llm",le="1"}': 3,
+        'test_seconds_bucket{stage="llm",le="+Inf"}': 4,
+    }
+    assert series(text, 'test_seconds_count') == {'test_seconds_count{stage="llm"}': 4}
+    assert series(text, 'test_seconds_sum')['test_seconds_sum{stage="llm"}'] == pytest.approx(2.6)
+    # This process's own snapshot was written for the others to read
+    assert (shared_dir / f"worker_{os.getpid()}.json").exists()
+
+
+def test_unreadable_snapshots_are_skipped(shared_dir, registry):
+    counter, _ = registry
+    counter.inc(endpoint='/api/query')
+    (shared_dir / "worker_3.json").write_text("{")
+    assert series(render_metrics(), 'test_requests_total') == {'test_requests_total{endpoint="/api/query"}': 1}
+
+
+def test_scrape_time_samples_name_their_worker(shared_dir):
+    lines = sampled('test_in_flight', 'In flight.', [({"pool": "a"}, 2)])
+    assert lines[-1] == f'test_in_flight{{pool="a",worker="{os.getpid()}"}} 2'
@@ -0,0 +1,121 @@
+import random
+import pytest
+from sqlalchemy import create_engine, text
+import results
+from results import InvalidCursorError, fetch_page, order_by_terms, sort_keys
+
+
+@pytest.fixture(scope='module')
+def engine(tmp_path_factory):
+    """A table full of duplicate keys, ties and NULLs."""
+    engine = create_engine(f"sqlite:///{tmp_path_factory.mktemp('results') / 'paging.db'}")
+    rng = random.Random(3)
+    rows = [{"id": i, "a": rng.choice([None, 1, 2, 3]), "b": rng.choice([None, 'x', 'y']),
+             "c": rng.choice([None, 0.5, 1.5])} for i in range(1, 201)]
+    # Fully identical rows must each come back once
+    rows += [{"id": 0, "a": 2, "b": 'y', "c": 0.5}] * 5
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER, a INTEGER, b TEXT, c REAL)"))
+        conn.execute(text("INSERT INTO t VALUES (:id, :a, :b, :c)"), rows)
+    return engine
+
+
+def all_pages(engine, sql, page_size):
+    rows, cursor, pages = [], None, 0
+    while True:
+        page = fetch_page(engine, sql, page_size, cursor)
+        rows.extend(page["rows"])
+        pages += 1
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return rows, pages
+        assert page["truncated"]
+
+
+def reference(engine, sql):
+    with engine.connect() as conn:
+        return [list(row) for row in conn.execute(text(sql))]
+
+
+def multiset(rows):
+    return sorted(map(tuple, rows), key=repr)
+
+
+ORDERED = [
+    # (sql, positions of the sort keys among the selected columns)
+    ("SELECT a, b, c FROM t ORDER BY a", [0]),
+    ("SELECT a, b, c FROM t ORDER BY a DESC, b", [0, 1]),
+    ("SELECT a, b, c FROM t ORDER BY b DESC NULLS FIRST, c NULLS LAST", [1, 2]),
+    ("SELECT id, a FROM t ORDER BY 2 DESC, t.id", [1, 0]),
+    ("SELECT a, COUNT(*) AS n FROM t GROUP BY a ORDER BY n DESC", [1]),
+    ("SELECT b, a FROM t WHERE a IS NOT NULL ORDER BY a DESC LIMIT 150", [1]),
+]
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 64])
+@pytest.mark.parametrize("sql, keys", ORDERED)
+def test_ordered_pages_follow_the_query_order(engine, sql, keys, page_size):
+    expected = reference(engine, sql)
+    rows, pages = all_pages(engine, sql, page_size)
+    assert multiset(rows) == multiset(expected)
+    assert [[row[i] for i in keys] for row in rows] == [[row[i] for i in keys] for row in expected]
+    assert pages == max(1, -(-len(expected) // page_size))
+
+
+@pytest.mark.parametrize("page_size", [1, 7, 64])
+@pytest.mark.parametrize("sql", ["SELECT a, b, c FROM t", "SELECT b FROM t", "SELECT DISTINCT a, b FROM t"])
+def test_unordered_pages_cover_every_row_once(engine, sql, page_size):
+    rows, _ = all_pages(engine, sql, page_size)
+    assert multiset(rows) == multiset(reference(engine, sql))
+
+
+def test_small_results_come_back_as_written(engine):
+    sql = "SELECT id FROM t WHERE id BETWEEN 1 AND 5 ORDER BY id DESC"
+    page = fetch_page(engine, sql, 10)
+    assert page["rows"] == [[5], [4], [3], [2], [1]]
+    assert page["columns"] == ["id"] and page["column_types"] == ["integer"]
+    assert not page["truncated"] and page["next_cursor"] is None
+
+
+def test_order_on_unselected_column_pages_by_position(engine, monkeypatch):
+    sql = "SELECT a FROM t ORDER BY id, c"
+    rows, _ = all_pages(engine, sql, 16)
+    assert rows == reference(engine, sql)
+
+    # Past the cap the result is still marked truncated, but no cursor is issued
+    monkeypatch.setattr(results, 'RESULT_MAX_OFFSET', 32)
+    rows, pages = all_pages(engine, sql, 16)
+    assert pages == 2 and len(rows) == 32
+    cursor = fetch_page(engine, sql, 16)["next_cursor"]
+    last = fetch_page(engine, sql, 16, cursor)
+    assert last["truncated"] and last["next_cursor"] is None
+
+
+def test_cursor_belongs_to_its_query(engine):
+    cursor = fetch_page(engine, "SELECT a FROM t", 10)["next_cursor"]
+    with pytest.raises(InvalidCursorError):
+        fetch_page(engine, "SELECT b FROM t", 10, cursor)
+    with pytest.raises(InvalidCursorError):
+        fetch_page(engine, "SELECT a FROM t", 10, cursor[:-4] + "AAAA")
+
+
+@pytest.mark.parametrize("sql, terms", [
+    ("SELECT a FROM t", None),
+    ("SELECT a FROM t ORDER BY a DESC, b LIMIT 5", ["a DESC", "b"]),
+    ("SELECT a, ROW_NUMBER() OVER (ORDER BY b) FROM t", None),
+    ("SELECT a FROM (SELECT a FROM t ORDER BY a) AS s", None),
+    ("SELECT 'ORDER BY x' AS a FROM t ORDER BY COALESCE(a, 0), \"b\"", ["COALESCE(a, 0)", '"b"']),
+    ("SELECT a FROM t ORDER BY a UNION SELECT b FROM t", None),
+    ("SELECT a FROM t UNION SELECT b FROM t ORDER BY 1", ["1"]),
+])
+def test_order_by_terms(sql, terms):
+    assert order_by_terms(sql) == terms
+
+
+def test_sort_keys():
+    columns = ["NAME", "avg_marks", "AVG(g.MARKS)"]
+    assert sort_keys(["s.NAME", "avg_marks DESC"], columns, False) == [(0, False, True), (1, True, False)]
+    assert sort_keys(["AVG(g.MARKS)", "2 NULLS FIRST"], columns, True) == [(2, False, False), (1, False, True)]
+    assert sort_keys(["s.EMAIL"], columns, False) is None
+    assert sort_keys(["NAME COLLATE NOCASE"], columns, False) is None
+    assert sort_keys(["c.NAME"], ["NAME", "NAME"], False) is None
@@ -0,0 +1,87 @@
+import time
+import pytest
+from sqlalchemy import create_engine, text
+import schema_cache
+from schema_cache import SchemaCatalog, schema_fingerprint
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'schema.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE a (id INTEGER PRIMARY KEY, name TEXT)"))
+    return engine
+
+
+def counting(catalog, monkeypatch):
+    """Count the version queries and rebuilds a catalog makes."""
+    counts = {"version": 0, "build": 0}
+    version, build = catalog._schema_version, schema_cache.build_schema_info
+
+    def counted_version():
+        counts["version"] += 1
+        return version()
+
+    def counted_build(engine):
+        counts["build"] += 1
+        return build(engine)
+
+    monkeypatch.setattr(catalog, '_schema_version', counted_version)
+    monkeypatch.setattr(schema_cache, 'build_schema_info', counted_build)
+    return counts
+
+
+def test_rebuilds_only_when_the_schema_changes(engine, monkeypatch):
+    catalog = SchemaCatalog(engine, check_interval=0)
+    counts = counting(catalog, monkeypatch)
+    first = catalog.fingerprint
+    assert catalog.get()["a"]["columns"] == ["id", "name"]
+    assert catalog.fingerprint == first and counts["build"] == 1
+
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE a ADD COLUMN email TEXT"))
+    counts.update(version=0, build=0)
+    assert catalog.get()["a"]["columns"] == ["id", "name", "email"]
+    # One version query both detects the change and is kept for the rebuilt catalog
+    assert counts == {"version": 1, "build": 1}
+    assert catalog.fingerprint != first
+    assert catalog.fingerprint == schema_fingerprint(catalog.get())
+
+
+def test_check_interval_skips_version_queries(engine, monkeypatch):
+    catalog = SchemaCatalog(engine, check_interval=60)
+    counts = counting(catalog, monkeypatch)
+    for _ in range(5):
+        catalog.get()
+    assert counts == {"version": 1, "build": 1}
+
+
+def test_ttl_fallback_without_a_version_query(engine, monkeypatch):
+    monkeypatch.setattr(schema_cache, '_VERSION_QUERIES', {})
+    catalog = SchemaCatalog(engine, ttl=0.2, check_interval=0)
+    counts = counting(catalog, monkeypatch)
+    catalog.get()
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE b (id INTEGER)"))
+    # Unseen until the TTL runs out
+    assert "b" not in catalog.get()
+    time.sleep(0.25)
+    assert "b" in catalog.get()
+    assert counts["build"] == 2
+
+
+def test_overlay_and_invalidate(engine):
+    catalog = SchemaCatalog(engine, overlay=lambda info: {**info, "extra": {"columns": []}})
+    assert "extra" in catalog.get()
+    before = catalog.fingerprint
+    catalog.invalidate()
+    assert catalog.fingerprint == before
+
+
+def test_schema_endpoint_etag(app_module, client):
+    response = client.get('/api/schema')
+    assert response.status_code == 200
+    etag = response.headers['ETag'].strip('"')
+    assert etag == app_module.datasources.get().get_schema_catalog().fingerprint
+    assert client.get('/api/schema', headers={'If-None-Match': f'"{etag}"'}).status_code == 304
+    assert client.get('/api/schema', headers={'If-None-Match': '"stale"'}).status_code == 200
@@ -0,0 +1,139 @@
+import pytest
+from embeddings import Embedder, HashingEmbedder
+from semantic_search import SchemaSemanticSearch
+
+DIMENSION = 128
+
+
+class CountingEmbedder(Embedder):
+    """The hashing embedder, remembering every text it was asked to embed."""
+
+    def __init__(self, name='counting'):
+        self.inner = HashingEmbedder(dimension=DIMENSION)
+        self.name = name
+        self.dimension = DIMENSION
+        self.texts = []
+
+    def embed(self, texts):
+        self.texts.extend(texts)
+        return self.inner.embed(texts)
+
+
+def schema(tables):
+    return {table: {"types": dict(columns)} for table, columns in tables.items()}
+
+
+BASE = schema({
+    "STUDENT": [("STUDENT_ID", "INTEGER"), ("NAME", "VARCHAR(50)"), ("CLASS", "VARCHAR(20)")],
+    "COURSE": [("COURSE_ID", "INTEGER"), ("NAME", "VARCHAR(50)"), ("DEPARTMENT", "VARCHAR(50)")],
+})
+
+
+def indexed(search):
+    return sorted((item['table_name'], item['column_name'], item['data_type']) for item in search.schema_items)
+
+
+def test_sync_embeds_only_added_or_changed_columns():
+    embedder = CountingEmbedder()
+    search = SchemaSemanticSearch(dimension=DIMENSION)
+    assert search.sync(BASE, 'v1', embedder) == {'added': 6, 'removed': 0, 'total': 6}
+    assert len(embedder.texts) == 6
+
+    embedder.texts.clear()
+    assert search.sync(BASE, 'v1', embedder) == {'added': 0, 'removed': 0, 'total': 6}
+    assert embedder.texts == []
+
+    # One column retyped, one added, one table dropped
+    changed = schema({
+        "STUDENT": [("STUDENT_ID", "INTEGER"), ("NAME", "VARCHAR(100)"), ("CLASS", "VARCHAR(20)"),
+                    ("EMAIL", "VARCHAR(100)")],
+    })
+    assert search.sync(changed, 'v2', embedder) == {'added': 2, 'removed': 4, 'total': 4}
+    assert sorted(embedder.texts) == ["STUDENT EMAIL VARCHAR(100)", "STUDENT NAME VARCHAR(100)"]
+    assert indexed(search) == sorted((t, c, d) for t, info in changed.items() for c, d in info['types'].items())
+    assert search.schema_fingerprint == 'v2'
+    assert search.search(embedder.embed(["student email"])[0], k=1)[0]['column_name'] == 'EMAIL'
+
+
+def test_changing_the_embedder_rebuilds():
+    search = SchemaSemanticSearch(dimension=DIMENSION)
+    search.sync(BASE, 'v1', CountingEmbedder('first'))
+    other = CountingEmbedder('second')
+    assert search.sync(BASE, 'v1', other) == {'added': 6, 'removed': 6, 'total': 6}
+    assert len(other.texts) == 6 and search.embedder_name == 'second'
+
+
+def test_sync_survives_save_and_load(tmp_path):
+    embedder = CountingEmbedder()
+    search = SchemaSemanticSearch(dimension=DIMENSION)
+    search.sync(BASE, 'v1', embedder)
+    search.save(str(tmp_path / 'index'))
+    loaded = SchemaSemanticSearch.load(str(tmp_path / 'index'))
+    embedder.texts.clear()
+    assert loaded.sync(BASE, 'v1', embedder)['added'] == 0 and embedder.texts == []
+    # The memory-mapped copy becomes writable on the first change
+    grown = schema({**{t: list(info['types'].items()) for t, info in BASE.items()},
+                    "TEACHER": [("TEACHER_ID", "INTEGER")]})
+    assert loaded.sync(grown, 'v2', embedder) == {'added': 1, 'removed': 0, 'total': 7}
+    assert indexed(loaded) == sorted(indexed(search) + [('TEACHER', 'TEACHER_ID', 'INTEGER')])
+    assert loaded.search(embedder.embed(["teacher id"])[0], k=1)[0]['table_name'] == 'TEACHER'
+
+
+@pytest.mark.parametrize("items", [[], [("T", "C", "INTEGER")]])
+def test_empty_and_tiny_schemas(items):
+    search = SchemaSemanticSearch(dimension=DIMENSION)
+    embedder = CountingEmbedder()
+    result = search.sync(schema({"T": [(c, d) for _, c, d in items]}) if items else {}, None, embedder)
+    assert result['total'] == len(items)
+
+
+def wide_schema(tables=40, columns=12):
+    return schema({f"TABLE_{t}": [(f"FIELD_{t}_{c}", "INTEGER" if c % 2 else "TEXT") for c in range(columns)]
+                   for t in range(tables)})
+
+
+@pytest.mark.parametrize("options", [{}, {'two_stage': True, 'table_candidates': 3}])
+def test_search_many_matches_search(options):
+    embedder = CountingEmbedder()
+    search = SchemaSemanticSearch(dimension=DIMENSION, **options)
+    search.sync(wide_schema(), None, embedder)
+    queries = embedder.embed([f"field {t} {c} of table {t}" for t in range(0, 40, 3) for c in (1, 6)])
+    batched = search.search_many(queries, k=4)
+    assert len(batched) == len(queries)
+    for query, results in zip(queries, batched):
+        single = search.search(query, k=4)
+        assert [(r['table_name'], r['column_name']) for r in results] == \
+            [(r['table_name'], r['column_name']) for r in single]
+        assert [r['similarity_score'] for r in results] == pytest.approx([r['similarity_score'] for r in single])
+
+
+def test_add_items_batch_matches_single_adds():
+    embedder = CountingEmbedder()
+    items = [{'table_name': f"T{i % 5}", 'column_name': f"C{i}", 'data_type': 'INTEGER'} for i in range(30)]
+    matrix = embedder.embed([f"T{i % 5} C{i} INTEGER" for i in range(30)])
+    batched = SchemaSemanticSearch(dimension=DIMENSION)
+    # Repeats within the batch and items already indexed are skipped
+    assert batched.add_items(items + items[:3], list(matrix) + list(matrix[:3])) == 30
+    assert batched.add_items(items[:10], matrix[:10]) == 0
+    single = SchemaSemanticSearch(dimension=DIMENSION)
+    for item, vector in zip(items, matrix):
+        single.add_schema_item(item['table_name'], item['column_name'], item['data_type'], vector)
+    assert single.ids == batched.ids
+    query = embedder.embed(["T3 C8"])[0]
+    assert batched.search(query, k=5) == single.search(query, k=5)
+    with pytest.raises(ValueError):
+        batched.add_items(items[:2], matrix[:3])
+
+
+@pytest.mark.parametrize("index_type", ['flat', 'ivf', 'hnsw'])
+def test_sync_keeps_results_right_after_dropping_a_table(index_type):
+    embedder = CountingEmbedder()
+    search = SchemaSemanticSearch(dimension=DIMENSION, index_type=index_type, nprobe=64)
+    search.sync(wide_schema(), 'v1', embedder)
+    tables = wide_schema()
+    del tables["TABLE_7"]
+    assert search.sync(tables, 'v2', embedder)['removed'] == 12
+    # Every remaining column is its own nearest neighbour
+    texts = [f"{t} {c} {d}" for t, info in tables.items() for c, d in info['types'].items()]
+    found = search.search_many(embedder.embed(texts), k=1)
+    assert [f"{r[0]['table_name']} {r[0]['column_name']} {r[0]['data_type']}" for r in found] == texts
@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import create_engine
+from benchmark import MockLLM
+from metrics import tracing
+from sql_generation import (LLMCallCounter, SQLGenerationError, answer_single_shot, callback_handler, parse_sql,
+                            validate_sql)
+
+
+@pytest.fixture
+def engine(student_db):
+    return create_engine(f"sqlite:///{student_db}")
+
+
+@pytest.mark.parametrize("output", [
+    '{"sql": "SELECT COUNT(*) FROM STUDENT;"}',
+    'Here you go:\n```json\n{"sql": "SELECT COUNT(*) FROM STUDENT"}\n```\nHope that helps.',
+    '```sql\nSELECT COUNT(*) FROM STUDENT;\n```',
+    'The query is\n```\nSELECT COUNT(*) FROM STUDENT\n```',
+    # Broken JSON falls through to the fence
+    '{"sql": SELECT} ```sql SELECT COUNT(*) FROM STUDENT```',
+])
+def test_parse_sql(output):
+    assert parse_sql(output) == "SELECT COUNT(*) FROM STUDENT"
+
+
+@pytest.mark.parametrize("output", ["I cannot answer that.", '{"sql": ""}', ""])
+def test_parse_sql_without_sql(output):
+    with pytest.raises(SQLGenerationError, match="No SQL found"):
+        parse_sql(output)
+
+
+@pytest.mark.parametrize("sql", [
+    "DELETE FROM STUDENT",
+    "UPDATE STUDENT SET NAME = 'x'",
+    "DROP TABLE STUDENT",
+    "SELECT 1; DELETE FROM STUDENT",
+])
+def test_validate_sql_rejects_writes(engine, sql):
+    with pytest.raises(SQLGenerationError, match="not a single read-only query"):
+        validate_sql(engine, sql)
+
+
+@pytest.mark.parametrize("sql", ["SELECT NAME FROM NO_SUCH_TABLE", "SELECT NO_SUCH_COLUMN FROM STUDENT",
+                                 "SELECT FROM WHERE"])
+def test_validate_sql_explains_the_query(engine, sql):
+    with pytest.raises(SQLGenerationError, match="failed validation"):
+        validate_sql(engine, sql)
+    validate_sql(engine, "SELECT NAME FROM STUDENT WHERE SECTION = 'A'")
+
+
+SCHEMA = {"STUDENT": {"columns": ["STUDENT_ID", "NAME"], "types": {"STUDENT_ID": "INTEGER", "NAME": "TEXT"},
+                      "foreign_keys": []}}
+
+
+def test_answer_single_shot(engine):
+    llm = MockLLM(script={"how many students are there": "SELECT COUNT(*) AS n FROM STUDENT"})
+    with tracing() as trace:
+        response = answer_single_shot(llm, engine, "How many students are there?", [], SCHEMA)
+    assert response["sql"] == "SELECT COUNT(*) AS n FROM STUDENT"
+    assert response["columns"] == ["n"] and response["result"][0][0] > 0
+    assert response["llm_calls"] == 1 and response["error"] is None
+    # The counter handed to the model recorded the call with its token usage
+    assert len(trace.llm_calls) == 1 and trace.llm_calls[0]["prompt_tokens"] > 0
+
+
+@pytest.mark.parametrize("sql", ["SELECT NAME FROM NO_SUCH_TABLE", "DELETE FROM STUDENT"])
+def test_answer_single_shot_raises_for_bad_sql(engine, sql):
+    with pytest.raises(SQLGenerationError):
+        answer_single_shot(MockLLM(default_sql=sql), engine, "Anything?", [], SCHEMA)
+
+
+def test_llm_call_counter_counts_every_call():
+    counter = callback_handler(LLMCallCounter)
+    llm = MockLLM()
+    with tracing() as trace:
+        counter.trace = trace
+        for _ in range(3):
+            llm.invoke("Question: How many students are there?", config={"callbacks": [counter]})
+    assert counter.calls == 3 and len(trace.llm_calls) == 3
+    assert counter._started == {}
+
+
+class NoJSONLLM(MockLLM):
+    """Answers the single-shot prompt with prose, so only the agent can answer."""
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        result = super()._generate(messages, stop, run_manager, **kwargs)
+        if 'Respond with JSON only' in "\n".join(str(message.content) for message in messages):
+            result.generations[0].message.content = "Sorry, I am not sure."
+        return result
+
+
+def test_single_shot_failure_falls_back_to_the_agent(app_module, client, llm, monkeypatch):
+    pytest.importorskip('langchain_community')
+    stand_in = NoJSONLLM(script=llm.script)
+    monkeypatch.setattr(app_module, 'get_llm', lambda: stand_in)
+    payload = client.post('/api/query', json={"query": "How many students are there?", "mode": "single_shot",
+                                              "use_cache": False}).get_json()
+    assert payload["mode"] == "agent_fallback" and payload["error"] is None
+    # One single-shot call, then the agent's query and final-answer steps
+    assert payload["llm_calls"] == 3
+    assert payload["sql"] == "SELECT COUNT(*) FROM STUDENT" and payload["result"][0][0] > 0
+
+
+def test_single_shot_answers_count_one_call(client, llm):
+    payload = client.post('/api/query', json={"query": "How many students are there?", "mode": "single_shot",
+                                              "use_cache": False}).get_json()
+    assert payload["mode"] == "single_shot" and payload["llm_calls"] == 1
+    assert payload["sql"] == "SELECT COUNT(*) FROM STUDENT"
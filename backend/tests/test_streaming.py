@@ -0,0 +1,65 @@
+import json
+import pytest
+
+
+def events(response):
+    """(event, data) pairs of a Server-Sent Events body."""
+    parsed = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        parsed.append((lines["event"], json.loads(lines["data"])))
+    return parsed
+
+
+def test_streamed_single_shot_answer_is_cached(client, app_module, llm):
+    question = "List the students in section A"
+    first = events(client.post('/api/query/stream', json={"query": question}))
+    names = [name for name, _ in first]
+    assert names[-1] == 'done' and 'rows' in names
+    streamed = [row for name, data in first if name == 'rows' for row in data["rows"]]
+
+    datasource = app_module.datasources.get()
+    fingerprint = datasource.get_schema_catalog().fingerprint
+    cached = app_module.query_cache.get(question, datasource.url, fingerprint)
+    assert cached is not None
+    assert cached["mode"] == 'single_shot' and cached["error"] is None
+    assert cached["result"] == streamed and cached["columns"] == ["NAME"]
+
+    second = events(client.post('/api/query/stream', json={"query": question}))
+    assert [name for name, _ in second] == ['cached', 'done']
+    assert second[0][1]["result"] == streamed
+
+
+def test_streamed_answer_skips_cache_when_asked(client, app_module, llm):
+    question = "How many students are there?"
+    events(client.post('/api/query/stream', json={"query": question, "use_cache": False}))
+    assert app_module.query_cache.stats()["entries"] == 0
+
+
+def test_streamed_single_shot_answer_feeds_the_semantic_cache(client, app_module, llm):
+    question = "How many students are there?"
+    events(client.post('/api/query/stream', json={"query": question}))
+    datasource = app_module.datasources.get()
+    fingerprint = datasource.get_schema_catalog().fingerprint
+    match = app_module.get_semantic_query_cache().lookup(question, datasource.url, fingerprint)
+    assert match is not None and match["sql"] == "SELECT COUNT(*) FROM STUDENT"
+
+
+def test_streamed_sql_that_fails_to_run_falls_back_to_the_agent(client, app_module, llm, monkeypatch):
+    pytest.importorskip('langchain_community')
+    # Plans fine, but overflows when executed
+    monkeypatch.setattr(llm, 'default_sql', "SELECT abs(-9223372036854775807 - 1) AS n")
+    question = "What is the largest number?"
+    streamed = events(client.post('/api/query/stream', json={"query": question}))
+    names = [name for name, _ in streamed]
+    assert names.index('sql') < names.index('fallback') and names[-1] == 'done'
+    assert 'error' not in names
+    fallback = dict(streamed)['fallback']
+    assert "failed to execute" in fallback["reason"]
+    assert dict(streamed)['done']["llm_calls"] > 1
+
+    # The failing SQL was cached by neither tier, though the agent answered with it too
+    datasource = app_module.datasources.get()
+    fingerprint = datasource.get_schema_catalog().fingerprint
+    assert app_module.query_cache.get(question, datasource.url, fingerprint) is None
+    assert app_module.get_semantic_query_cache().lookup(question, datasource.url, fingerprint) is None
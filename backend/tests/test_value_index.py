@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import create_engine, event, text
+from schema_cache import build_schema_info
+from value_index import ValueIndex, format_values
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'values.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE student (id INTEGER PRIMARY KEY, name TEXT, class VARCHAR(20), "
+                          "section CHAR(1), marks INTEGER)"))
+        conn.execute(text("CREATE TABLE course (id INTEGER PRIMARY KEY, title TEXT, department TEXT)"))
+        conn.execute(text("CREATE VIEW course_titles AS SELECT title FROM course"))
+        conn.execute(text("INSERT INTO student VALUES (:id, :name, :class, :section, :marks)"), [
+            {"id": i, "name": f"Student {i}", "class": ["AI_ML", "IoT", "Data Science"][i % 3],
+             "section": "AB"[i % 2], "marks": i} for i in range(50)])
+        conn.execute(text("INSERT INTO course VALUES (:id, :title, :department)"), [
+            {"id": 1, "title": "Machine Learning", "department": "Computer Science"},
+            {"id": 2, "title": "Database Systems", "department": "Computer Science"},
+            {"id": 3, "title": "Algorithms", "department": "Mathematics"}])
+    return engine
+
+
+@pytest.fixture
+def index(engine):
+    index = ValueIndex(engine, max_distinct=10)
+    index.sync(build_schema_info(engine))
+    return index
+
+
+def statements(engine):
+    """A list that collects every SQL statement engine runs from now on."""
+    seen = []
+    event.listen(engine, 'before_cursor_execute', lambda conn, cursor, sql, *args: seen.append(sql))
+    return seen
+
+
+def matched(index, question):
+    return [(match['table_name'], match['column_name'], match['value'], match['match'])
+            for match in index.lookup(question)]
+
+
+def test_indexes_low_cardinality_text_columns(index):
+    assert sorted(index._columns) == [("course", "department"), ("course", "title"),
+                                      ("student", "class"), ("student", "section")]
+    # 50 names are free text at max_distinct=10; integer columns and views are never read
+    assert index._skipped == {("student", "name")}
+    assert index._columns[("student", "class")] == ["AI_ML", "Data Science", "IoT"]
+
+
+def test_exact_prefix_and_fuzzy_matches(index):
+    assert matched(index, "How many AI ML students?") == [("student", "class", "AI_ML", "exact")]
+    assert matched(index, "students in data science") == [("student", "class", "Data Science", "exact")]
+    assert matched(index, "grades in Algo") == [("course", "title", "Algorithms", "prefix")]
+    fuzzy = index.lookup("marks in Databse Systems")
+    assert [(m['value'], m['match']) for m in fuzzy] == [("Database Systems", "fuzzy")]
+    assert index.lookup("marks in Databse Systems", min_score=0.99) == []
+    assert matched(index, "how many rows are there") == []
+
+
+def test_short_values_need_their_column_name(index):
+    assert matched(index, "students in section B") == [("student", "section", "B", "exact")]
+    assert matched(index, "students in B section") == [("student", "section", "B", "exact")]
+    # Not beside the column's name, or not written as stored
+    assert matched(index, "students rated B overall") == []
+    assert matched(index, "students in section b") == []
+
+
+def test_format_values_quotes_as_sql():
+    assert format_values([
+        {"table_name": "STUDENT", "column_name": "CLASS", "value": "AI_ML"},
+        {"table_name": "COURSE", "column_name": "TITLE", "value": "Teacher's Guide"},
+    ]) == "STUDENT.CLASS = 'AI_ML'\nCOURSE.TITLE = 'Teacher''s Guide'"
+
+
+def test_refresh_rescans_only_changed_tables_without_counting_rows(engine, index):
+    schema_info = build_schema_info(engine)
+    seen = statements(engine)
+    assert index.sync(schema_info)["scanned_columns"] == 0
+    assert not any("COUNT(" in sql.upper() for sql in seen)
+
+    with engine.begin() as conn:
+        conn.execute(text("INSERT INTO course VALUES (4, 'Compilers', 'Computer Science')"))
+    result = index.sync(schema_info)
+    assert result["changed_tables"] == ["course"] and result["scanned_columns"] == 2
+    assert matched(index, "who teaches compilers") == [("course", "title", "Compilers", "exact")]
+    assert not any("COUNT(" in sql.upper() for sql in seen)
+
+
+def test_in_place_updates_wait_for_the_ttl(engine):
+    index = ValueIndex(engine, max_distinct=10, ttl=3600)
+    schema_info = build_schema_info(engine)
+    index.sync(schema_info)
+    with engine.begin() as conn:
+        conn.execute(text("UPDATE course SET title = 'Graph Theory' WHERE id = 3"))
+    assert index.sync(schema_info)["scanned_columns"] == 0
+    index.ttl = 0
+    assert index.sync(schema_info)["scanned_columns"] == 5
+    assert matched(index, "students of graph theory") == [("course", "title", "Graph Theory", "exact")]
+
+
+def test_new_columns_are_scanned(engine, index):
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE course ADD COLUMN level TEXT"))
+        conn.execute(text("UPDATE course SET level = 'Advanced'"))
+    result = index.sync(build_schema_info(engine))
+    assert result["scanned_columns"] == 1
+    assert matched(index, "advanced courses") == [("course", "level", "Advanced", "exact")]
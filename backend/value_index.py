@@ -0,0 +1,285 @@
+import os
+import re
+import time
+import logging
+import threading
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+VALUE_INDEX_ENABLED = os.getenv('VALUE_INDEX_ENABLED', 'true').lower() == 'true'
+# Text columns with more distinct values than this are treated as free text and not indexed
+VALUE_INDEX_MAX_DISTINCT = int(os.getenv('VALUE_INDEX_MAX_DISTINCT', 1000))
+VALUE_INDEX_MAX_LENGTH = int(os.getenv('VALUE_INDEX_MAX_LENGTH', 80))
+VALUE_INDEX_REFRESH_INTERVAL = float(os.getenv('VALUE_INDEX_REFRESH_INTERVAL', 60))
+# Rescan every column after this long, to pick up changes the cheap per-table signal misses
+VALUE_INDEX_TTL = float(os.getenv('VALUE_INDEX_TTL', 3600))
+VALUE_INDEX_MIN_SCORE = float(os.getenv('VALUE_INDEX_MIN_SCORE', 0.75))
+VALUE_INDEX_MAX_MATCHES = int(os.getenv('VALUE_INDEX_MAX_MATCHES', 8))
+
+_TEXT_TYPES = ('CHAR', 'TEXT', 'CLOB', 'STRING', 'ENUM')
+
+# One catalog query for a token per table that moves when its rows change, so a refresh reads no table data
+_SIGNATURE_QUERIES = {
+    'postgresql': "SELECT relname, concat_ws(':', n_tup_ins, n_tup_upd, n_tup_del) FROM pg_stat_user_tables "
+                  "WHERE schemaname = current_schema()",
+    'mysql': "SELECT TABLE_NAME, CONCAT_WS(':', TABLE_ROWS, UPDATE_TIME) FROM information_schema.TABLES "
+             "WHERE TABLE_SCHEMA = DATABASE()",
+}
+_WORD = re.compile(r'[A-Za-z0-9]+')
+_MAX_GRAM = 4
+
+# Question words that never name a value on their own
+_STOPWORDS = {
+    'a', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'by', 'each', 'for', 'from', 'give', 'has', 'have',
+    'how', 'i', 'in', 'is', 'it', 'list', 'me', 'of', 'on', 'or', 'per', 'show', 'than', 'that', 'the',
+    'their', 'to', 'what', 'which', 'who', 'with',
+}
+
+
+def normalize_value(value: str) -> str:
+    """Lower-cased words of a value joined by single spaces ('AI_ML' -> 'ai ml')."""
+    return " ".join(word.lower() for word in _WORD.findall(value))
+
+
+def _name_words(name: str) -> Set[str]:
+    """Words of a column or table name, also without a plural 's'."""
+    words = set(normalize_value(name).split())
+    return words | {word[:-1] for word in words if word.endswith('s') and len(word) > 3}
+
+
+def _trigrams(key: str) -> Set[str]:
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _Lookup:
+    """Immutable search structures over one snapshot of the indexed values."""
+
+    def __init__(self, columns: Dict[Tuple[str, str], List[str]]):
+        self.entries: Dict[str, List[Tuple[str, str, str]]] = {}
+        for (table, column), values in columns.items():
+            for value in values:
+                key = normalize_value(value)
+                if key:
+                    self.entries.setdefault(key, []).append((value, table, column))
+        self.keys = sorted(self.entries)
+        self.key_trigrams = [_trigrams(key) for key in self.keys]
+        self.postings: Dict[str, List[int]] = {}
+        for position, grams in enumerate(self.key_trigrams):
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(position)
+
+    def prefixed(self, prefix: str) -> List[str]:
+        keys = []
+        for key in self.keys[bisect_left(self.keys, prefix):]:
+            if not key.startswith(prefix):
+                break
+            keys.append(key)
+        return keys
+
+    def similar(self, key: str, min_score: float) -> List[Tuple[str, float]]:
+        """Keys whose character trigrams overlap key's by at least min_score (Dice coefficient)."""
+        grams = _trigrams(key)
+        shared = Counter(position for gram in grams for position in self.postings.get(gram, ()))
+        matches = []
+        for position, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.key_trigrams[position]))
+            if score >= min_score:
+                matches.append((self.keys[position], score))
+        return matches
+
+
+class ValueIndex:
+    """
+    Distinct values of the low-cardinality text columns, matched against
+    question text so prompts can quote values exactly as stored instead of
+    the agent probing for them with SELECT DISTINCT. Refreshing only rescans
+    tables whose change signal moved (write counters on PostgreSQL and
+    MySQL, the highest rowid on SQLite); everything is rescanned once the
+    TTL runs out.
+    """
+
+    def __init__(self, engine: Engine, max_distinct: int = VALUE_INDEX_MAX_DISTINCT,
+                 max_length: int = VALUE_INDEX_MAX_LENGTH, refresh_interval: float = VALUE_INDEX_REFRESH_INTERVAL,
+                 ttl: float = VALUE_INDEX_TTL):
+        self.engine = engine
+        self.max_distinct = max_distinct
+        self.max_length = max_length
+        self.refresh_interval = refresh_interval
+        self.ttl = ttl
+        self._columns: Dict[Tuple[str, str], List[str]] = {}
+        self._skipped: Set[Tuple[str, str]] = set()
+        self._signatures: Dict[str, Optional[str]] = {}
+        self._lookup: Optional[_Lookup] = None
+        self._scanned_at = 0.0
+        self._checked_at = 0.0
+        self._last_sync: Dict = {}
+        self._lock = threading.Lock()
+
+    def _quote(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _scan(self, conn, table: str, column: str) -> Optional[List[str]]:
+        """The column's distinct values, or None if it has too many to be a category."""
+        quoted = self._quote(column)
+        rows = conn.execute(text(
+            f"SELECT DISTINCT {quoted} FROM {self._quote(table)} WHERE {quoted} IS NOT NULL "
+            f"LIMIT {self.max_distinct + 1}")).fetchall()
+        if len(rows) > self.max_distinct:
+            return None
+        return sorted({str(row[0]) for row in rows if len(str(row[0])) <= self.max_length})
+
+    def _table_signatures(self, conn, tables: Set[str]) -> Dict[str, Optional[str]]:
+        """A token per table that changes when its rows do; None where only the TTL can tell."""
+        query = _SIGNATURE_QUERIES.get(self.engine.dialect.name)
+        if query is not None:
+            tokens = {name: str(token) for name, token in conn.execute(text(query))}
+            return {table: tokens.get(table) for table in tables}
+        if self.engine.dialect.name != 'sqlite':
+            return dict.fromkeys(tables)
+        signatures = {}
+        for table in tables:
+            try:
+                # Rowids live in a B-tree, so the highest is a seek; it moves on inserts (and deleting the last row)
+                signatures[table] = str(conn.execute(text(f"SELECT MAX(rowid) FROM {self._quote(table)}")).scalar())
+            except Exception:
+                # WITHOUT ROWID tables
+                signatures[table] = None
+        return signatures
+
+    def sync(self, schema_info: Dict) -> Dict:
+        """Bring the index up to date with schema_info and the current table contents."""
+        with self._lock:
+            started = time.perf_counter()
+            wanted = {
+                (table, column)
+                # Views and materialized copies hold the same values as their base tables
+                for table, info in schema_info.items()
+                if not info.get('is_view') and not info.get('materialized_from')
+                for column in info['columns']
+                if any(kind in info['types'][column].upper() for kind in _TEXT_TYPES)
+            }
+            full = time.monotonic() - self._scanned_at >= self.ttl
+            scanned = 0
+            with self.engine.connect() as conn:
+                signatures = self._table_signatures(conn, {table for table, _ in wanted})
+                changed = {table for table, signature in signatures.items()
+                           if full or table not in self._signatures or self._signatures[table] != signature}
+                columns = {key: values for key, values in self._columns.items()
+                           if key in wanted and key[0] not in changed}
+                skipped = {key for key in self._skipped if key in wanted and key[0] not in changed}
+                for key in sorted(wanted - set(columns) - skipped):
+                    values = self._scan(conn, *key)
+                    scanned += 1
+                    if values is None:
+                        skipped.add(key)
+                    else:
+                        columns[key] = values
+            lookup = _Lookup(columns) if scanned or self._lookup is None or len(columns) != len(self._columns) \
+                else self._lookup
+            self._columns, self._skipped, self._signatures, self._lookup = columns, skipped, signatures, lookup
+            if full:
+                self._scanned_at = time.monotonic()
+            self._checked_at = time.monotonic()
+            self._last_sync = {
+                "scanned_columns": scanned,
+                "changed_tables": sorted(changed),
+                "ms": round((time.perf_counter() - started) * 1000, 3),
+            }
+            if scanned:
+                logger.info(f"Value index synced: {self.stats()}")
+            return self._last_sync
+
+    def maybe_refresh(self, schema_info: Dict):
+        """Build on first use; afterwards resync in the background every refresh_interval seconds."""
+        if self._lookup is None:
+            self.sync(schema_info)
+            return
+        if time.monotonic() - self._checked_at < self.refresh_interval or self._lock.locked():
+            return
+        self._checked_at = time.monotonic()
+        threading.Thread(target=self._sync_quietly, args=(schema_info,), daemon=True).start()
+
+    def _sync_quietly(self, schema_info: Dict):
+        try:
+            self.sync(schema_info)
+        except Exception as e:
+            logger.warning(f"Value index refresh failed: {e}")
+
+    def lookup(self, question: str, limit: int = VALUE_INDEX_MAX_MATCHES,
+               min_score: float = VALUE_INDEX_MIN_SCORE) -> List[Dict]:
+        """
+        Stored values mentioned in the question: exact matches of word
+        n-grams first, then prefix and fuzzy (trigram) matches for the
+        words not already matched. Values of one or two characters, like
+        section 'B', must appear verbatim beside a word naming their column.
+        """
+        lookup = self._lookup
+        if lookup is None or not lookup.keys:
+            return []
+        words = _WORD.findall(question)
+        lowered = [word.lower() for word in words]
+        spans = [(start, end) for size in range(min(_MAX_GRAM, len(words)), 0, -1)
+                 for start in range(len(words) - size + 1) for end in [start + size]]
+        best: Dict[Tuple[str, str, str], Dict] = {}
+        covered: Set[int] = set()
+
+        def add(key, kind, score, start, end):
+            for value, table, column in lookup.entries[key]:
+                if len(key) <= 2:
+                    if not re.search(rf'(?<!\w){re.escape(value)}(?!\w)', question):
+                        continue
+                    if not _name_words(column).intersection(lowered[max(0, start - 1):end + 1]):
+                        continue
+                match = (value, table, column)
+                if match not in best or best[match]['score'] < score:
+                    best[match] = {"table_name": table, "column_name": column, "value": value,
+                                   "match": kind, "score": round(score, 3),
+                                   "text": " ".join(words[start:end])}
+                covered.update(range(start, end))
+
+        for start, end in spans:
+            gram = lowered[start:end]
+            if all(word in _STOPWORDS for word in gram):
+                continue
+            key = " ".join(gram)
+            if key in lookup.entries:
+                add(key, 'exact', 1.0, start, end)
+        for start, end in spans:
+            gram = lowered[start:end]
+            key = " ".join(gram)
+            if covered.intersection(range(start, end)) or gram[0] in _STOPWORDS or gram[-1] in _STOPWORDS \
+                    or len(key) < 4:
+                continue
+            for candidate in lookup.prefixed(key):
+                add(candidate, 'prefix', 0.7 + 0.3 * len(key) / len(candidate), start, end)
+            for candidate, score in lookup.similar(key, min_score):
+                if candidate != key:
+                    add(candidate, 'fuzzy', score * 0.95, start, end)
+        matches = [match for match in best.values() if match['score'] >= min_score]
+        matches.sort(key=lambda match: (-match['score'], match['table_name'], match['column_name']))
+        return matches[:limit]
+
+    def stats(self) -> Dict:
+        lookup = self._lookup
+        return {
+            "columns": len(self._columns),
+            "skipped_columns": len(self._skipped),
+            "values": sum(len(values) for values in self._columns.values()),
+            "distinct_keys": len(lookup.keys) if lookup else 0,
+            "last_sync": self._last_sync,
+        }
+
+
+def format_values(matches: List[Dict]) -> str:
+    """Prompt lines giving each matched value as stored, e.g. STUDENT.CLASS = 'AI_ML'."""
+    lines = []
+    for match in matches:
+        value = match['value'].replace("'", "''")
+        lines.append(f"{match['table_name']}.{match['column_name']} = '{value}'")
+    return "\n".join(lines)
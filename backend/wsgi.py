@@ -0,0 +1,95 @@
+"""
+Production entry point. gunicorn imports this module once in the master
+(preload_app in gunicorn.conf.py), which warms the schema catalog, schema
+index, value index and materialized views before forking, so workers start
+with them already built and share their pages copy-on-write:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+import gc
+import os
+import time
+import logging
+import importlib
+
+started = time.perf_counter()
+from app import app, datasources, get_semantic_query_cache, query_cache  # noqa: E402
+from embeddings import get_embedder  # noqa: E402
+from index_advisor import get_workload_store  # noqa: E402
+from metrics import STARTUP, process_memory  # noqa: E402
+STARTUP["import"] = round(time.perf_counter() - started, 3)
+
+logger = logging.getLogger(__name__)
+
+PRELOAD = os.getenv('PRELOAD', 'true').lower() == 'true'
+# Datasources to warm before forking: comma-separated names, 'all', or empty for the default one
+PRELOAD_DATASOURCES = os.getenv('PRELOAD_DATASOURCES', '')
+# Also import the SQL agent's langchain modules, so workers share them instead of each importing them on first use
+PRELOAD_AGENT = os.getenv('PRELOAD_AGENT', 'true').lower() == 'true'
+
+AGENT_MODULES = [
+    'langchain_community.agent_toolkits.sql.base',
+    'langchain_community.agent_toolkits.sql.toolkit',
+    'langchain.agents.agent_types',
+    'langchain_groq',
+]
+
+
+def preload_names():
+    if PRELOAD_DATASOURCES == 'all':
+        return datasources.names()[:datasources.max_active]
+    names = [name.strip() for name in PRELOAD_DATASOURCES.split(',') if name.strip()]
+    return names or [datasources.default]
+
+
+def preload():
+    """Warm everything requests would otherwise build lazily, recording each phase in STARTUP."""
+    started = time.perf_counter()
+    for name in preload_names():
+        try:
+            timings = datasources.get(name).warm(agent=PRELOAD_AGENT)
+            logger.info(f"Preloaded datasource {name}: {timings}")
+        except Exception as e:
+            logger.error(f"Preloading datasource {name} failed: {e}")
+    get_semantic_query_cache()
+    STARTUP["datasources"] = round(time.perf_counter() - started, 3)
+    if PRELOAD_AGENT:
+        started = time.perf_counter()
+        for module in AGENT_MODULES:
+            try:
+                importlib.import_module(module)
+            except ImportError as e:
+                logger.warning(f"Could not preload {module}: {e}")
+        STARTUP["agent_imports"] = round(time.perf_counter() - started, 3)
+    logger.info(f"Preloaded in {sum(STARTUP.values()):.2f}s {STARTUP}, memory {process_memory()}")
+
+
+def before_fork():
+    """
+    Close the SQLite files of the embedding cache, query cache and workload
+    store (they are reopened on first use; a SQLite handle must not cross a
+    fork), then freeze the heap so the garbage collector in workers does not
+    write to, and so un-share, every object inherited from the master.
+    """
+    embedding_cache = getattr(get_embedder(), 'cache', None)
+    if embedding_cache is not None:
+        embedding_cache.close()
+    if query_cache is not None:
+        query_cache.close()
+    workload = get_workload_store()
+    if workload is not None:
+        workload.close()
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork():
+    """Give each worker its own database connections instead of the master's."""
+    for datasource in datasources.active():
+        datasource.pool_manager.after_fork()
+
+
+if PRELOAD:
+    preload()
+
+application = app
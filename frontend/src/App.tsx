@@ -109,7 +109,7 @@ function AppContent() {
     try {
       setError(null);
       setLoading(true);
-      const response = await apiService.processQuery(q);
+      const response = await apiService.processQueryStream(q, setQueryResponse);
       setQueryResponse(response);
     } catch (err) {
       setError(err instanceof Error ? err.message : 'An error occurred');
@@ -10,8 +10,15 @@ import {
   Tooltip,
   Typography,
 } from '@mui/material';
-import { Send as SendIcon, Delete as DeleteIcon, Download as DownloadIcon, History as HistoryIcon } from '@mui/icons-material';
+import {
+  Send as SendIcon,
+  Delete as DeleteIcon,
+  Download as DownloadIcon,
+  ExpandMore as ExpandMoreIcon,
+  History as HistoryIcon,
+} from '@mui/icons-material';
 import { QueryResponse } from '../types';
+import { apiService } from '../services/api';
 
 interface QueryFormProps {
   onSubmit: (query: string) => Promise<void>;
@@ -113,11 +120,37 @@ export const QueryForm: React.FC<QueryFormProps> = ({
 }) => {
   const [query, setLocalQuery] = useState(initialQuery);
   const [history, setHistory] = useState<{ query: string; response: QueryResponse | undefined }[]>([]);
+  // Rows fetched with "Load more" for the current response, and the cursor of the page after them
+  const [extraRows, setExtraRows] = useState<any[][]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [pageError, setPageError] = useState<string | null>(null);
 
   useEffect(() => {
     setLocalQuery(initialQuery);
   }, [initialQuery]);
 
+  useEffect(() => {
+    setExtraRows([]);
+    setNextCursor(response?.next_cursor ?? null);
+    setPageError(null);
+  }, [response]);
+
+  const handleLoadMore = async () => {
+    if (!response?.sql || !nextCursor) return;
+    setLoadingMore(true);
+    setPageError(null);
+    try {
+      const page = await apiService.getResultPage(response.sql, nextCursor);
+      setExtraRows((rows) => [...rows, ...page.rows]);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      setPageError(err instanceof Error ? err.message : 'Failed to load more rows');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     setLocalQuery(e.target.value);
     setQuery && setQuery(e.target.value);
@@ -197,18 +230,53 @@ export const QueryForm: React.FC<QueryFormProps> = ({
             {(() => {
               const parsed = parseResult(response.result);
               if (is2DArray(parsed)) {
+                const rows = [...parsed, ...extraRows];
                 return (
                   <>
-                    <ResultTable data={parsed} />
-                    <Button
-                      startIcon={<DownloadIcon />}
-                      sx={{ mt: 2 }}
-                      onClick={() => downloadCSV(parsed)}
-                      variant="outlined"
-                      color="primary"
-                    >
-                      Download CSV
-                    </Button>
+                    <ResultTable data={rows} />
+                    {pageError && (
+                      <Typography color="error" sx={{ mt: 1 }}>
+                        {pageError}
+                      </Typography>
+                    )}
+                    <Box sx={{ mt: 2, display: 'flex', gap: 1, alignItems: 'center' }}>
+                      {nextCursor && (
+                        <Button
+                          startIcon={loadingMore ? <CircularProgress size={16} /> : <ExpandMoreIcon />}
+                          onClick={handleLoadMore}
+                          disabled={loadingMore}
+                          variant="outlined"
+                          color="primary"
+                        >
+                          Load more
+                        </Button>
+                      )}
+                      {/* The server streams the whole result; without SQL only the rows shown can be saved */}
+                      {response.sql ? (
+                        <Button
+                          startIcon={<DownloadIcon />}
+                          href={apiService.exportUrl(response.sql)}
+                          variant="outlined"
+                          color="primary"
+                        >
+                          Download CSV
+                        </Button>
+                      ) : (
+                        <Button
+                          startIcon={<DownloadIcon />}
+                          onClick={() => downloadCSV(rows)}
+                          variant="outlined"
+                          color="primary"
+                        >
+                          Download CSV
+                        </Button>
+                      )}
+                      {response.truncated && !nextCursor && (
+                        <Typography variant="body2" sx={{ color: '#888' }}>
+                          Showing the first {rows.length} rows; the download has them all.
+                        </Typography>
+                      )}
+                    </Box>
                   </>
                 );
               }
@@ -1,5 +1,5 @@
 import axios from 'axios';
-import { QueryResponse, DatabaseSchema } from '../types';
+import { QueryResponse, DatabaseSchema, ResultPage } from '../types';
 
 const API_BASE_URL = process.env.REACT_APP_API_URL || 'http://localhost:5000';
 
@@ -10,6 +10,9 @@ const api = axios.create({
   },
 });
 
+// Last schema payload and its ETag, so unchanged schemas are not re-downloaded
+let schemaCache: { etag: string; schema: DatabaseSchema } | null = null;
+
 export const apiService = {
   health: async () => {
     const response = await api.get('/api/health');
@@ -17,7 +20,15 @@ export const apiService = {
   },
 
   getSchema: async (): Promise<DatabaseSchema> => {
-    const response = await api.get('/api/schema');
+    const response = await api.get('/api/schema', {
+      headers: schemaCache ? { 'If-None-Match': schemaCache.etag } : {},
+      validateStatus: (status) => (status >= 200 && status < 300) || status === 304,
+    });
+    if (response.status === 304 && schemaCache) {
+      return schemaCache.schema;
+    }
+    const etag = response.headers['etag'];
+    schemaCache = etag ? { etag, schema: response.data } : null;
     return response.data;
   },
 
@@ -25,4 +36,78 @@ export const apiService = {
     const response = await api.post('/api/query', { query });
     return response.data;
   },
+
+  getResultPage: async (sql: string, cursor?: string | null, pageSize?: number): Promise<ResultPage> => {
+    const response = await api.post('/api/results', { sql, cursor, page_size: pageSize });
+    return response.data;
+  },
+
+  exportUrl: (sql: string, format: 'csv' | 'arrow' = 'csv'): string =>
+    `${API_BASE_URL}/api/results/export?${new URLSearchParams({ sql, format }).toString()}`,
+
+  // Streams /api/query/stream, calling onUpdate with the response as it fills in
+  processQueryStream: async (
+    query: string,
+    onUpdate: (partial: QueryResponse) => void,
+  ): Promise<QueryResponse> => {
+    const response = await fetch(`${API_BASE_URL}/api/query/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json', Accept: 'text/event-stream' },
+      body: JSON.stringify({ query }),
+    });
+    if (!response.ok || !response.body) {
+      throw new Error(`Request failed with status ${response.status}`);
+    }
+
+    let current: QueryResponse = { sql: '', result: null, steps: [] };
+    const apply = (event: string, data: any) => {
+      switch (event) {
+        case 'cached':
+          current = { ...current, ...data };
+          break;
+        case 'schema':
+          current = { ...current, relevant_schema: data.relevant_schema };
+          break;
+        case 'step':
+          current = { ...current, steps: [...(current.steps || []), data] };
+          break;
+        case 'sql':
+          current = { ...current, ...data };
+          break;
+        case 'answer':
+          current = { ...current, ...data, result: Array.isArray(current.result) ? current.result : data.result };
+          break;
+        case 'columns':
+          current = { ...current, columns: data.columns, result: [] };
+          break;
+        case 'rows':
+          current = { ...current, result: [...(current.result || []), ...data.rows] };
+          break;
+        case 'error':
+          throw new Error(data.error);
+        default:
+          return;
+      }
+      onUpdate(current);
+    };
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    for (;;) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary = buffer.indexOf('\n\n');
+      while (boundary !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = /^event: (.*)$/m.exec(block)?.[1] || 'message';
+        const data = block.split('\n').filter((line) => line.startsWith('data: ')).map((line) => line.slice(6)).join('\n');
+        if (data) apply(event, JSON.parse(data));
+        boundary = buffer.indexOf('\n\n');
+      }
+    }
+    return current;
+  },
 }; 
\ No newline at end of file
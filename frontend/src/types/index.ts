@@ -2,6 +2,43 @@ export interface QueryResponse {
   sql: string;
   result: any;
   error?: string;
+  cached?: boolean;
+  cache_tier?: 'exact' | 'semantic';
+  matched_question?: string;
+  answer?: string;
+  columns?: string[];
+  column_types?: (string | null)[];
+  truncated?: boolean;
+  next_cursor?: string | null;
+  mode?: 'single_shot' | 'agent' | 'agent_fallback';
+  llm_calls?: number;
+  relevant_schema?: any[];
+  relevant_values?: ValueMatch[];
+  steps?: AgentStep[];
+}
+
+export interface ResultPage {
+  sql: string;
+  columns: string[];
+  column_types: (string | null)[];
+  rows: any[][];
+  truncated: boolean;
+  next_cursor: string | null;
+}
+
+export interface ValueMatch {
+  table_name: string;
+  column_name: string;
+  value: string;
+  match: 'exact' | 'prefix' | 'fuzzy';
+  score: number;
+  text: string;
+}
+
+export interface AgentStep {
+  tool: string;
+  tool_input: any;
+  log?: string;
 }
 
 export interface SchemaInfo {